@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+adaptive.py
+
+Adaptive retrieval depth from the dense score distribution.
+
+A fixed RETRIEVE_K / RERANK_K spends rerank work and prompt tokens on the
+long tail even when a handful of chunks clearly stand out. Instead:
+  * retrieval starts shallow and is widened only when the top scores are
+    flat (no clear winners, so relevant chunks may sit further down);
+  * the candidate list is cut where scores fall below a fraction of the top
+    score, or earlier at an elbow: a drop between consecutive scores much
+    larger than the average drop over the kept range.
+Scores are the inner products returned by FAISS, sorted best first.
+"""
+
+from typing import Sequence
+
+import numpy as np
+
+
+def is_flat(scores: Sequence[float], top_n: int, spread: float) -> bool:
+    """True when the best `top_n` scores lie within `spread` of each other."""
+    if not len(scores):
+        return False
+    s = np.asarray(scores, dtype="float32")
+    return float(s[0] - s[min(top_n, len(s)) - 1]) < spread
+
+
+def cut_depth(
+    scores: Sequence[float],
+    min_k: int,
+    rel_threshold: float,
+    elbow_ratio: float,
+) -> int:
+    """
+    Number of leading candidates to keep, at least `min_k` (or all if fewer).
+
+    Keeps scores >= rel_threshold * top score, then cuts at the largest
+    consecutive drop past `min_k` if it exceeds `elbow_ratio` times the mean
+    drop over the kept range.
+    """
+    s = np.asarray(scores, dtype="float32")
+    n = len(s)
+    if n <= min_k:
+        return n
+    depth = int(np.count_nonzero(s >= s[0] * rel_threshold)) if s[0] > 0 else n
+    depth = max(min_k, depth)
+    if depth > min_k:
+        # gaps[g] is the drop from s[min_k - 1 + g] to s[min_k + g]
+        gaps = s[min_k - 1:depth - 1] - s[min_k:depth]
+        mean_gap = (s[0] - s[depth - 1]) / (depth - 1)
+        g = int(np.argmax(gaps))
+        if mean_gap > 0 and gaps[g] > elbow_ratio * mean_gap:
+            depth = min_k + g
+    return depth
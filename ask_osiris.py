@@ -1,20 +1,35 @@
 import faiss
 import numpy as np
-import json
 import logging
+import os
+import random
 import re
-from functools import lru_cache
-from typing import List, Tuple
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Optional, Tuple
 
-from google.cloud import aiplatform
-from vertexai.language_models import TextEmbeddingModel
-from vertexai.preview.generative_models import GenerativeModel, GenerationConfig, Part
+from backends import get_embedder, get_generator
+from coalescer import MicroBatcher
+from rerank import TokenMatrix, hybrid_rerank_batch, tokenize
+from filters import POSTINGS_FILE, build_postings, infer_filters, load_postings, select_ids
+from tracing import RECALL_CHECKS, RECALL_SUM, Trace
+from compression import truncate_and_normalize
+from adaptive import cut_depth, is_flat
+from mmr import mmr_select, normalize_rows, redundancy
+from shards import SHARD_BY, ShardedIndex
+from shared_store import load_metadata, read_index
+from small_to_big import FINE_INDEX_FILE, FINE_MAP_FILE, FineIndex, turn_units
+from doc_index import DOC_INDEX_FILE, DOC_ROWS_FILE, DocIndex
+from scheduler import GenerationScheduler
 
 # --- CONFIGURATION ---
-PROJECT_ID         = "global-cloud-runtime"
-REGION             = "us-central1"
 FAISS_INDEX        = "faiss_index.index"
-METADATA_FILE      = "metadata.json"  # List of dicts: {speaker, timestamp, text}
+VECTORS_FILE       = os.getenv("VECTORS_FILE", "vectors.npy")  # row-aligned vectors, written by save_to_faiss.py
+METADATA_FILE      = "metadata.json"  # List of dicts: {speaker, speakers, timestamp, date, text, source_id, chunk_index}
+TOKENS_PREFIX      = os.getenv("TOKENS_PREFIX", "tokens")  # saved TokenMatrix, written by generate_metadata.py
 EMBED_MODEL        = "gemini-embedding-001"
 GEN_MODEL_MAIN     = "gemini-2.0-flash"
 GEN_MODEL_FALLBACK = "gemini-2.0-flash-lite"
@@ -23,97 +38,339 @@ GEN_MODEL_FALLBACK = "gemini-2.0-flash-lite"
 RETRIEVE_K         = 100   # initial dense retrieval size
 RERANK_K           = 20    # final top chunks after hybrid rerank
 SCORE_THRESHOLD    = 0.0   # keep all before rerank
+AUTO_FILTERS       = False # restrict to speakers named in the question when no filters are given
+
+# Adaptive depth: start at ADAPTIVE_INITIAL_K, widen to ADAPTIVE_MAX_K only when the
+# top RERANK_K scores are flat, then cut candidates at a score elbow / relative threshold
+ADAPTIVE_DEPTH         = os.getenv("ADAPTIVE_DEPTH", "False").lower() == "true"
+ADAPTIVE_INITIAL_K     = int(os.getenv("ADAPTIVE_INITIAL_K", "30"))
+ADAPTIVE_MAX_K         = int(os.getenv("ADAPTIVE_MAX_K", "200"))
+ADAPTIVE_MIN_K         = int(os.getenv("ADAPTIVE_MIN_K", "3"))
+ADAPTIVE_FLAT_SPREAD   = float(os.getenv("ADAPTIVE_FLAT_SPREAD", "0.02"))   # top-score spread counted as flat
+ADAPTIVE_REL_THRESHOLD = float(os.getenv("ADAPTIVE_REL_THRESHOLD", "0.9")) # keep scores >= this × top score
+ADAPTIVE_ELBOW_RATIO   = float(os.getenv("ADAPTIVE_ELBOW_RATIO", "3.0"))   # elbow = drop > this × mean drop
+
+# Coarse-to-fine: pick the DOC_TOP_K closest documents (doc_index.py centroids), then
+# fraction of queries is also searched flat to track the recall of the top RERANK_K reranked hits
+# fraction of queries is also searched flat to track the recall of the top RERANK_K hits
+HIERARCHICAL               = os.getenv("HIERARCHICAL", "False").lower() == "true"
+DOC_TOP_K                  = int(os.getenv("DOC_TOP_K", "3"))
+HIERARCHICAL_RECALL_SAMPLE = float(os.getenv("HIERARCHICAL_RECALL_SAMPLE", "0.05"))
+
+# Small-to-big: search the fine unit index (small_to_big.py) for SMALL_TO_BIG_UNITS_K
+# turns/sentences, rerank their parent chunks down to SMALL_TO_BIG_PARENTS and send each
+# with SMALL_TO_BIG_WINDOW neighbouring chunks either side (replaces RETRIEVE_K / RERANK_K)
+SMALL_TO_BIG          = os.getenv("SMALL_TO_BIG", "False").lower() == "true"
+SMALL_TO_BIG_UNITS_K  = int(os.getenv("SMALL_TO_BIG_UNITS_K", "50"))
+SMALL_TO_BIG_PARENTS  = int(os.getenv("SMALL_TO_BIG_PARENTS", "6"))
+SMALL_TO_BIG_WINDOW   = int(os.getenv("SMALL_TO_BIG_WINDOW", "0"))
+
+# MMR diversity: rerank MMR_POOL_K candidates, then pick RERANK_K of them
+USE_MMR            = os.getenv("USE_MMR", "False").lower() == "true"
+MMR_LAMBDA         = float(os.getenv("MMR_LAMBDA", "0.7"))  # 1.0 = pure relevance
+MMR_POOL_K         = int(os.getenv("MMR_POOL_K", "60"))
+
+# Query embedding batches (gemini-embedding-001 accepts one input per request,
+# so batches of 1 are sent concurrently; raise for multi-input models)
+EMBED_BATCH_SIZE   = int(os.getenv("EMBED_BATCH_SIZE", "1"))
+EMBED_CONCURRENCY  = int(os.getenv("EMBED_CONCURRENCY", "8"))
+EMBED_CACHE_SIZE   = 128   # recent query embeddings kept in memory
+
+# Micro-batching: concurrent single queries arriving within BATCH_WINDOW_MS are
+# embedded and (unfiltered) searched together, up to MAX_BATCH_SIZE per batch
+MICRO_BATCH        = os.getenv("MICRO_BATCH", "False").lower() == "true"
+BATCH_WINDOW_MS    = float(os.getenv("BATCH_WINDOW_MS", "5"))
+MAX_BATCH_SIZE     = int(os.getenv("MAX_BATCH_SIZE", "32"))
+FAISS_THREADS      = int(os.getenv("FAISS_THREADS", "0"))  # OpenMP threads per search, 0 = FAISS default
 
 # Generation parameters
 MAX_OUTPUT_TOKENS  = 3000  # up to 8192 supported
 TEMPERATURE        = 0.2   # deterministic
 TOP_K_SAMPLING     = 50    # for LLM generation sampling
 
+# Generation scheduling (scheduler.py): at most GEN_MAX_CONCURRENCY main-model generations
+# in flight, the rest queued fairly per user; low-priority (creative) requests arriving
+# while SHED_QUEUE_DEPTH are waiting, or any request queued over GEN_QUEUE_TIMEOUT_S, are
+# shed to GEN_MODEL_FALLBACK with at most SHED_MAX_OUTPUT_TOKENS; the fallback model
+# (shed requests and main-model failures alike) is capped at FALLBACK_MAX_CONCURRENCY
+GEN_SCHEDULER            = os.getenv("GEN_SCHEDULER", "False").lower() == "true"
+GEN_MAX_CONCURRENCY      = int(os.getenv("GEN_MAX_CONCURRENCY", "8"))
+FALLBACK_MAX_CONCURRENCY = int(os.getenv("FALLBACK_MAX_CONCURRENCY", "8"))  # 0 = no limit
+SHED_QUEUE_DEPTH         = int(os.getenv("SHED_QUEUE_DEPTH", "4"))        # 0 = never shed on depth
+GEN_QUEUE_TIMEOUT_S      = float(os.getenv("GEN_QUEUE_TIMEOUT_S", "30"))  # 0 = wait as long as it takes
+SHED_MAX_OUTPUT_TOKENS   = int(os.getenv("SHED_MAX_OUTPUT_TOKENS", "800"))
+
+# Retrieval-only lookups: "where was X said" questions get packed passages back
+# without generation; ROUTE_LOOKUPS sends questions is_lookup() matches there
+ROUTE_LOOKUPS      = os.getenv("ROUTE_LOOKUPS", "False").lower() == "true"
+LOOKUP_PASSAGES    = int(os.getenv("LOOKUP_PASSAGES", "5"))
+LOOKUP_RE          = re.compile(
+    r"^(where|when|who|which meeting|what meeting)\b.*\b(say|said|says|mention|mentioned|mentions|bring up|brought up|"
+    r"talk about|talked about|discuss|discussed|ask|asked)\b"
+    r"|^(find|search|locate|quote|show me where|show me when)\b"
+    r"|\b(exact words|verbatim|word for word)\b"
+)
+
+NO_MATCH_ANSWER    = "No transcript chunks match the requested filters."
+
 # --- Setup Logging ---
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 
-# --- Initialize Vertex AI ---
-aiplatform.init(project=PROJECT_ID, location=REGION)
-embed_model        = TextEmbeddingModel.from_pretrained(EMBED_MODEL)
-gen_model_main     = GenerativeModel(GEN_MODEL_MAIN)
-gen_model_fallback = GenerativeModel(GEN_MODEL_FALLBACK)
+# --- Initialize embedder & generators (Vertex AI unless OSIRIS_EMBEDDER / OSIRIS_GENERATOR say otherwise) ---
+embedder           = get_embedder(EMBED_MODEL)
+gen_model_main     = get_generator(GEN_MODEL_MAIN)
+gen_model_fallback = get_generator(GEN_MODEL_FALLBACK)
+scheduler          = GenerationScheduler(GEN_MAX_CONCURRENCY, SHED_QUEUE_DEPTH, GEN_QUEUE_TIMEOUT_S) if GEN_SCHEDULER else None
+fallback_slots     = threading.BoundedSemaphore(FALLBACK_MAX_CONCURRENCY) if GEN_SCHEDULER and FALLBACK_MAX_CONCURRENCY else None
+
+# --- Load FAISS index & metadata (memory-mapped, shared across worker processes) ---
+if FAISS_THREADS:
+    faiss.omp_set_num_threads(FAISS_THREADS)
+index = ShardedIndex() if SHARD_BY != "none" else read_index(FAISS_INDEX)  # shards: see shards.py
+metadata = load_metadata(METADATA_FILE)
+postings = load_postings(POSTINGS_FILE) or build_postings(metadata)
+if TokenMatrix.exists(TOKENS_PREFIX):
+    chunk_tokens = TokenMatrix.load(TOKENS_PREFIX)
+else:
+    chunk_tokens = TokenMatrix([m['text'] for m in metadata])
 
-# --- Load FAISS index & metadata ---
-index = faiss.read_index(FAISS_INDEX)
-with open(METADATA_FILE, 'r') as f:
-    metadata = json.load(f)
+doc_index = None
+if HIERARCHICAL:
+    if os.path.exists(DOC_INDEX_FILE) and os.path.exists(DOC_ROWS_FILE):
+        doc_index = DocIndex()
+    else:
+        logging.warning(f"HIERARCHICAL is set but '{DOC_INDEX_FILE}' is missing; run doc_index.py. Searching all chunks.")
+
+fine_index = None
+if SMALL_TO_BIG:
+    if os.path.exists(FINE_INDEX_FILE) and os.path.exists(FINE_MAP_FILE):
+        fine_index = FineIndex()
+    else:
+        logging.warning(f"SMALL_TO_BIG is set but '{FINE_INDEX_FILE}' is missing; run small_to_big.py. Using the chunk index.")
+
+# Candidate vectors for MMR and coarse-to-fine scoring: memory-mapped store if present,
+# else reconstructed from the index
+vector_store = np.load(VECTORS_FILE, mmap_mode='r') if os.path.exists(VECTORS_FILE) else None
+if doc_index is not None and vector_store is None:
+    logging.warning(f"'{VECTORS_FILE}' is missing; coarse-to-fine falls back to an ID-restricted index search.")
+if USE_MMR and vector_store is None:
+    if isinstance(index, ShardedIndex):
+        index.make_direct_map()
+    elif faiss.try_extract_index_ivf(index) is not None:
+        faiss.extract_index_ivf(index).make_direct_map()
+
+# --- Cache query embeddings (LRU; reports hits for tracing) ---
+_embed_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+_embed_cache_lock = threading.Lock()
+
+def embed_query_cached(query: str) -> Tuple[np.ndarray, bool]:
+    with _embed_cache_lock:
+        if query in _embed_cache:
+            _embed_cache.move_to_end(query)
+            return _embed_cache[query], True
+    if MICRO_BATCH:
+        q_vec = _embed_batcher.submit(query)
+    else:
+        # Match the index width (Matryoshka truncation); quantized indexes take float32 queries
+        emb = embedder.embed([query], index.d)[0]
+        q_vec = truncate_and_normalize(np.array([emb], dtype="float32"), index.d)
+    with _embed_cache_lock:
+        _embed_cache[query] = q_vec
+        if len(_embed_cache) > EMBED_CACHE_SIZE:
+            _embed_cache.popitem(last=False)
+    return q_vec, False
 
-# --- Cache query embeddings ---
-@lru_cache(maxsize=128)
 def embed_query(query: str) -> np.ndarray:
-    result = embed_model.get_embeddings([query])[0]
-    emb = result.values
-    q_vec = np.array([emb], dtype="float32")
-    faiss.normalize_L2(q_vec)
-    return q_vec
+    return embed_query_cached(query)[0]
+
+# --- Batched query embeddings (one API call per EMBED_BATCH_SIZE queries) ---
+# One long-lived pool: embed_queries runs for every micro-batch the coalescer dispatches
+_embed_pool = ThreadPoolExecutor(max_workers=EMBED_CONCURRENCY, thread_name_prefix="osiris-embed")
+
+def embed_queries(queries: List[str]) -> np.ndarray:
+    batches = [queries[i:i + EMBED_BATCH_SIZE] for i in range(0, len(queries), EMBED_BATCH_SIZE)]
+
+    def embed_batch(batch: List[str]) -> List[List[float]]:
+        return embedder.embed(batch, index.d)
+
+    if len(batches) == 1:
+        vectors = embed_batch(batches[0])  # a single API call needs no pool hop
+    else:
+        vectors = [v for batch in _embed_pool.map(embed_batch, batches) for v in batch]
+    q_mat = np.array(vectors, dtype="float32").reshape(len(queries), -1)
+    return truncate_and_normalize(q_mat, index.d)
+
+# --- Dense search, optionally restricted to a subset of rows ---
+def search_batch(q_mat: np.ndarray, k: int, ids: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    if isinstance(index, ShardedIndex):
+        # Parallel fan-out over the shards holding eligible rows, merged to a global top-k
+        return index.search(q_mat, k, ids)
+    if ids is None:
+        return index.search(q_mat, k)
+    sel = faiss.IDSelectorBatch(ids)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        params = faiss.SearchParametersIVF(sel=sel, nprobe=ivf.nprobe)
+    else:
+        params = faiss.SearchParameters(sel=sel)
+    return index.search(q_mat, min(k, len(ids)), params=params)
+
+# --- Micro-batching of concurrent single-query embeds and searches ---
+def _embed_many(queries: List[str]) -> List[np.ndarray]:
+    unique = list(dict.fromkeys(queries))
+    q_mat = embed_queries(unique)
+    rows = {q: q_mat[i:i + 1] for i, q in enumerate(unique)}
+    return [rows[q] for q in queries]
+
+def _search_many(items: List[Tuple[np.ndarray, int]]) -> List[Tuple[np.ndarray, np.ndarray]]:
+    D, I = search_batch(np.vstack([q_vec for q_vec, _ in items]), items[0][1])
+    return [(D[i:i + 1], I[i:i + 1]) for i in range(len(items))]
+
+_embed_batcher  = MicroBatcher(_embed_many, BATCH_WINDOW_MS / 1000, MAX_BATCH_SIZE, name="embed-batcher")
+_search_batcher = MicroBatcher(_search_many, BATCH_WINDOW_MS / 1000, MAX_BATCH_SIZE, key=lambda item: item[1], name="search-batcher")
+
+def search_index(q_vec: np.ndarray, k: int, ids: Optional[np.ndarray] = None) -> Tuple[List[float], List[int]]:
+    if MICRO_BATCH and ids is None:
+        D, I = _search_batcher.submit((q_vec, k))  # filtered searches have per-query selectors
+    else:
+        D, I = search_batch(q_vec, k, ids)
+    # FAISS pads with -1 when fewer than k rows are eligible
+    hits = [(s, i) for s, i in zip(D[0].tolist(), I[0].tolist()) if i >= 0]
+    return [s for s, _ in hits], [i for _, i in hits]
+
+def search_rows(q_vec: np.ndarray, k: int, rows: np.ndarray) -> Tuple[List[float], List[int]]:
+    """
+    Exact top-k over a small candidate set, scored from the row-aligned vector
+    store; reads only those rows, whatever the index type or size.
+    """
+    rows = np.asarray(rows, dtype="int64")
+    scores = np.asarray(vector_store[rows], dtype="float32") @ q_vec[0]
+    top = np.argpartition(-scores, k - 1)[:k] if k < len(rows) else np.arange(len(rows))
+    top = top[np.argsort(-scores[top], kind="stable")]
+    return scores[top].tolist(), rows[top].tolist()
+
+def adaptive_search(
+    q_vec: np.ndarray, ids: Optional[np.ndarray] = None, search=search_index
+) -> Tuple[List[float], List[int], dict]:
+    """Dense search with score-driven depth; returns the kept candidates and the chosen depth."""
+    scores, indices = search(q_vec, ADAPTIVE_INITIAL_K, ids)
+    # Widening only helps if the shallow search was not already exhaustive
+    widened = len(scores) == ADAPTIVE_INITIAL_K and is_flat(scores, RERANK_K, ADAPTIVE_FLAT_SPREAD)
+    if widened:
+        scores, indices = search(q_vec, ADAPTIVE_MAX_K, ids)
+    keep = cut_depth(scores, ADAPTIVE_MIN_K, ADAPTIVE_REL_THRESHOLD, ADAPTIVE_ELBOW_RATIO)
+    depth = {"retrieved": len(scores), "widened": widened, "kept": keep}
+    return scores[:keep], indices[:keep], depth
+
+# --- Coarse-to-fine: documents first, then their chunks ---
+def select_documents(q_vec: np.ndarray, ids: Optional[np.ndarray], trace: Trace) -> np.ndarray:
+    """Rows of the DOC_TOP_K closest documents (within `ids`), recorded on the trace."""
+    doc_scores, docs, rows = doc_index.search(q_vec, DOC_TOP_K, ids)
+    logging.info(f"Coarse-to-fine: {len(docs)} documents, {len(rows)} of {index.ntotal} chunks to search")
+    trace.set(documents={
+        "source_ids": [str(doc_index.source_ids[d]) for d in docs],
+        "scores": [round(s, 4) for s in doc_scores],
+        "candidates": int(len(rows)),
+    })
+    return rows
+
+def track_recall(
+    question: str,
+    q_vec: np.ndarray,
+    scores: List[float],
+    indices: List[int],
+    ids: Optional[np.ndarray],
+    trace: Trace
+):
+    """
+    Share of the flat search's top rows that the document-first search also
+    ranks top, both cut by the same hybrid rerank (RERANK_K rows, or the
+    SMALL_TO_BIG_PARENTS parent rows of the fine index under small-to-big).
+    """
+    if fine_index is not None:
+        k = SMALL_TO_BIG_PARENTS
+        flat_scores, flat_indices, _ = fine_index.search_parents(q_vec, SMALL_TO_BIG_UNITS_K, ids)
+    else:
+        k = RERANK_K
+        if ADAPTIVE_DEPTH:
+            flat_scores, flat_indices, _ = adaptive_search(q_vec, ids)
+        else:
+            flat_scores, flat_indices = search_index(q_vec, RETRIEVE_K, ids)
+    if not flat_indices:
+        return
+    flat = {i for _, i in hybrid_rerank(question, flat_scores, flat_indices, k)}
+    top = {i for _, i in hybrid_rerank(question, scores, indices, k)} if indices else set()
+    recall = len(flat & top) / len(flat)
+    RECALL_CHECKS.inc()
+    RECALL_SUM.inc(recall)
+    trace.record["documents"]["recall"] = round(recall, 4)
+    logging.info(f"Coarse-to-fine recall@{len(flat)} vs flat search: {recall:.3f}")
 
 # --- Hybrid rerank: combine cosine + keyword match ---
 def hybrid_rerank(
     query: str,
     dense_scores: List[float],
     dense_indices: List[int],
-    chunks: List[str]
+    top_k: int = RERANK_K
 ) -> List[Tuple[float,int]]:
-    # compute keyword overlap score
-    q_tokens = set(re.findall(r"\w+", query.lower()))
-    hybrid = []
-    for score, idx in zip(dense_scores, dense_indices):
-        text = chunks[idx].lower()
-        words = re.findall(r"\w+", text)
-        overlap = len(q_tokens.intersection(words)) / (len(q_tokens)+1)
-        combined = 0.8 * score + 0.2 * overlap
-        hybrid.append((combined, idx))
-    # sort and pick top RERANK_K
-    hybrid.sort(key=lambda x: x[0], reverse=True)
-    return hybrid[:RERANK_K]
+    # vectorized over the chunk token matrix; see rerank.py
+    return hybrid_rerank_batch(
+        [query], np.array([dense_scores], dtype="float32"), np.array([dense_indices], dtype="int64"),
+        chunk_tokens, top_k
+    )[0]
 
-# --- RAG Query & Generate ---
-def answer_question(
-    conversation: list,
-    use_stream: bool = False,
-    temperature: float = None  # Allow override
-) -> str:
-    # Extract the latest question
-    if isinstance(conversation, str):
-        # Backward compatibility - if just a string is passed
-        latest_question = conversation
-        chat_history = ""
+# --- MMR: diverse RERANK_K out of a larger reranked pool ---
+def candidate_vectors(ids: List[int]) -> np.ndarray:
+    if vector_store is not None:
+        vecs = vector_store[np.asarray(ids)]
     else:
-        # Build conversation history for context
-        chat_history = ""
-        for msg in conversation[:-1]:  # Exclude the latest user question
-            role = "User" if msg["role"] == "user" else "Osiris"
-            chat_history += f"{role}: {msg['content']}\n"
-        
-        # Get the latest question
-        latest_question = conversation[-1]["content"] if conversation else ""
-    
-    # 1. Embed query
-    q_vec = embed_query(latest_question)
+        vecs = index.reconstruct_batch(np.asarray(ids, dtype="int64"))
+    return normalize_rows(vecs)
 
-    # 2. Initial dense retrieval
-    D, I = index.search(q_vec, RETRIEVE_K)
-    scores = D[0].tolist()
-    indices = I[0].tolist()
-    logging.info(f"Dense retrieval: min={min(scores):.3f}, avg={sum(scores)/len(scores):.3f}, max={max(scores):.3f}")
+def diversify(pool: List[Tuple[float,int]], trace: Optional[Trace] = None) -> List[Tuple[float,int]]:
+    if len(pool) <= RERANK_K:
+        return pool
+    vecs = candidate_vectors([idx for _, idx in pool])
+    picks = mmr_select(np.array([score for score, _ in pool]), vecs, RERANK_K, MMR_LAMBDA)
+    before, after = redundancy(vecs[:RERANK_K]), redundancy(vecs[picks])
+    logging.info(f"MMR (lambda={MMR_LAMBDA}): redundancy {before:.3f} → {after:.3f} over top {RERANK_K}")
+    if trace is not None:
+        trace.set(mmr={"lambda": MMR_LAMBDA, "redundancy_before": round(before, 4), "redundancy_after": round(after, 4)})
+    return [pool[p] for p in picks]
+
+# --- Conversation → (latest question, chat history) ---
+def split_conversation(conversation) -> Tuple[str, str]:
+    if isinstance(conversation, str):
+        # Backward compatibility - if just a string is passed
+        return conversation, ""
+    # Build conversation history for context
+    chat_history = ""
+    for msg in conversation[:-1]:  # Exclude the latest user question
+        role = "User" if msg["role"] == "user" else "Osiris"
+        chat_history += f"{role}: {msg['content']}\n"
+    # Get the latest question
+    latest_question = conversation[-1]["content"] if conversation else ""
+    return latest_question, chat_history
 
-    # 3. Hybrid rerank
-    reranked = hybrid_rerank(latest_question, scores, indices, [m['text'] for m in metadata])
-    logging.info(f"Reranked and picked top {RERANK_K} chunks")
+# --- Resolve filters to eligible row IDs ---
+def resolve_filters(question: str, filters: Optional[dict]) -> Tuple[Optional[dict], Optional[np.ndarray]]:
+    if filters is None and AUTO_FILTERS:
+        filters = infer_filters(question, postings)
+    ids = select_ids(postings, filters)
+    if ids is not None:
+        logging.info(f"Filters {filters} matched {len(ids)} of {index.ntotal} chunks")
+    return filters, ids
 
-    # 4. Build context
+# --- Build context from reranked chunks ---
+def build_context(reranked: List[Tuple[float,int]]) -> str:
     context_lines = []
     for score, idx in reranked:
         rec = metadata[idx]
         context_lines.append(f"[{rec['timestamp']}] {rec['speaker']}: {rec['text']} (score={score:.3f})")
-    context_text = "\n\n---\n\n".join(context_lines)
+    return "\n\n---\n\n".join(context_lines)
 
-    # 5. Construct prompts with conversation history
+# --- Construct prompts with conversation history ---
+def build_prompt(latest_question: str, chat_history: str, context_text: str) -> str:
     system_prompt = (
         "You are Osiris, an internal AI knowledge assistant for product analytics.\n"
         "Use the context to answer in 2–4 bullet points, paraphrasing key statements and citing speaker & timestamp.\n"
@@ -134,53 +391,406 @@ def answer_question(
             f"Context:\n{context_text}"
         )
     
-    full_prompt = system_prompt + "\n\n" + user_prompt
+    return system_prompt + "\n\n" + user_prompt
 
-    # Detect if the latest question is creative
+# --- Generation config (creative questions run warmer) ---
+def is_creative(question: str) -> bool:
     creative_keywords = ["tweet", "twitter", "blog", "post", "creative", "story", "write", "linkedin"]
-    latest_question_lower = latest_question.lower()
-    is_creative = any(word in latest_question_lower for word in creative_keywords)
+    question_lower = question.lower()
+    return any(word in question_lower for word in creative_keywords)
+
+def is_lookup(question: str) -> bool:
+    """Questions asking where / when / by whom something was said, answered by passages alone."""
+    return not is_creative(question) and bool(LOOKUP_RE.search(question.lower().strip()))
 
-    # Set temperature
+def build_generation_config(question: str, temperature: float = None) -> dict:
     temp = temperature
     if temp is None:
-        temp = 0.6 if is_creative else TEMPERATURE
+        temp = 0.6 if is_creative(question) else TEMPERATURE
+    return {
+        "temperature": temp,
+        "max_output_tokens": MAX_OUTPUT_TOKENS,
+        "top_k": TOP_K_SAMPLING,
+    }
 
-    gen_config = GenerationConfig(
-        temperature=temp,
-        max_output_tokens=MAX_OUTPUT_TOKENS,
-        top_k=TOP_K_SAMPLING
-    )
+# --- Generation scheduling (see scheduler.py) ---
+def request_priority(question: str, priority: str = "normal") -> str:
+    """Creative questions are low priority whatever the caller asked for."""
+    return "low" if is_creative(question) else priority
 
-    # 7. Generate response
+@contextmanager
+def generation_slot(user: Optional[str], priority: str, trace: Trace) -> Iterator[Optional[str]]:
+    """Hold a scheduler slot around one generation; yields why it was shed, or None."""
+    if scheduler is None:
+        yield None
+        return
+    with scheduler.slot(user, priority) as admission:
+        trace.add_timing("generation_queue", admission.queued_s)
+        trace.add_timing("ttft", admission.queued_s)  # the first token waited for the slot too
+        trace.set(priority=priority, shed=admission.shed)
+        yield admission.shed
+
+def generate_fallback(full_prompt: str, gen_config: dict, trace: Trace) -> Tuple[str, dict]:
+    """
+    gen_model_fallback.generate within FALLBACK_MAX_CONCURRENCY, so a burst of
+    shed requests or main-model failures cannot cascade onto the fallback's quota.
+    """
+    if fallback_slots is None:
+        return gen_model_fallback.generate(full_prompt, gen_config)
+    start = time.perf_counter()
+    if not fallback_slots.acquire(timeout=GEN_QUEUE_TIMEOUT_S or None):
+        raise RuntimeError(f"{gen_model_fallback.name}: no free slot within {GEN_QUEUE_TIMEOUT_S:g}s")
+    trace.add_timing("fallback_queue", time.perf_counter() - start)
     try:
-        if use_stream:
-            answer = ''
-            for chunk in gen_model_main.generate_content(
-                [Part.from_text(full_prompt)],
-                generation_config=gen_config,
-                stream=True
-            ):
-                print(chunk.text, end='', flush=True)
-                answer += chunk.text
-            print()
+        return gen_model_fallback.generate(full_prompt, gen_config)
+    finally:
+        fallback_slots.release()
+
+def generate_shed(full_prompt: str, gen_config: dict, trace: Trace) -> str:
+    """Answer a shed request with the cheaper fallback model and a smaller output budget."""
+    config = dict(gen_config, max_output_tokens=min(gen_config["max_output_tokens"], SHED_MAX_OUTPUT_TOKENS))
+    with trace.stage("generation"):
+        answer, tokens = generate_fallback(full_prompt, config, trace)
+    trace.add_timing("ttft", trace.timings["generation"])
+    trace.set(model=gen_model_fallback.name, fallback=False, tokens=tokens)
+    return answer
+
+# --- Generate with fallback model ---
+def generate_stream(
+    full_prompt: str,
+    gen_config: dict,
+    trace: Optional[Trace] = None,
+    user: Optional[str] = None,
+    priority: str = "normal"
+) -> Iterator[str]:
+    trace = trace or Trace(full_prompt)
+    # The slot is held until the last token has been yielded
+    with generation_slot(user, priority, trace) as shed:
+        if shed:
+            yield generate_shed(full_prompt, gen_config, trace)
+            return
+        start = time.perf_counter()
+        started = False
+        tokens = {}
+        try:
+            for text, usage in gen_model_main.stream(full_prompt, gen_config):
+                if not started:
+                    trace.add_timing("ttft", time.perf_counter() - start)
+                    started = True
+                tokens = usage or tokens
+                yield text
+            trace.set(model=gen_model_main.name, fallback=False, tokens=tokens)
+        except Exception as e:
+            if started:
+                raise  # a fallback answer can't be spliced onto a partial one
+            logging.warning(f"Main model failed: {e}, using fallback.")
+            answer, tokens = generate_fallback(full_prompt, gen_config, trace)
+            trace.add_timing("ttft", time.perf_counter() - start)
+            trace.set(model=gen_model_fallback.name, fallback=True, tokens=tokens)
+            yield answer
+        finally:
+            trace.add_timing("generation", time.perf_counter() - start)
+
+def generate(
+    full_prompt: str,
+    gen_config: dict,
+    use_stream: bool = False,
+    trace: Optional[Trace] = None,
+    user: Optional[str] = None,
+    priority: str = "normal"
+) -> str:
+    trace = trace or Trace(full_prompt)
+    if use_stream:
+        answer = ''
+        for text in generate_stream(full_prompt, gen_config, trace, user, priority):
+            print(text, end='', flush=True)
+            answer += text
+        print()
+        return answer
+
+    with generation_slot(user, priority, trace) as shed:
+        if shed:
+            return generate_shed(full_prompt, gen_config, trace)
+        with trace.stage("generation"):
+            try:
+                answer, tokens = gen_model_main.generate(full_prompt, gen_config)
+                trace.set(model=gen_model_main.name, fallback=False, tokens=tokens)
+            except Exception as e:
+                logging.warning(f"Main model failed: {e}, using fallback.")
+                answer, tokens = generate_fallback(full_prompt, gen_config, trace)
+                trace.set(model=gen_model_fallback.name, fallback=True, tokens=tokens)
+    # Without streaming the first token arrives with the whole answer
+    trace.add_timing("ttft", trace.timings["generation"])
+
+    return answer
+
+# --- Retrieve: embed, filtered dense search, hybrid rerank ---
+def retrieve(
+    question: str,
+    filters: dict = None,
+    trace: Optional[Trace] = None
+) -> List[Tuple[float,int]]:
+    trace = trace or Trace(question)
+
+    # 1. Embed query
+    with trace.stage("embed"):
+        q_vec, cache_hit = embed_query_cached(question)
+    trace.set(cache={"embedding": cache_hit})
+
+    # 2. Initial dense retrieval, restricted to rows matching the filters
+    filters, ids = resolve_filters(question, filters)
+    trace.set(filters=filters)
+    if ids is not None and len(ids) == 0:
+        return []
+    all_ids, search = ids, search_index
+    if doc_index is not None:
+        with trace.stage("doc_search"):
+            ids = select_documents(q_vec, ids, trace)
+        if len(ids) == 0:
+            return []
+        if vector_store is not None:
+            search = search_rows  # the chosen documents' rows only, not a filtered pass over the index
+    with trace.stage("search"):
+        if fine_index is not None:
+            # Fine-grained search; each parent chunk scored by its best unit
+            scores, indices, units = fine_index.search_parents(q_vec, SMALL_TO_BIG_UNITS_K, ids)
+        elif ADAPTIVE_DEPTH:
+            scores, indices, depth = adaptive_search(q_vec, ids, search)
+            logging.info(f"Adaptive depth: retrieved {depth['retrieved']} (widened={depth['widened']}), kept {depth['kept']}")
+            trace.set(depth=depth)
         else:
-            resp = gen_model_main.generate_content(
-                [Part.from_text(full_prompt)],
-                generation_config=gen_config
-            )
-            answer = resp.text
-    except Exception as e:
-        logging.warning(f"Main model failed: {e}, using fallback.")
-        resp = gen_model_fallback.generate_content(
-            [Part.from_text(full_prompt)],
-            generation_config=gen_config
-        )
-        answer = resp.text
+            scores, indices = search(q_vec, RETRIEVE_K, ids)
+    if doc_index is not None and random.random() < HIERARCHICAL_RECALL_SAMPLE:
+        with trace.stage("recall_check"):
+            track_recall(question, q_vec, scores, indices, all_ids, trace)
+    if fine_index is not None:
+        return expand_small_to_big(question, scores, indices, units, ids, trace)
+    if not scores:
+        return []
+    logging.info(f"Dense retrieval: min={min(scores):.3f}, avg={sum(scores)/len(scores):.3f}, max={max(scores):.3f}")
+
+    # 3. Hybrid rerank (+ MMR diversity over a wider pool)
+    with trace.stage("rerank"):
+        reranked = hybrid_rerank(question, scores, indices, MMR_POOL_K if USE_MMR else RERANK_K)
+    if USE_MMR:
+        with trace.stage("mmr"):
+            reranked = diversify(reranked, trace)
+    logging.info(f"Reranked and picked top {len(reranked)} chunks")
+    trace.set_results(reranked, metadata)
+    return reranked
+
+def expand_small_to_big(
+    question: str,
+    scores: List[float],
+    indices: List[int],
+    units: int,
+    ids: Optional[np.ndarray],
+    trace: Trace
+) -> List[Tuple[float,int]]:
+    if not scores:
+        return []
+    logging.info(f"Small-to-big: {units} units hit {len(indices)} parent chunks (max={max(scores):.3f})")
+
+    # 3. Hybrid rerank of the parents, then expand to neighbouring-chunk windows
+    with trace.stage("rerank"):
+        parents = hybrid_rerank(question, scores, indices, SMALL_TO_BIG_PARENTS)
+        reranked = fine_index.expand(parents, SMALL_TO_BIG_WINDOW, ids)
+    logging.info(f"Expanded top {len(parents)} parents to {len(reranked)} chunks (window={SMALL_TO_BIG_WINDOW})")
+    trace.set(small_to_big={"units": units, "parents": len(indices), "kept": len(parents), "chunks": len(reranked)})
+    trace.set_results(reranked, metadata)
+    return reranked
+
+def passage(score: float, idx: int) -> dict:
+    rec = metadata[idx]
+    return {
+        "score": score,
+        "index": idx,
+        "speaker": rec['speaker'],
+        "timestamp": rec['timestamp'],
+        "date": rec.get('date', ''),
+        "source_id": rec.get('source_id'),
+        "chunk_index": rec.get('chunk_index'),
+        "text": rec['text'],
+    }
+
+# --- Retrieval-only fast path: packed passages, no generation ---
+_token_idf: Optional[dict] = None
+
+def token_idf() -> dict:
+    """Inverse document frequency of every chunk token, computed on first use."""
+    global _token_idf
+    if _token_idf is None:
+        df = np.asarray(chunk_tokens.matrix.sum(axis=0)).ravel()
+        idf = np.log((1 + len(chunk_tokens)) / (1 + df))
+        _token_idf = {tok: float(idf[col]) for tok, col in chunk_tokens.vocab.items()}
+    return _token_idf
 
+def best_snippet(question: str, rec: dict) -> dict:
+    """The speaker turn / sentence window of a chunk sharing the rarest words with the question."""
+    idf = token_idf()
+    q_tokens = tokenize(question)
+    units = turn_units(rec['text'], rec.get('speakers') or []) or [(rec['text'], "", "")]
+    text, speaker, stamp = max(units, key=lambda u: sum(idf.get(t, 0.0) for t in q_tokens & tokenize(u[0])))
+    return {"text": text, "speaker": speaker or rec['speaker'], "timestamp": stamp or rec['timestamp']}
+
+def pack_passages(question: str, reranked: List[Tuple[float,int]], limit: int = LOOKUP_PASSAGES) -> List[dict]:
+    """
+    Best-first passages, each with the turn that best matches the question as
+    its `snippet`; hits repeating a snippet (chunk overlap) fold into one.
+    """
+    packed, by_snippet = [], {}
+    for score, idx in reranked:
+        snippet = best_snippet(question, metadata[idx])
+        key = (metadata[idx].get('source_id'), snippet['text'])
+        if key in by_snippet:
+            by_snippet[key]['chunk_indexes'].append(metadata[idx].get('chunk_index'))
+            continue
+        if len(packed) == limit:
+            continue
+        p = passage(score, idx)
+        p.update(snippet=snippet, chunk_indexes=[p['chunk_index']], locations=metadata[idx].get('locations') or [])
+        by_snippet[key] = p
+        packed.append(p)
+    return packed
+
+def lookup(
+    question: str,
+    filters: dict = None,
+    trace: Optional[Trace] = None,
+    limit: int = LOOKUP_PASSAGES
+) -> List[dict]:
+    trace = trace or Trace(question, mode="retrieve")
+    reranked = retrieve(question, filters, trace)
+    with trace.stage("pack"):
+        return pack_passages(question, reranked, limit)
+
+def format_passages(passages: List[dict]) -> str:
+    if not passages:
+        return NO_MATCH_ANSWER
+    lines = []
+    for p in passages:
+        s = p['snippet']
+        where = " · ".join(str(x) for x in (p.get('date'), p.get('source_id')) if x)
+        lines.append(f"- [{s['timestamp']}] {s['speaker']}: \"{s['text']}\" ({where}, score={p['score']:.3f})")
+    return "\n".join(lines)
+
+def route_lookup(
+    conversation,
+    filters: dict,
+    retrieve_only: Optional[bool],
+    trace: Trace
+) -> Optional[str]:
+    """Formatted passages when the request goes to the retrieval-only path, else None."""
+    question = split_conversation(conversation)[0]
+    if retrieve_only is None:
+        retrieve_only = ROUTE_LOOKUPS and is_lookup(question)
+    if not retrieve_only:
+        return None
+    trace.set(route="lookup")
+    return format_passages(lookup(question, filters, trace))
+
+# --- Prompt + generation config for a conversation (None if nothing matched) ---
+def prepare_answer(
+    conversation: list,
+    temperature: float = None,
+    filters: dict = None,
+    trace: Optional[Trace] = None
+) -> Optional[Tuple[str, dict]]:
+    latest_question, chat_history = split_conversation(conversation)
+    trace = trace or Trace(latest_question)
+
+    # 1-3. Retrieve and rerank
+    reranked = retrieve(latest_question, filters, trace)
+    if not reranked:
+        return None
+
+    with trace.stage("prompt_build"):
+        # 4. Build context
+        context_text = build_context(reranked)
+
+        # 5. Construct prompts with conversation history
+        full_prompt = build_prompt(latest_question, chat_history, context_text)
+
+        # 6. Set temperature
+        gen_config = build_generation_config(latest_question, temperature)
+    return full_prompt, gen_config
+
+# --- RAG Query & Generate ---
+def answer_question(
+    conversation: list,
+    use_stream: bool = False,
+    temperature: float = None,  # Allow override
+    filters: dict = None,       # e.g. {"speaker": "Mack Myers", "date_from": "2025-06-01"}
+    trace: Trace = None,        # pass one in to read timings/model afterwards
+    retrieve_only: bool = None, # True: passages only, no generation; None: ROUTE_LOOKUPS heuristic
+    user: str = None,           # fairness key for the generation scheduler
+    priority: str = "normal"    # "normal" | "low"; creative questions are always low
+) -> str:
+    trace = trace or Trace(split_conversation(conversation)[0])
+    try:
+        routed = route_lookup(conversation, filters, retrieve_only, trace)
+        if routed is not None:
+            trace.finish()
+            return routed
+        prepared = prepare_answer(conversation, temperature, filters, trace)
+        if prepared is None:
+            trace.finish("no_match")
+            return NO_MATCH_ANSWER
+
+        # 7. Generate response
+        priority = request_priority(split_conversation(conversation)[0], priority)
+        answer = generate(*prepared, use_stream=use_stream, trace=trace, user=user, priority=priority)
+    except Exception as e:
+        trace.finish("error", str(e))
+        raise
+    trace.finish()
     return answer
 
+def stream_answer(
+    conversation: list,
+    temperature: float = None,
+    filters: dict = None,
+    trace: Trace = None,
+    retrieve_only: bool = None,
+    user: str = None,
+    priority: str = "normal"
+) -> Iterator[str]:
+    trace = trace or Trace(split_conversation(conversation)[0], stream=True)
+    status, error = "ok", None
+    try:
+        routed = route_lookup(conversation, filters, retrieve_only, trace)
+        if routed is not None:
+            yield routed
+            return
+        prepared = prepare_answer(conversation, temperature, filters, trace)
+        if prepared is None:
+            status = "no_match"
+            yield NO_MATCH_ANSWER
+            return
+        priority = request_priority(split_conversation(conversation)[0], priority)
+        yield from generate_stream(*prepared, trace=trace, user=user, priority=priority)
+    except GeneratorExit:
+        status = "cancelled"  # client went away mid-stream
+        raise
+    except Exception as e:
+        status, error = "error", str(e)
+        raise
+    finally:
+        trace.finish(status, error)
+
 # --- CLI Entry Point ---
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Ask Osiris a question")
+    parser.add_argument("--speaker", action="append", help="only search chunks where this speaker talks")
+    parser.add_argument("--date", action="append", help="only search meetings on this date (YYYY-MM-DD)")
+    parser.add_argument("--source-id", action="append", help="only search this document")
+    parser.add_argument("--retrieve-only", action="store_true", help="print ranked passages without generating an answer")
+    parser.add_argument("--route", action="store_true", help="answer lookup-style questions with passages only")
+    args = parser.parse_args()
+    cli_filters = {k: v for k, v in (("speaker", args.speaker), ("date", args.date), ("source_id", args.source_id)) if v}
+
     question = input("Enter your question: ")
-    print("\n=== Answer ===\n", answer_question(question, use_stream=False))
+    # None leaves the choice to ROUTE_LOOKUPS
+    retrieve_only = True if args.retrieve_only else (is_lookup(question) if args.route else None)
+    print("\n=== Answer ===\n", answer_question(question, use_stream=False, filters=cli_filters or None, retrieve_only=retrieve_only))
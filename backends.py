@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""
+backends.py
+
+Embedder, generator and document-source interfaces, selected by environment.
+
+    OSIRIS_EMBEDDER  = vertex (default) | hashing
+    OSIRIS_GENERATOR = vertex (default) | fake
+    OSIRIS_SOURCE    = drive  (default) | directory
+
+The Vertex AI and Google Drive backends are the production defaults; their
+client libraries are imported only when they are selected. The local
+backends need no credentials or network, so ingestion, serving and the
+benchmarks can run offline:
+  * HashingEmbedder — signed feature hashing of word unigrams and bigrams
+    into a fixed-width, L2-normalized vector (deterministic across runs),
+    optionally with simulated call latency and failures;
+  * FakeGenerator   — builds an answer from the prompt's context lines and
+    streams it with simulated time-to-first-token and per-token latency,
+    optionally failing a fraction of calls, or every call beyond a
+    simulated concurrency quota, to exercise the fallback path;
+  * DirectorySource — .txt / .md files under a directory, one document each.
+
+Generation configs are plain dicts: {temperature, max_output_tokens, top_k}.
+Usage dicts are {prompt, output} token counts.
+"""
+
+import hashlib
+import math
+import os
+import random
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from io import BytesIO
+from pathlib import Path
+from typing import Iterator, List, Tuple
+
+import numpy as np
+
+# --- CONFIGURATION ---
+OSIRIS_EMBEDDER  = os.getenv("OSIRIS_EMBEDDER", "vertex").lower()
+OSIRIS_GENERATOR = os.getenv("OSIRIS_GENERATOR", "vertex").lower()
+OSIRIS_SOURCE    = os.getenv("OSIRIS_SOURCE", "drive").lower()
+
+# Vertex AI / Google Drive
+PROJECT_ID  = os.getenv("PROJECT_ID", "global-cloud-runtime")
+REGION      = os.getenv("REGION", "us-central1")
+KEY_FILE    = os.getenv("KEY_FILE", "sa-credentials.json")
+SCOPES      = ['https://www.googleapis.com/auth/drive.readonly', 'https://www.googleapis.com/auth/documents.readonly']
+INPUT_QUERY = os.getenv("INPUT_QUERY", "mimeType='application/vnd.google-apps.document' and name contains 'Notes'")
+
+# Local backends
+HASH_DIM                = int(os.getenv("HASH_DIM", "768"))
+FAKE_TTFT_S             = float(os.getenv("FAKE_TTFT_S", "0.4"))       # simulated time to first token
+FAKE_TOKEN_S            = float(os.getenv("FAKE_TOKEN_S", "0.01"))     # simulated time per output token
+FAKE_FAILURE_RATE       = float(os.getenv("FAKE_FAILURE_RATE", "0.0")) # fraction of calls that raise
+FAKE_MAX_CONCURRENCY    = int(os.getenv("FAKE_MAX_CONCURRENCY", "0"))  # calls in flight before "quota exceeded", 0 = no limit
+FAKE_LATENCY_SIGMA      = float(os.getenv("FAKE_LATENCY_SIGMA", "0.0"))  # lognormal spread around the latencies, 0 = fixed
+FAKE_EMBED_LATENCY_S    = float(os.getenv("FAKE_EMBED_LATENCY_S", "0.0"))  # simulated HashingEmbedder call latency
+FAKE_EMBED_FAILURE_RATE = float(os.getenv("FAKE_EMBED_FAILURE_RATE", "0.0"))
+FAKE_SEED               = int(os.getenv("FAKE_SEED", "0"))
+SOURCE_DIR              = os.getenv("SOURCE_DIR", "docs")
+SOURCE_EXTENSIONS       = (".txt", ".md")
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+# --- Simulated latency for the local backends ---
+class SimulatedLatency:
+    """
+    Lognormal latencies around a median plus random failures, thread-safe.
+    Seeded per backend name, so a main and a fallback model do not fail in step.
+    """
+
+    def __init__(self, name: str, failure_rate: float = 0.0, sigma: float = FAKE_LATENCY_SIGMA, seed: int = FAKE_SEED):
+        self.name, self.failure_rate, self.sigma = name, failure_rate, sigma
+        self._rng = random.Random(f"{seed}:{name}")
+        self._lock = threading.Lock()
+
+    def sample(self, median_s: float) -> float:
+        if median_s <= 0 or self.sigma <= 0:
+            return max(0.0, median_s)
+        with self._lock:
+            z = self._rng.gauss(0.0, 1.0)
+        return median_s * math.exp(self.sigma * z)
+
+    def maybe_fail(self):
+        with self._lock:
+            failed = self._rng.random() < self.failure_rate
+        if failed:
+            raise RuntimeError(f"{self.name}: simulated failure")
+
+
+# --- Embedders ---
+class Embedder(ABC):
+    """Maps texts to vectors. `dim` requests reduced-width output (0 = backend default)."""
+
+    name = "embedder"
+
+    @abstractmethod
+    def embed(self, texts: List[str], dim: int = 0) -> List[List[float]]:
+        ...
+
+
+class VertexEmbedder(Embedder):
+    def __init__(self, model_name: str):
+        from google.cloud import aiplatform
+        from vertexai.language_models import TextEmbeddingModel
+
+        aiplatform.init(project=PROJECT_ID, location=REGION)
+        self.name = model_name
+        self.model = TextEmbeddingModel.from_pretrained(model_name)
+
+    def embed(self, texts: List[str], dim: int = 0) -> List[List[float]]:
+        return [r.values for r in self.model.get_embeddings(texts, output_dimensionality=dim or None)]
+
+
+class HashingEmbedder(Embedder):
+    def __init__(
+        self,
+        dim: int = HASH_DIM,
+        latency_s: float = FAKE_EMBED_LATENCY_S,
+        failure_rate: float = FAKE_EMBED_FAILURE_RATE,
+    ):
+        self.name = f"hashing-{dim}"
+        self.dim = dim
+        self.latency_s = latency_s
+        self.latency = SimulatedLatency(self.name, failure_rate)
+
+    @staticmethod
+    def _bucket(feature: str, dim: int) -> Tuple[int, float]:
+        h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+        return h % dim, (1.0 if (h >> 63) & 1 else -1.0)
+
+    def embed(self, texts: List[str], dim: int = 0) -> List[List[float]]:
+        """
+        Always hashes into `self.dim` buckets; a smaller `dim` keeps the leading
+        ones, the way compression.truncate_and_normalize cuts stored vectors, so
+        query and corpus vectors agree whichever side asked for the reduction.
+        """
+        if self.latency_s or self.latency.failure_rate:
+            time.sleep(self.latency.sample(self.latency_s))
+            self.latency.maybe_fail()
+        if dim > self.dim:
+            raise ValueError(f"{self.name} cannot produce {dim} dimensions; raise HASH_DIM")
+        out = np.zeros((len(texts), self.dim), dtype="float32")
+        for row, text in enumerate(texts):
+            words = TOKEN_RE.findall(text.lower())
+            for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+                col, sign = self._bucket(feature, self.dim)
+                out[row, col] += sign
+        out = out[:, :dim or self.dim]
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        return (out / np.maximum(norms, 1e-12)).tolist()
+
+
+# --- Generators ---
+class Generator(ABC):
+    """Text generation for one model; `name` is what traces record as the model."""
+
+    name = "generator"
+
+    @abstractmethod
+    def generate(self, prompt: str, config: dict) -> Tuple[str, dict]:
+        """Return the full answer and its usage."""
+
+    @abstractmethod
+    def stream(self, prompt: str, config: dict) -> Iterator[Tuple[str, dict]]:
+        """Yield (text piece, usage so far); usage may be empty until the last piece."""
+
+
+class VertexGenerator(Generator):
+    def __init__(self, model_name: str):
+        from google.cloud import aiplatform
+        from vertexai.preview.generative_models import GenerativeModel
+
+        aiplatform.init(project=PROJECT_ID, location=REGION)
+        self.name = model_name
+        self.model = GenerativeModel(model_name)
+
+    @staticmethod
+    def _usage(resp) -> dict:
+        usage = getattr(resp, "usage_metadata", None)
+        if usage is None:
+            return {}
+        return {
+            "prompt": getattr(usage, "prompt_token_count", None),
+            "output": getattr(usage, "candidates_token_count", None),
+        }
+
+    def _request(self, prompt: str, config: dict, stream: bool):
+        from vertexai.preview.generative_models import GenerationConfig, Part
+
+        return self.model.generate_content(
+            [Part.from_text(prompt)],
+            generation_config=GenerationConfig(**config),
+            stream=stream
+        )
+
+    def generate(self, prompt: str, config: dict) -> Tuple[str, dict]:
+        resp = self._request(prompt, config, stream=False)
+        return resp.text, self._usage(resp)
+
+    def stream(self, prompt: str, config: dict) -> Iterator[Tuple[str, dict]]:
+        for chunk in self._request(prompt, config, stream=True):
+            yield chunk.text, self._usage(chunk)
+
+
+class FakeGenerator(Generator):
+    def __init__(
+        self,
+        model_name: str,
+        ttft_s: float = FAKE_TTFT_S,
+        token_s: float = FAKE_TOKEN_S,
+        failure_rate: float = FAKE_FAILURE_RATE,
+        max_concurrency: int = FAKE_MAX_CONCURRENCY,
+    ):
+        self.name = f"fake/{model_name}"
+        self.ttft_s, self.token_s, self.max_concurrency = ttft_s, token_s, max_concurrency
+        self.latency = SimulatedLatency(self.name, failure_rate)
+        self._inflight = 0
+        self._inflight_lock = threading.Lock()
+
+    def _answer(self, prompt: str, config: dict) -> List[str]:
+        # One bullet per context line ("[timestamp] speaker: text (score=...)"), score stripped
+        lines = [l for l in prompt.split("\n") if l.startswith("[")][:4]
+        bullets = [f"- {l.split(' (score=')[0][:200]}" for l in lines] or ["- No relevant context was provided."]
+        words = "\n".join(bullets).split(" ")
+        return words[:config.get("max_output_tokens") or len(words)]
+
+    def _acquire(self):
+        """Count a call in flight, failing like an exhausted quota beyond max_concurrency."""
+        with self._inflight_lock:
+            if self.max_concurrency and self._inflight >= self.max_concurrency:
+                raise RuntimeError(f"{self.name}: 429 simulated quota exceeded")
+            self._inflight += 1
+
+    def _release(self):
+        with self._inflight_lock:
+            self._inflight -= 1
+
+    def _usage(self, prompt: str, words: List[str]) -> dict:
+        return {"prompt": len(prompt.split()), "output": len(words)}
+
+    def generate(self, prompt: str, config: dict) -> Tuple[str, dict]:
+        self._acquire()
+        try:
+            self.latency.maybe_fail()
+            words = self._answer(prompt, config)
+            time.sleep(self.latency.sample(self.ttft_s) + self.token_s * len(words))
+            return " ".join(words), self._usage(prompt, words)
+        finally:
+            self._release()
+
+    def stream(self, prompt: str, config: dict) -> Iterator[Tuple[str, dict]]:
+        self._acquire()
+        try:
+            self.latency.maybe_fail()
+            words = self._answer(prompt, config)
+            time.sleep(self.latency.sample(self.ttft_s))
+            for i, word in enumerate(words):
+                time.sleep(self.token_s)
+                last = i == len(words) - 1
+                yield (word if i == 0 else " " + word), (self._usage(prompt, words) if last else {})
+        finally:
+            self._release()
+
+
+# --- Document sources ---
+class DocumentSource(ABC):
+    """Lists documents as {id, name} dicts and reads each as plain text."""
+
+    @abstractmethod
+    def list_documents(self) -> List[dict]:
+        ...
+
+    @abstractmethod
+    def read_text(self, doc: dict) -> str:
+        ...
+
+
+class DriveSource(DocumentSource):
+    def __init__(self, key_file: str = KEY_FILE, query: str = INPUT_QUERY):
+        from google.oauth2 import service_account
+        from googleapiclient.discovery import build
+
+        creds = service_account.Credentials.from_service_account_file(key_file, scopes=SCOPES)
+        self.service = build('drive', 'v3', credentials=creds)
+        self.query = query
+
+    def list_documents(self) -> List[dict]:
+        results, token = [], None
+        while True:
+            resp = self.service.files().list(
+                q=self.query, fields="nextPageToken, files(id, name)", pageSize=100, pageToken=token
+            ).execute()
+            results += resp.get('files', [])
+            token = resp.get('nextPageToken')
+            if not token:
+                break
+        return results
+
+    def read_text(self, doc: dict) -> str:
+        from googleapiclient.http import MediaIoBaseDownload
+
+        req = self.service.files().export_media(fileId=doc['id'], mimeType='text/plain')
+        buf = BytesIO()
+        downloader = MediaIoBaseDownload(buf, req)
+        while not downloader.next_chunk()[1]:
+            continue
+        return buf.getvalue().decode('utf-8')
+
+
+class DirectorySource(DocumentSource):
+    def __init__(self, root: str = SOURCE_DIR):
+        self.root = Path(root)
+
+    def list_documents(self) -> List[dict]:
+        paths = sorted(p for p in self.root.rglob("*") if p.is_file() and p.suffix.lower() in SOURCE_EXTENSIONS)
+        return [{"id": p.relative_to(self.root).as_posix(), "name": p.stem} for p in paths]
+
+    def read_text(self, doc: dict) -> str:
+        return (self.root / doc['id']).read_text(encoding='utf-8')
+
+
+# --- Selection ---
+def get_embedder(model_name: str, kind: str = OSIRIS_EMBEDDER) -> Embedder:
+    if kind == "vertex":
+        return VertexEmbedder(model_name)
+    if kind == "hashing":
+        return HashingEmbedder()
+    raise ValueError(f"Unknown embedder '{kind}', expected 'vertex' or 'hashing'")
+
+
+def get_generator(model_name: str, kind: str = OSIRIS_GENERATOR) -> Generator:
+    if kind == "vertex":
+        return VertexGenerator(model_name)
+    if kind == "fake":
+        return FakeGenerator(model_name)
+    raise ValueError(f"Unknown generator '{kind}', expected 'vertex' or 'fake'")
+
+
+def get_source(kind: str = OSIRIS_SOURCE) -> DocumentSource:
+    if kind == "drive":
+        return DriveSource()
+    if kind == "directory":
+        return DirectorySource()
+    raise ValueError(f"Unknown document source '{kind}', expected 'drive' or 'directory'")
+
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+batch_ask.py
+
+Answers a JSONL file of questions in bulk for offline reports:
+1. Embeds all pending questions in batched API calls
+2. Runs one multi-row FAISS search per distinct filter set
+3. Reranks every query's candidates in one vectorized pass
+4. Generates answers through a bounded thread pool, writing each result
+   to the output JSONL as soon as it completes
+
+Each answer is traced like an interactive one (mode "batch"), so it shows
+up in query_logs.jsonl and /metrics; retrieval runs in bulk beforehand, so
+those traces time prompt building and generation only.
+
+Input lines:  {"id": "q1", "question": "...", "filters": {...}, "temperature": 0.2}
+              (only "question" is required; id defaults to the line number)
+Output lines: {"id": "q1", "question": "...", "answer": "...", "sources": [...]}
+              or {"id": ..., "question": ..., "error": "..."} on failure
+
+Re-running with the same output file resumes: questions that already have
+an answer there are skipped, failed ones are retried.
+
+Usage: python batch_ask.py questions.jsonl answers.jsonl [--concurrency 8]
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import ask_osiris
+from rerank import hybrid_rerank_batch
+from tracing import Trace
+
+# --- CONFIGURATION ---
+GEN_CONCURRENCY = int(os.getenv("GEN_CONCURRENCY", "8"))
+
+
+def load_questions(path: str) -> list:
+    questions = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_num, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError as e:
+                logging.warning(f"⚠️ Skipping line {line_num} due to JSON error: {e}")
+                continue
+            if not entry.get("question"):
+                logging.warning(f"⚠️ Line {line_num} has no 'question'. Skipping.")
+                continue
+            entry.setdefault("id", str(line_num))
+            questions.append(entry)
+    return questions
+
+
+def load_completed(path: str) -> set:
+    """IDs that already have an answer in the output file."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # partial last line from an interrupted run
+            if "answer" in entry:
+                done.add(str(entry["id"]))
+    return done
+
+
+def retrieve_all(questions: list) -> dict:
+    """Embed, search and rerank all questions in bulk. Returns id → reranked hits."""
+    texts = [q["question"] for q in questions]
+    q_mat = ask_osiris.embed_queries(texts)
+    logging.info(f"Embedded {len(texts)} questions")
+
+    # One multi-row search per distinct filter set
+    groups = {}
+    for row, q in enumerate(questions):
+        filters, ids = ask_osiris.resolve_filters(q["question"], q.get("filters"))
+        key = json.dumps(filters, sort_keys=True)
+        groups.setdefault(key, (ids, []))[1].append(row)
+
+    reranked = {}
+    for key, (ids, rows) in groups.items():
+        if ids is not None and len(ids) == 0:
+            for row in rows:
+                reranked[str(questions[row]["id"])] = []
+            continue
+        D, I = ask_osiris.search_batch(q_mat[rows], ask_osiris.RETRIEVE_K, ids)
+        top_k = ask_osiris.MMR_POOL_K if ask_osiris.USE_MMR else ask_osiris.RERANK_K
+        hits = hybrid_rerank_batch([texts[row] for row in rows], D, I, ask_osiris.chunk_tokens, top_k)
+        for row, h in zip(rows, hits):
+            reranked[str(questions[row]["id"])] = ask_osiris.diversify(h) if ask_osiris.USE_MMR else h
+        logging.info(f"Searched and reranked {len(rows)} questions with filters {key}")
+    return reranked
+
+
+def answer_one(question: dict, reranked: list) -> dict:
+    result = {"id": question["id"], "question": question["question"]}
+    trace = Trace(question["question"], mode="batch")
+    trace.set(filters=question.get("filters"))
+    if not reranked:
+        trace.finish("no_match")
+        result["answer"] = ask_osiris.NO_MATCH_ANSWER
+        result["sources"] = []
+        return result
+    trace.set_results(reranked, ask_osiris.metadata)
+    try:
+        with trace.stage("prompt_build"):
+            full_prompt = ask_osiris.build_prompt(question["question"], "", ask_osiris.build_context(reranked))
+        gen_config = ask_osiris.build_generation_config(question["question"], question.get("temperature"))
+        # Queued behind interactive users and first to be shed when the scheduler is on
+        result["answer"] = ask_osiris.generate(full_prompt, gen_config, trace=trace, user="batch", priority="low")
+    except Exception as e:
+        trace.finish("error", str(e))
+        raise
+    trace.finish()
+    result["sources"] = [
+        {
+            "score": round(score, 4),
+            "index": idx,
+            "speaker": ask_osiris.metadata[idx]["speaker"],
+            "timestamp": ask_osiris.metadata[idx]["timestamp"],
+            "source_id": ask_osiris.metadata[idx].get("source_id"),
+        }
+        for score, idx in reranked
+    ]
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of questions with Osiris")
+    parser.add_argument("input", help="JSONL file of questions")
+    parser.add_argument("output", help="JSONL file to append answers to (resumable)")
+    parser.add_argument("--concurrency", type=int, default=GEN_CONCURRENCY, help="parallel generations")
+    args = parser.parse_args()
+
+    start = time.time()
+    questions = load_questions(args.input)
+    done = load_completed(args.output)
+    pending = [q for q in questions if str(q["id"]) not in done]
+    logging.info(f"📥 {len(questions)} questions, {len(done)} already answered, {len(pending)} pending")
+    if not pending:
+        return
+
+    reranked = retrieve_all(pending)
+
+    answered = failed = 0
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool, \
+            open(args.output, "a", encoding="utf-8") as out:
+        futures = {pool.submit(answer_one, q, reranked[str(q["id"])]): q for q in pending}
+        for future in as_completed(futures):
+            q = futures[future]
+            try:
+                result = future.result()
+                answered += 1
+            except Exception as e:
+                logging.error(f"❌ Question {q['id']} failed: {e}")
+                result = {"id": q["id"], "question": q["question"], "error": str(e)}
+                failed += 1
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            out.flush()
+            logging.info(f"[{answered + failed}/{len(pending)}] {q['id']}")
+
+    logging.info(f"✅ {answered} answered, {failed} failed in {time.time() - start:.2f}s → {args.output}")
+
+
+if __name__ == "__main__":
+    main()
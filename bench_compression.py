@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+bench_compression.py
+
+Size / latency / recall report for compressed index configurations.
+
+For every (OUTPUT_DIM, QUANTIZATION) pair the corpus from embeddings.npy is
+truncated, quantized and indexed, then searched with held-out corpus
+vectors as queries. Recall@k is measured against exact full-width float32
+search, so each row shows what the configuration costs in quality and what
+it saves in bytes and milliseconds.
+
+Writes a table to stdout and the rows to compression_report.json.
+"""
+
+import json
+import os
+import time
+import logging
+
+import faiss
+import numpy as np
+
+from compression import build_index, index_nbytes, truncate_and_normalize
+
+# --- CONFIGURATION ---
+EMBEDDINGS_FILE  = os.getenv("EMBEDDINGS_FILE", "embeddings.npy")
+REPORT_FILE      = os.getenv("REPORT_FILE", "compression_report.json")
+DIMS             = [int(d) for d in os.getenv("DIMS", "0,1536,768,256").split(",")]  # 0 = full width
+QUANTIZATIONS    = os.getenv("QUANTIZATIONS", "none,fp16,int8,pq").split(",")
+USE_IVF          = os.getenv("USE_IVF", "False").lower() == "true"
+NUM_CLUSTERS     = int(os.getenv("NUM_CLUSTERS", "100"))
+PQ_SUBVECTOR_DIM = int(os.getenv("PQ_SUBVECTOR_DIM", "8"))  # PQ_M = dim / this
+PQ_NBITS         = int(os.getenv("PQ_NBITS", "8"))
+NUM_QUERIES      = int(os.getenv("NUM_QUERIES", "50"))
+RECALL_K         = int(os.getenv("RECALL_K", "20"))
+REPEATS          = int(os.getenv("REPEATS", "5"))
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+
+def recall_at_k(truth: np.ndarray, found: np.ndarray) -> float:
+    hits = sum(len(set(t) & set(f)) for t, f in zip(truth.tolist(), found.tolist()))
+    return hits / truth.size
+
+
+def search_latency_ms(index: faiss.Index, queries: np.ndarray, k: int) -> float:
+    """Best-of-REPEATS mean single-query latency."""
+    best = float("inf")
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        for q in queries:
+            index.search(q[None], k)
+        best = min(best, (time.perf_counter() - start) / len(queries))
+    return best * 1000
+
+
+def main():
+    full = np.load(EMBEDDINGS_FILE)
+    full = full[np.any(full != 0, axis=1)]
+    rng = np.random.default_rng(0)
+    perm = rng.permutation(len(full))
+    n_queries = min(NUM_QUERIES, len(full) // 5)
+    query_full, corpus_full = full[perm[:n_queries]], full[perm[n_queries:]]
+    k = min(RECALL_K, len(corpus_full))
+    logging.info(f"{len(corpus_full)} corpus vectors × {full.shape[1]} dims, {n_queries} held-out queries, k={k}")
+
+    # Ground truth: exact full-width float32 search
+    exact = faiss.IndexFlatIP(full.shape[1])
+    exact.add(truncate_and_normalize(corpus_full))
+    _, truth = exact.search(truncate_and_normalize(query_full), k)
+
+    rows = []
+    for dim in DIMS:
+        corpus = truncate_and_normalize(corpus_full, dim)
+        queries = truncate_and_normalize(query_full, dim)
+        d = corpus.shape[1]
+        for quantization in QUANTIZATIONS:
+            pq_m = max(1, d // PQ_SUBVECTOR_DIM)
+            start = time.perf_counter()
+            index = build_index(corpus, quantization, USE_IVF, min(NUM_CLUSTERS, len(corpus) // 4 or 1), pq_m, PQ_NBITS)
+            build_s = time.perf_counter() - start
+            _, found = index.search(queries, k)
+            rows.append({
+                "dim": d,
+                "quantization": quantization,
+                "ivf": USE_IVF,
+                "index_bytes": index_nbytes(index),
+                "bytes_per_vector": index_nbytes(index) / index.ntotal,
+                "build_s": build_s,
+                "search_ms": search_latency_ms(index, queries, k),
+                f"recall@{k}": recall_at_k(truth, found),
+            })
+
+    baseline = rows[0]["index_bytes"]
+    print(f"\n{'dim':>5} {'quant':>5} {'MB':>9} {'B/vec':>8} {'x smaller':>9} {'search ms':>10} {f'recall@{k}':>10}")
+    for r in rows:
+        print(f"{r['dim']:>5} {r['quantization']:>5} {r['index_bytes'] / 1e6:>9.3f} {r['bytes_per_vector']:>8.0f} "
+              f"{baseline / r['index_bytes']:>9.1f} {r['search_ms']:>10.3f} {r[f'recall@{k}']:>10.3f}")
+
+    with open(REPORT_FILE, "w") as f:
+        json.dump(rows, f, indent=2)
+    logging.info(f"Saved report to '{REPORT_FILE}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+bench_load.py
+
+Load generator for the end-to-end answer path (ask_osiris.answer_question,
+what osiris_server.py and askosiris_app.py call), driven against the local
+stand-in backends so a run costs nothing and needs no credentials:
+  * HashingEmbedder with FAKE_EMBED_LATENCY_S per call;
+  * FakeGenerator with lognormal time-to-first-token (FAKE_TTFT_S median,
+    FAKE_LATENCY_SIGMA spread), FAKE_TOKEN_S per token, FAKE_FAILURE_RATE
+    random failures and a FAKE_MAX_CONCURRENCY simulated quota per model,
+    beyond which calls fail like a 429 and go to the fallback model.
+These defaults apply only when the variables are unset, and
+OSIRIS_EMBEDDER / OSIRIS_GENERATOR can point the run at the real backends.
+
+Questions are drawn at random from query_logs.jsonl. Each level runs for
+LEVEL_DURATION_S:
+  * closed loop (CONCURRENCY_LEVELS): N users each send the next question
+    as soon as their previous answer arrives;
+  * open loop (ARRIVAL_RATES, requests/s): Poisson arrivals whatever the
+    response times, latency measured from arrival, so queueing shows up.
+Per level it reports throughput, p50/p90/p95/p99 latency, time to first
+token, error rate and fallback usage, plus generation queue time and shed
+rate when GEN_SCHEDULER=True, and marks the highest level that meets
+SLO_P95_S and SLO_ERROR_RATE. Closed-loop users and OPEN_LOOP_USERS
+open-loop senders each have their own scheduler user.
+Writes the rows to load_test_report.json. Query logging is off unless
+QUERY_LOG_ENABLED=True, so runs do not feed back into query_logs.jsonl.
+"""
+
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Tuple
+
+# Stand-in backends and quiet query log unless the caller chose otherwise
+for _name, _default in (
+    ("OSIRIS_EMBEDDER", "hashing"), ("OSIRIS_GENERATOR", "fake"), ("QUERY_LOG_ENABLED", "False"),
+    ("FAKE_EMBED_LATENCY_S", "0.08"), ("FAKE_TTFT_S", "0.8"), ("FAKE_TOKEN_S", "0.01"),
+    ("FAKE_LATENCY_SIGMA", "0.5"), ("FAKE_FAILURE_RATE", "0.02"), ("FAKE_MAX_CONCURRENCY", "16"),
+):
+    os.environ.setdefault(_name, _default)
+
+import numpy as np
+
+import ask_osiris
+from tracing import Trace
+
+# --- CONFIGURATION ---
+QUESTIONS_FILE     = os.getenv("QUESTIONS_FILE", "query_logs.jsonl")
+REPORT_FILE        = os.getenv("REPORT_FILE", "load_test_report.json")
+CONCURRENCY_LEVELS = [int(n) for n in os.getenv("CONCURRENCY_LEVELS", "1,2,4,8,16,32").split(",") if n]
+ARRIVAL_RATES      = [float(r) for r in os.getenv("ARRIVAL_RATES", "").split(",") if r]
+LEVEL_DURATION_S   = float(os.getenv("LEVEL_DURATION_S", "20"))
+OPEN_LOOP_WORKERS  = int(os.getenv("OPEN_LOOP_WORKERS", "256"))  # cap on requests in flight in open loop
+OPEN_LOOP_USERS    = int(os.getenv("OPEN_LOOP_USERS", "8"))      # distinct users open-loop arrivals come from
+STREAM             = os.getenv("STREAM", "False").lower() == "true"
+EMBED_CACHE        = os.getenv("EMBED_CACHE", "False").lower() == "true"  # few distinct questions would all hit it
+SLO_P95_S          = float(os.getenv("SLO_P95_S", "5.0"))
+SLO_ERROR_RATE     = float(os.getenv("SLO_ERROR_RATE", "0.01"))
+SEED               = int(os.getenv("SEED", "0"))
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+
+def load_questions(path: str) -> List[str]:
+    questions = []
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            questions = [json.loads(line).get("query") for line in f if line.strip()]
+    questions = list(dict.fromkeys(q for q in questions if q))
+    return questions or ["What did Mack Myers say about event tracking intervals?"]
+
+
+def one_request(question: str, arrived: float, user: str = None) -> dict:
+    """Answer one question; latency runs from `arrived` (includes any queueing)."""
+    trace = Trace(question, mode="load_test", stream=STREAM)
+    ttft, error = None, None
+    try:
+        if STREAM:
+            for _ in ask_osiris.stream_answer(question, trace=trace, user=user):
+                if ttft is None:
+                    ttft = time.perf_counter() - arrived
+        else:
+            ask_osiris.answer_question(question, trace=trace, user=user)
+            ttft = time.perf_counter() - arrived
+        status = trace.record.get("status", "ok")
+    except Exception as e:
+        status, error = "error", str(e)
+    return {
+        "latency": time.perf_counter() - arrived,
+        "ttft": ttft,
+        "status": status,
+        "error": error,
+        "fallback": bool(trace.record.get("fallback")),
+        "shed": bool(trace.record.get("shed")),
+        "queued": trace.timings.get("generation_queue", 0.0),
+    }
+
+
+def closed_loop(users: int, duration_s: float, pick: Callable[[], str]) -> Tuple[List[dict], float]:
+    results, lock = [], threading.Lock()
+    start = time.perf_counter()
+    deadline = start + duration_s
+
+    def user(name: str):
+        while time.perf_counter() < deadline:
+            r = one_request(pick(), time.perf_counter(), name)
+            with lock:
+                results.append(r)
+
+    threads = [threading.Thread(target=user, args=(f"load-user-{i}",), name=f"load-user-{i}") for i in range(users)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, time.perf_counter() - start
+
+
+def open_loop(rate: float, duration_s: float, pick: Callable[[], str], rng: random.Random) -> Tuple[List[dict], float]:
+    futures = []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=OPEN_LOOP_WORKERS, thread_name_prefix="load-open") as pool:
+        arrival = start
+        while True:
+            arrival += rng.expovariate(rate)
+            if arrival - start >= duration_s:
+                break
+            time.sleep(max(0.0, arrival - time.perf_counter()))
+            futures.append(pool.submit(one_request, pick(), arrival, f"load-user-{rng.randrange(OPEN_LOOP_USERS)}"))
+        results = [f.result() for f in futures]
+    return results, time.perf_counter() - start
+
+
+def summarize(kind: str, level: float, results: List[dict], elapsed: float) -> dict:
+    lat = np.array([r["latency"] for r in results]) if results else np.zeros(1)
+    ttft = np.array([r["ttft"] for r in results if r["ttft"] is not None] or [0.0])
+    queued = np.array([r["queued"] for r in results] or [0.0])
+    ok = [r for r in results if r["status"] != "error"]
+    n = max(1, len(results))
+    row = {
+        "mode": kind,
+        "level": level,
+        "requests": len(results),
+        "throughput_rps": round(len(ok) / elapsed, 3) if elapsed else 0.0,
+        "error_rate": round((len(results) - len(ok)) / n, 4),
+        "fallback_rate": round(sum(r["fallback"] for r in results) / n, 4),
+        "ttft_p50_s": round(float(np.percentile(ttft, 50)), 3),
+        "ttft_p95_s": round(float(np.percentile(ttft, 95)), 3),
+        "shed_rate": round(sum(r["shed"] for r in results) / n, 4),
+        "queue_p95_s": round(float(np.percentile(queued, 95)), 3),
+    }
+    for p in (50, 90, 95, 99):
+        row[f"p{p}_s"] = round(float(np.percentile(lat, p)), 3)
+    row["max_s"] = round(float(lat.max()), 3)
+    row["meets_slo"] = row["p95_s"] <= SLO_P95_S and row["error_rate"] <= SLO_ERROR_RATE
+    row["errors"] = dict(Counter(r["error"] for r in results if r["error"]).most_common(5))
+    return row
+
+
+def main():
+    if not EMBED_CACHE:
+        ask_osiris.EMBED_CACHE_SIZE = 0
+    questions = load_questions(QUESTIONS_FILE)
+    rng = random.Random(SEED)
+    pick_lock = threading.Lock()
+
+    def pick() -> str:
+        with pick_lock:
+            return rng.choice(questions)
+
+    logging.info(
+        f"Load test: {len(questions)} distinct questions, {LEVEL_DURATION_S:.0f}s per level, "
+        f"embedder={ask_osiris.embedder.name}, generators={ask_osiris.gen_model_main.name}/{ask_osiris.gen_model_fallback.name}"
+    )
+    rows = []
+    for users in CONCURRENCY_LEVELS:
+        results, elapsed = closed_loop(users, LEVEL_DURATION_S, pick)
+        rows.append(summarize("closed", users, results, elapsed))
+        logging.info(f"closed loop, {users} users: {rows[-1]['throughput_rps']} req/s, p95 {rows[-1]['p95_s']}s")
+    for rate in ARRIVAL_RATES:
+        results, elapsed = open_loop(rate, LEVEL_DURATION_S, pick, rng)
+        rows.append(summarize("open", rate, results, elapsed))
+        rows[-1]["offered_rps"] = round(len(results) / LEVEL_DURATION_S, 3)
+        logging.info(f"open loop, {rate} req/s: {rows[-1]['throughput_rps']} req/s, p95 {rows[-1]['p95_s']}s")
+
+    print(f"\n{'mode':>6} {'level':>6} {'reqs':>5} {'req/s':>7} {'p50 s':>6} {'p90 s':>6} {'p95 s':>6} "
+          f"{'p99 s':>6} {'ttft95':>6} {'q95 s':>6} {'err %':>6} {'fb %':>6} {'shed %':>6} {'SLO':>4}")
+    for r in rows:
+        print(f"{r['mode']:>6} {r['level']:>6g} {r['requests']:>5} {r['throughput_rps']:>7.2f} {r['p50_s']:>6.2f} "
+              f"{r['p90_s']:>6.2f} {r['p95_s']:>6.2f} {r['p99_s']:>6.2f} {r['ttft_p95_s']:>6.2f} {r['queue_p95_s']:>6.2f} "
+              f"{r['error_rate'] * 100:>6.1f} {r['fallback_rate'] * 100:>6.1f} {r['shed_rate'] * 100:>6.1f} "
+              f"{'ok' if r['meets_slo'] else '✗':>4}")
+    sustained = [r["level"] for r in rows if r["mode"] == "closed" and r["meets_slo"]]
+    if sustained:
+        print(f"\nHighest concurrency within SLO (p95 ≤ {SLO_P95_S}s, errors ≤ {SLO_ERROR_RATE:.0%}): {max(sustained)} users")
+
+    config = {k: os.environ.get(k) for k in (
+        "OSIRIS_EMBEDDER", "OSIRIS_GENERATOR", "FAKE_EMBED_LATENCY_S", "FAKE_TTFT_S", "FAKE_TOKEN_S",
+        "FAKE_LATENCY_SIGMA", "FAKE_FAILURE_RATE", "FAKE_MAX_CONCURRENCY",
+        "GEN_SCHEDULER", "GEN_MAX_CONCURRENCY", "SHED_QUEUE_DEPTH", "GEN_QUEUE_TIMEOUT_S", "SHED_MAX_OUTPUT_TOKENS",
+    )}
+    with open(REPORT_FILE, "w", encoding="utf-8") as f:
+        json.dump({"config": config, "level_duration_s": LEVEL_DURATION_S, "stream": STREAM,
+                   "slo": {"p95_s": SLO_P95_S, "error_rate": SLO_ERROR_RATE}, "levels": rows}, f, indent=2)
+    logging.info(f"Report written to '{REPORT_FILE}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+bench_rerank.py
+
+Benchmarks the per-candidate Python loop hybrid rerank against the
+vectorized sparse-matrix version in rerank.py, for RETRIEVE_K values
+from 100 to 5,000, single-query and batched.
+
+The corpus is texts.json tiled up to the largest RETRIEVE_K so every query
+can draw distinct candidates; questions come from query_logs.jsonl.
+"""
+
+import json
+import os
+import re
+import time
+import logging
+from typing import List, Tuple
+
+import numpy as np
+
+from rerank import TokenMatrix, hybrid_rerank_batch
+
+# --- CONFIGURATION ---
+TEXTS_FILE     = os.getenv("TEXTS_FILE", "texts.json")
+QUERY_LOG_FILE = os.getenv("QUERY_LOG_FILE", "query_logs.jsonl")
+RETRIEVE_KS    = [int(k) for k in os.getenv("RETRIEVE_KS", "100,500,1000,2000,5000").split(",")]
+RERANK_K       = int(os.getenv("RERANK_K", "20"))
+BATCH_SIZE     = int(os.getenv("BATCH_SIZE", "32"))
+REPEATS        = int(os.getenv("REPEATS", "3"))
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+
+def hybrid_rerank_loop(
+    query: str,
+    dense_scores: List[float],
+    dense_indices: List[int],
+    chunks: List[str],
+) -> List[Tuple[float, int]]:
+    """The original ask_osiris.hybrid_rerank, kept as the benchmark baseline."""
+    q_tokens = set(re.findall(r"\w+", query.lower()))
+    hybrid = []
+    for score, idx in zip(dense_scores, dense_indices):
+        text = chunks[idx].lower()
+        words = re.findall(r"\w+", text)
+        overlap = len(q_tokens.intersection(words)) / (len(q_tokens)+1)
+        combined = 0.8 * score + 0.2 * overlap
+        hybrid.append((combined, idx))
+    hybrid.sort(key=lambda x: x[0], reverse=True)
+    return hybrid[:RERANK_K]
+
+
+def load_questions(path: str, n: int) -> List[str]:
+    questions = []
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            questions = [json.loads(line)["query"] for line in f if line.strip()]
+    questions = questions or ["What did Mack Myers say about event tracking intervals?"]
+    return [questions[i % len(questions)] for i in range(n)]
+
+
+def best_of(fn, repeats: int = REPEATS) -> float:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    with open(TEXTS_FILE, "r", encoding="utf-8") as f:
+        texts = json.load(f)
+    copies = -(-max(RETRIEVE_KS) // len(texts))
+    corpus = texts * copies
+    logging.info(f"Corpus: {len(corpus)} chunks ({copies}× {TEXTS_FILE}), batch size {BATCH_SIZE}")
+
+    start = time.perf_counter()
+    tokens = TokenMatrix(corpus)
+    logging.info(f"Built token matrix {tokens.matrix.shape} nnz={tokens.matrix.nnz} in {time.perf_counter() - start:.2f}s")
+
+    questions = load_questions(QUERY_LOG_FILE, BATCH_SIZE)
+    rng = np.random.default_rng(0)
+
+    rows = []
+    for k in RETRIEVE_KS:
+        I = np.stack([rng.choice(len(corpus), size=k, replace=False) for _ in questions])
+        D = np.sort(rng.uniform(0.5, 0.8, size=I.shape).astype("float32"), axis=1)[:, ::-1]
+
+        # Same top RERANK_K scores from both implementations
+        loop = hybrid_rerank_loop(questions[0], D[0].tolist(), I[0].tolist(), corpus)
+        vec = hybrid_rerank_batch(questions[:1], D[:1], I[:1], tokens, RERANK_K)[0]
+        assert np.allclose([s for s, _ in loop], [s for s, _ in vec], atol=1e-5), "rerank mismatch"
+
+        loop_t = best_of(lambda: [
+            hybrid_rerank_loop(q, d.tolist(), i.tolist(), corpus) for q, d, i in zip(questions, D, I)
+        ]) / len(questions)
+        single_t = best_of(lambda: [
+            hybrid_rerank_batch([q], d[None], i[None], tokens, RERANK_K) for q, d, i in zip(questions, D, I)
+        ]) / len(questions)
+        batch_t = best_of(lambda: hybrid_rerank_batch(questions, D, I, tokens, RERANK_K)) / len(questions)
+        rows.append({
+            "retrieve_k": k,
+            "loop_ms": loop_t * 1e3,
+            "vectorized_single_ms": single_t * 1e3,
+            "vectorized_batch_ms": batch_t * 1e3,
+            "speedup_single": loop_t / single_t,
+            "speedup_batch": loop_t / batch_t,
+        })
+
+    print(f"\n{'RETRIEVE_K':>10} {'loop ms/q':>10} {'vec ms/q':>10} {'batch ms/q':>11} {'x single':>9} {'x batch':>8}")
+    for r in rows:
+        print(f"{r['retrieve_k']:>10} {r['loop_ms']:>10.3f} {r['vectorized_single_ms']:>10.3f} "
+              f"{r['vectorized_batch_ms']:>11.3f} {r['speedup_single']:>9.1f} {r['speedup_batch']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+coalescer.py
+
+Micro-batching of concurrent single-item calls.
+
+Concurrent requests each embedding one query and searching one row waste
+embedding round trips and FAISS's multi-row BLAS path. A MicroBatcher hands
+every submitted item to a dispatcher thread, which waits at most `window_s`
+after the first item for others (up to `max_batch`), runs the batch function
+once per group of compatible items and fans the results back to the waiting
+callers. A lone request pays at most one window of extra latency.
+"""
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+
+class MicroBatcher:
+    """
+    Coalesce `submit(item)` calls into `fn(items) -> results` batches.
+
+    `key(item)` groups items that can share a call (e.g. same k); `fn` must
+    return one result per item, in order. An exception from `fn` is raised
+    in every caller of that group.
+    """
+
+    def __init__(
+        self,
+        fn: Callable[[List[Any]], List[Any]],
+        window_s: float,
+        max_batch: int,
+        key: Optional[Callable[[Any], Hashable]] = None,
+        name: str = "batcher",
+    ):
+        self.fn, self.window_s, self.max_batch, self.key, self.name = fn, window_s, max(1, max_batch), key, name
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+
+    def submit(self, item: Any) -> Any:
+        self._start()
+        future = Future()
+        self._queue.put((item, future))
+        return future.result()
+
+    def mean_batch_size(self) -> float:
+        return self.items / self.batches if self.batches else 0.0
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"osiris-{self.name}", daemon=True)
+                self._thread.start()
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.window_s
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            groups: Dict[Hashable, list] = {}
+            for entry in batch:
+                groups.setdefault(self.key(entry[0]) if self.key else None, []).append(entry)
+            for entries in groups.values():
+                self._dispatch(entries)
+
+    def _dispatch(self, entries: list):
+        self.batches += 1
+        self.items += len(entries)
+        try:
+            results = list(self.fn([item for item, _ in entries]))
+            if len(results) != len(entries):
+                raise RuntimeError(f"{self.name}: {len(results)} results for {len(entries)} items")
+        except Exception as e:
+            logging.warning(f"{self.name}: batch of {len(entries)} failed: {e}")
+            for _, future in entries:
+                future.set_exception(e)
+            return
+        for (_, future), result in zip(entries, results):
+            future.set_result(result)
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+compression.py
+
+Reduced-width and quantized vector storage for the FAISS index.
+
+gemini-embedding-001 is trained Matryoshka-style, so the first `dim`
+components of an embedding are themselves a usable embedding once
+re-normalized. On top of (optionally) truncated vectors the index can
+store codes instead of float32:
+    none  — float32 (IndexFlatIP / IndexIVFFlat), 4 bytes per component
+    fp16  — scalar quantizer, 2 bytes per component
+    int8  — scalar quantizer, 1 byte per component (trained min/max)
+    pq    — product quantizer, PQ_M sub-vectors × PQ_NBITS bits per vector
+Queries are always float32; they only need the same truncation.
+
+IVF inverted lists can be moved to an on-disk .ivfdata file that FAISS
+memory-maps at load time, so serving processes share them through the page
+cache instead of each holding a private copy. Large corpora can also be
+added block by block to copies of one trained index and the blocks' lists
+merged straight into that file (see save_to_faiss.py BUILD_MODE=stream).
+"""
+
+import logging
+import math
+import os
+from typing import List
+
+import faiss
+import numpy as np
+
+QUANTIZATIONS = ("none", "fp16", "int8", "pq")
+
+
+def truncate_and_normalize(mat: np.ndarray, dim: int = 0) -> np.ndarray:
+    """Keep the first `dim` components (0 = all) and L2-normalize rows, in float32."""
+    if dim and dim < mat.shape[1]:
+        mat = mat[:, :dim]
+    mat = np.ascontiguousarray(mat, dtype="float32")
+    faiss.normalize_L2(mat)
+    return mat
+
+
+def new_index(
+    dim: int,
+    quantization: str = "none",
+    use_ivf: bool = False,
+    num_clusters: int = 100,
+    pq_m: int = 64,
+    pq_nbits: int = 8,
+    n_train: int = 0,
+) -> faiss.Index:
+    """Empty inner-product index; `n_train` (the training set size) caps the PQ bits."""
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Unknown quantization '{quantization}', expected one of {QUANTIZATIONS}")
+
+    if quantization == "pq":
+        if dim % pq_m:
+            raise ValueError(f"PQ_M={pq_m} must divide the vector dimension {dim}")
+        # k-means needs more points than centroids per sub-quantizer
+        max_nbits = max(1, int(math.log2(max(n_train, 2))))
+        if pq_nbits > max_nbits:
+            logging.warning(f"Only {n_train} vectors: reducing PQ bits from {pq_nbits} to {max_nbits}")
+            pq_nbits = max_nbits
+
+    sq_types = {"fp16": faiss.ScalarQuantizer.QT_fp16, "int8": faiss.ScalarQuantizer.QT_8bit}
+    metric = faiss.METRIC_INNER_PRODUCT
+    if use_ivf:
+        quantizer = faiss.IndexFlatIP(dim)
+        if quantization == "none":
+            return faiss.IndexIVFFlat(quantizer, dim, num_clusters, metric)
+        if quantization == "pq":
+            return faiss.IndexIVFPQ(quantizer, dim, num_clusters, pq_m, pq_nbits, metric)
+        return faiss.IndexIVFScalarQuantizer(quantizer, dim, num_clusters, sq_types[quantization], metric)
+    if quantization == "none":
+        return faiss.IndexFlatIP(dim)
+    if quantization == "pq":
+        return faiss.IndexPQ(dim, pq_m, pq_nbits, metric)
+    return faiss.IndexScalarQuantizer(dim, sq_types[quantization], metric)
+
+
+def build_index(
+    mat: np.ndarray,
+    quantization: str = "none",
+    use_ivf: bool = False,
+    num_clusters: int = 100,
+    pq_m: int = 64,
+    pq_nbits: int = 8,
+    ids: np.ndarray = None,
+) -> faiss.Index:
+    """Build, train and fill an inner-product index over normalized `mat`, optionally with row `ids`."""
+    n, dim = mat.shape
+    index = new_index(dim, quantization, use_ivf, num_clusters, pq_m, pq_nbits, n_train=n)
+    if not index.is_trained:
+        logging.info(f"Training {type(index).__name__} on {n} vectors...")
+        index.train(mat)
+    if ids is not None:
+        # Rows carry external IDs (e.g. global row numbers inside a shard)
+        index = faiss.IndexIDMap2(index)
+        index.add_with_ids(mat, np.asarray(ids, dtype="int64"))
+    else:
+        index.add(mat)
+    return index
+
+
+def to_ondisk_ivf(index: faiss.Index, ivfdata_path: str) -> faiss.Index:
+    """
+    Move the inverted lists of an IVF `index` into `ivfdata_path` in place.
+
+    The file is written under a temporary name and renamed, so processes that
+    still map the previous file keep reading a consistent copy.
+    """
+    ivf = faiss.extract_index_ivf(index)
+    tmp = ivfdata_path + ".tmp"
+    invlists = faiss.OnDiskInvertedLists(ivf.nlist, ivf.code_size, tmp)
+    lists = faiss.InvertedListsPtrVector()
+    lists.push_back(ivf.invlists)
+    invlists.merge_from_multiple(lists.data(), lists.size())
+    invlists.filename = ivfdata_path  # the name write_index records
+    ivf.replace_invlists(invlists, True)
+    invlists.this.disown()
+    os.replace(tmp, ivfdata_path)
+    return index
+
+
+def merge_ivf_blocks(index: faiss.Index, block_paths: List[str], ivfdata_path: str) -> faiss.Index:
+    """
+    Fill the trained, empty IVF `index` with the lists of the block indexes
+    at `block_paths` (each trained from the same index), merged straight into
+    an on-disk `ivfdata_path`. Blocks are memory-mapped, so merging never
+    holds more than the page cache decides to keep.
+    """
+    ivf = faiss.extract_index_ivf(index)
+    blocks = [faiss.read_index(p, faiss.IO_FLAG_MMAP) for p in block_paths]
+    lists = faiss.InvertedListsPtrVector()
+    for block in blocks:
+        lists.push_back(faiss.extract_index_ivf(block).invlists)
+    tmp = ivfdata_path + ".tmp"
+    invlists = faiss.OnDiskInvertedLists(ivf.nlist, ivf.code_size, tmp)
+    ntotal = invlists.merge_from_multiple(lists.data(), lists.size())
+    invlists.filename = ivfdata_path
+    ivf.replace_invlists(invlists, True)
+    invlists.this.disown()
+    ivf.ntotal = index.ntotal = ntotal
+    os.replace(tmp, ivfdata_path)
+    return index
+
+
+def index_nbytes(index: faiss.Index) -> int:
+    return int(faiss.serialize_index(index).nbytes)
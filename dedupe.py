@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+dedupe.py
+
+Collapse near-duplicate chunks before the index is built.
+
+Meeting notes repeat the transcript in their summary section and chunking
+overlaps neighbours, so many chunks say the same thing. Near-duplicates are
+found across and within documents by
+  * MinHash over word shingles, with LSH banding to find candidate pairs;
+    pairs whose estimated Jaccard similarity reaches DEDUP_JACCARD match;
+  * optionally, embedding cosine similarity >= DEDUP_COSINE (0 = off), which
+    also catches paraphrases that share few exact shingles.
+Matches are merged transitively. Each cluster keeps one representative row,
+the longest text with an embedding, and that row's `locations` list points
+to every collapsed source location (source_id, chunk_index, speaker,
+timestamp, date).
+
+Reads the raw row-aligned texts.raw.json, embeddings.raw.npy and
+metadata.raw.json written by load.py and generate_metadata.py, and writes the
+deduplicated texts.json, embeddings.npy and metadata.json that the index and
+query side use, plus postings.json, the chunk store and the token matrix built
+from them, so filters still reach collapsed locations. The raw files are never
+modified, so re-running with other thresholds starts from the full corpus
+again. Embeddings are read and written BATCH_SIZE rows at a time (all-zero
+rows are failed embeddings), except that DEDUP_COSINE loads them all.
+
+Writes the size reduction to dedupe_report.json. Run after
+validate_alignment.py and before save_to_faiss.py.
+"""
+
+import json
+import logging
+import os
+import re
+import zlib
+from collections import defaultdict
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+from filters import POSTINGS_FILE, build_postings, locations, save_postings
+from rerank import TokenMatrix
+from shared_store import CHUNK_STORE_FILE, write_chunk_store
+
+# --- CONFIGURATION ---
+RAW_EMBEDDINGS_FILE = os.getenv("RAW_EMBEDDINGS_FILE", "embeddings.raw.npy")  # written by load.py
+RAW_TEXTS_FILE      = os.getenv("RAW_TEXTS_FILE", "texts.raw.json")           # written by load.py
+RAW_METADATA_FILE   = os.getenv("RAW_METADATA_FILE", "metadata.raw.json")     # written by generate_metadata.py
+EMBEDDINGS_FILE     = os.getenv("EMBEDDINGS_FILE", "embeddings.npy")
+TEXTS_FILE          = os.getenv("TEXTS_FILE", "texts.json")
+METADATA_FILE       = os.getenv("METADATA_FILE", "metadata.json")
+TOKENS_PREFIX       = os.getenv("TOKENS_PREFIX", "tokens")
+REPORT_FILE         = os.getenv("DEDUP_REPORT_FILE", "dedupe_report.json")
+BATCH_SIZE          = int(os.getenv("BATCH_SIZE", "10000"))       # embedding rows read / written at a time
+SHINGLE_SIZE        = int(os.getenv("SHINGLE_SIZE", "5"))         # words per shingle
+NUM_PERM            = int(os.getenv("NUM_PERM", "128"))           # MinHash permutations
+LSH_BANDS           = int(os.getenv("LSH_BANDS", "32"))           # NUM_PERM / LSH_BANDS rows per band
+DEDUP_JACCARD       = float(os.getenv("DEDUP_JACCARD", "0.7"))    # estimated shingle Jaccard to collapse
+DEDUP_COSINE        = float(os.getenv("DEDUP_COSINE", "0"))       # embedding cosine to collapse, 0 = off
+
+MERSENNE_PRIME = (1 << 31) - 1
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+
+# --- MinHash / LSH ---
+def shingles(text: str, size: int = SHINGLE_SIZE) -> np.ndarray:
+    words = re.findall(r"\w+", text.lower())
+    grams = {" ".join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+    return np.array([zlib.crc32(g.encode("utf-8")) % MERSENNE_PRIME for g in grams], dtype="int64")
+
+
+def minhash_signatures(texts: Sequence[str], num_perm: int = NUM_PERM, seed: int = 0) -> np.ndarray:
+    """(texts × num_perm) MinHash signatures under random universal hashes."""
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, MERSENNE_PRIME, num_perm, dtype="int64")
+    b = rng.integers(0, MERSENNE_PRIME, num_perm, dtype="int64")
+    sigs = np.full((len(texts), num_perm), MERSENNE_PRIME, dtype="int64")
+    for row, text in enumerate(texts):
+        x = shingles(text)
+        if len(x):
+            sigs[row] = ((a[:, None] * x[None, :] + b[:, None]) % MERSENNE_PRIME).min(axis=1)
+    return sigs
+
+
+def minhash_pairs(sigs: np.ndarray, bands: int, threshold: float) -> List[tuple]:
+    """Row pairs sharing an LSH band bucket whose estimated Jaccard >= threshold."""
+    rows_per_band = sigs.shape[1] // bands
+    candidates = set()
+    for band in range(bands):
+        buckets: Dict[bytes, List[int]] = defaultdict(list)
+        block = np.ascontiguousarray(sigs[:, band * rows_per_band:(band + 1) * rows_per_band])
+        for row in range(len(sigs)):
+            buckets[block[row].tobytes()].append(row)
+        for members in buckets.values():
+            for i in range(len(members)):
+                for j in range(i + 1, len(members)):
+                    candidates.add((members[i], members[j]))
+    return [(i, j) for i, j in candidates if np.mean(sigs[i] == sigs[j]) >= threshold]
+
+
+def cosine_pairs(embeddings: np.ndarray, has_vec: np.ndarray, threshold: float) -> List[tuple]:
+    """Row pairs whose normalized embeddings have inner product >= threshold."""
+    import faiss
+
+    rows = np.flatnonzero(has_vec).tolist()
+    if not rows:
+        return []
+    mat = np.ascontiguousarray(embeddings[rows], dtype="float32")
+    faiss.normalize_L2(mat)
+    index = faiss.IndexFlatIP(mat.shape[1])
+    index.add(mat)
+    lims, _, labels = index.range_search(mat, threshold)
+    return [(rows[q], rows[int(labels[p])]) for q in range(len(rows))
+            for p in range(lims[q], lims[q + 1]) if int(labels[p]) > q]
+
+
+def clusters_from_pairs(n: int, pairs: Sequence[tuple]) -> List[List[int]]:
+    """Connected components (union-find), each sorted, ordered by first row."""
+    parent = list(range(n))
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for i, j in pairs:
+        ri, rj = find(i), find(j)
+        if ri != rj:
+            parent[max(ri, rj)] = min(ri, rj)
+    groups: Dict[int, List[int]] = defaultdict(list)
+    for row in range(n):
+        groups[find(row)].append(row)
+    return sorted(groups.values(), key=lambda g: g[0])
+
+
+# --- Collapse ---
+def collapse(cluster: List[int], metadata: List[dict], has_vec: Sequence[bool]) -> int:
+    """Pick the representative row: longest text among members with an embedding."""
+    with_vec = [r for r in cluster if has_vec[r]] or cluster
+    return max(with_vec, key=lambda r: (len(metadata[r]["text"]), -r))
+
+
+def merge_cluster(cluster: List[int], rep: int, metadata: List[dict]) -> dict:
+    """
+    The representative's record standing for the whole cluster: its own
+    location first, then every other member's, and the union of speakers.
+    """
+    rec = dict(metadata[rep])
+    if len(cluster) > 1:
+        rec["locations"] = [loc for r in sorted(cluster, key=lambda r: r != rep) for loc in locations(metadata[r])]
+        rec["speakers"] = list(dict.fromkeys(s for r in cluster for s in metadata[r].get("speakers") or []))
+    return rec
+
+
+def main():
+    missing = [p for p in (RAW_METADATA_FILE, RAW_TEXTS_FILE, RAW_EMBEDDINGS_FILE) if not os.path.exists(p)]
+    if missing:
+        logging.error(f"Missing {', '.join(missing)}; run load.py and generate_metadata.py first. Exiting.")
+        exit(1)
+    with open(RAW_METADATA_FILE, "r", encoding="utf-8") as f:
+        metadata = json.load(f)
+    with open(RAW_TEXTS_FILE, "r", encoding="utf-8") as f:
+        texts = json.load(f)
+    embeddings = np.load(RAW_EMBEDDINGS_FILE, mmap_mode="r")
+    if not len(metadata) == len(texts) == len(embeddings):
+        logging.error(f"Row counts differ: {len(metadata)} metadata, {len(texts)} texts, {len(embeddings)} embeddings. Exiting.")
+        exit(1)
+    n, dim = embeddings.shape
+    has_vec = np.zeros(n, dtype=bool)  # all-zero rows are failed embeddings
+    for start in range(0, n, BATCH_SIZE):
+        has_vec[start:start + BATCH_SIZE] = np.any(embeddings[start:start + BATCH_SIZE] != 0, axis=1)
+
+    logging.info(f"MinHash over {n} chunks ({NUM_PERM} permutations, {LSH_BANDS} bands, {SHINGLE_SIZE}-word shingles)")
+    pairs = minhash_pairs(minhash_signatures([m["text"] for m in metadata]), LSH_BANDS, DEDUP_JACCARD)
+    logging.info(f"{len(pairs)} near-duplicate pairs at Jaccard >= {DEDUP_JACCARD}")
+    if DEDUP_COSINE > 0:
+        cos = cosine_pairs(embeddings, has_vec, DEDUP_COSINE)
+        logging.info(f"{len(cos)} near-duplicate pairs at embedding cosine >= {DEDUP_COSINE}")
+        pairs += cos
+    clusters = clusters_from_pairs(n, pairs)
+
+    new_meta, new_texts, reps, collapsed = [], [], [], []
+    for cluster in clusters:
+        rep = collapse(cluster, metadata, has_vec)
+        rec = merge_cluster(cluster, rep, metadata)
+        if len(cluster) > 1:
+            collapsed.append({"kept": rep, "removed": [r for r in cluster if r != rep], "locations": len(rec["locations"])})
+        new_meta.append(rec)
+        new_texts.append(texts[rep])
+        reps.append(rep)
+
+    before, after = int(has_vec.sum()), int(has_vec[reps].sum())
+    report = {
+        "chunks_before": n,
+        "chunks_after": len(new_meta),
+        "clusters_collapsed": len(collapsed),
+        "chunks_removed": n - len(new_meta),
+        "reduction": round(1 - len(new_meta) / n, 4) if n else 0.0,
+        "vector_bytes_before": before * dim * 4,
+        "vector_bytes_after": after * dim * 4,
+        "jaccard_threshold": DEDUP_JACCARD,
+        "cosine_threshold": DEDUP_COSINE,
+        "clusters": collapsed,
+    }
+
+    # --- Save row-aligned outputs, then everything derived from metadata ---
+    tmp = EMBEDDINGS_FILE + ".tmp.npy"
+    out = np.lib.format.open_memmap(tmp, mode="w+", dtype="float32", shape=(len(reps), dim))
+    for start in range(0, len(reps), BATCH_SIZE):
+        out[start:start + BATCH_SIZE] = embeddings[reps[start:start + BATCH_SIZE]]
+    out.flush()
+    del out
+    os.replace(tmp, EMBEDDINGS_FILE)
+    for path, data in ((TEXTS_FILE, new_texts), (METADATA_FILE, new_meta)):
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, path)
+    save_postings(build_postings(new_meta), POSTINGS_FILE)
+    write_chunk_store(new_meta, CHUNK_STORE_FILE)
+    TokenMatrix([m["text"] for m in new_meta]).save(TOKENS_PREFIX)
+
+    with open(REPORT_FILE, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    logging.info(
+        f"✅ Collapsed {report['chunks_removed']} of {n} chunks into {len(collapsed)} representatives "
+        f"({report['reduction']:.1%} smaller index: {report['vector_bytes_before'] / 1e6:.1f} → "
+        f"{report['vector_bytes_after'] / 1e6:.1f} MB of vectors); report in '{REPORT_FILE}'"
+    )
+
+
+if __name__ == "__main__":
+    main()
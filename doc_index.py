@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+doc_index.py
+
+Document-level index for coarse-to-fine retrieval.
+
+Most questions concern one or two meetings, yet a plain search scores every
+chunk of every meeting. This stage gives each document (`source_id`) one
+vector, the re-normalized centroid of its chunk vectors, and stores which
+index rows belong to it (and, inverted, which documents each row belongs
+to, so filters map to documents without a pass over every row). A query
+can then pick the DOC_TOP_K closest documents and score only their rows,
+straight from the row-aligned vectors.npy (ask_osiris.search_rows), so its
+cost grows with the size of a few meetings rather than the whole corpus.
+Rows that dedupe.py collapsed count towards every document they stand for.
+
+Reads the row-aligned vectors.npy written by save_to_faiss.py in batches
+and writes doc_index.index (IndexFlatIP over document centroids, IDs =
+document number) and doc_index.npz (source IDs plus each document's rows).
+"""
+
+import json
+import logging
+import os
+from typing import List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+from filters import locations
+from shared_store import read_index
+
+# --- CONFIGURATION ---
+METADATA_FILE   = os.getenv("METADATA_FILE", "metadata.json")
+VECTORS_FILE    = os.getenv("VECTORS_FILE", "vectors.npy")
+DOC_INDEX_FILE  = os.getenv("DOC_INDEX_FILE", "doc_index.index")
+DOC_ROWS_FILE   = os.getenv("DOC_ROWS_FILE", "doc_index.npz")
+BATCH_SIZE      = int(os.getenv("BATCH_SIZE", "10000"))
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+
+class DocIndex:
+    """Document centroids plus the index rows of every document."""
+
+    def __init__(self, index_file: str = DOC_INDEX_FILE, rows_file: str = DOC_ROWS_FILE):
+        self.index = read_index(index_file)
+        with np.load(rows_file) as f:
+            self.source_ids, self.offsets, self.rows = f["source_ids"], f["offsets"], f["rows"]
+        # Row → documents, CSR-style: documents of row r are docs_by_row[row_offsets[r]:row_offsets[r + 1]]
+        pair_docs = np.repeat(np.arange(len(self.source_ids), dtype="int64"), np.diff(self.offsets))
+        order = np.argsort(self.rows, kind="stable")
+        n_rows = int(self.rows.max()) + 1 if len(self.rows) else 0
+        self.docs_by_row = pair_docs[order]
+        self.row_offsets = np.searchsorted(self.rows[order], np.arange(n_rows + 1)).astype("int64")
+        logging.info(f"Loaded document index with {len(self.source_ids)} documents")
+
+    def __len__(self) -> int:
+        return len(self.source_ids)
+
+    def doc_rows(self, doc: int) -> np.ndarray:
+        return self.rows[self.offsets[doc]:self.offsets[doc + 1]]
+
+    def docs_with(self, ids: np.ndarray) -> np.ndarray:
+        """Documents holding at least one of the row `ids`, in time linear in len(ids)."""
+        ids = np.asarray(ids, dtype="int64")
+        ids = ids[(ids >= 0) & (ids < len(self.row_offsets) - 1)]
+        starts = self.row_offsets[ids]
+        counts = self.row_offsets[ids + 1] - starts
+        # Concatenated ranges starts[i] .. starts[i] + counts[i] - 1
+        pos = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        return np.unique(self.docs_by_row[pos])
+
+    def search(
+        self, q_vec: np.ndarray, top_docs: int, ids: Optional[np.ndarray] = None
+    ) -> Tuple[List[float], List[int], np.ndarray]:
+        """
+        The `top_docs` closest documents (restricted to those holding rows in
+        `ids`) and the sorted candidate rows they contain, also within `ids`.
+        """
+        if ids is None:
+            D, I = self.index.search(q_vec, min(top_docs, len(self)))
+        else:
+            docs = self.docs_with(ids)
+            if not len(docs):
+                return [], [], np.empty(0, dtype="int64")
+            params = faiss.SearchParameters(sel=faiss.IDSelectorBatch(docs))
+            D, I = self.index.search(q_vec, min(top_docs, len(docs)), params=params)
+        hits = [(s, d) for s, d in zip(D[0].tolist(), I[0].tolist()) if d >= 0]
+        rows = np.unique(np.concatenate([self.doc_rows(d) for _, d in hits])) if hits else np.empty(0, dtype="int64")
+        if ids is not None:
+            rows = np.intersect1d(rows, ids, assume_unique=True)
+        return [s for s, _ in hits], [d for _, d in hits], rows
+
+
+def document_rows(metadata: List[dict], n_rows: int) -> Tuple[List[str], List[List[int]]]:
+    """Source IDs in first-seen order and, for each, the rows standing for one of its chunks."""
+    rows_by_doc = {}
+    for row in range(n_rows):
+        for source in dict.fromkeys(loc.get("source_id") or "unknown" for loc in locations(metadata[row])):
+            rows_by_doc.setdefault(source, []).append(row)
+    return list(rows_by_doc), list(rows_by_doc.values())
+
+
+def main():
+    with open(METADATA_FILE, "r", encoding="utf-8") as f:
+        metadata = json.load(f)
+    vectors = np.load(VECTORS_FILE, mmap_mode="r")
+    n, dim = vectors.shape
+    if len(metadata) < n:
+        logging.error(f"'{METADATA_FILE}' has {len(metadata)} rows for {n} vectors. Exiting.")
+        exit(1)
+    source_ids, doc_rows = document_rows(metadata, n)
+
+    # (row, document) pairs sorted by row; centroids are summed batch by batch,
+    # so the vector file is never fully loaded
+    pair_rows = np.concatenate([np.asarray(r, dtype="int64") for r in doc_rows])
+    pair_docs = np.repeat(np.arange(len(doc_rows), dtype="int64"), [len(r) for r in doc_rows])
+    order = np.argsort(pair_rows, kind="stable")
+    pair_rows, pair_docs = pair_rows[order], pair_docs[order]
+    sums = np.zeros((len(source_ids), dim), dtype="float64")
+    for start in range(0, n, BATCH_SIZE):
+        batch = np.asarray(vectors[start:start + BATCH_SIZE], dtype="float32")
+        lo, hi = np.searchsorted(pair_rows, [start, start + len(batch)])
+        np.add.at(sums, pair_docs[lo:hi], batch[pair_rows[lo:hi] - start])
+    centroids = np.ascontiguousarray(sums, dtype="float32")
+    faiss.normalize_L2(centroids)
+
+    index = faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+    index.add_with_ids(centroids, np.arange(len(source_ids), dtype="int64"))
+    tmp = DOC_INDEX_FILE + ".tmp"
+    faiss.write_index(index, tmp)
+    os.replace(tmp, DOC_INDEX_FILE)
+
+    offsets = np.cumsum([0] + [len(r) for r in doc_rows]).astype("int64")
+    tmp = DOC_ROWS_FILE + ".tmp.npz"
+    np.savez(tmp, source_ids=np.array(source_ids), offsets=offsets,
+             rows=np.concatenate([np.asarray(r, dtype="int64") for r in doc_rows]))
+    os.replace(tmp, DOC_ROWS_FILE)
+
+    sizes = [len(r) for r in doc_rows]
+    logging.info(f"✅ Saved {len(source_ids)} document centroids to '{DOC_INDEX_FILE}' "
+                 f"({min(sizes)}–{max(sizes)} chunks per document, mean {np.mean(sizes):.1f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+filters.py
+
+Postings index from speaker, meeting date and source_id to metadata row IDs,
+used to restrict FAISS search to the matching subset of chunks.
+
+Filters are plain dicts:
+    {"speaker": "Mack Myers", "date": "2025-06-06", "source_id": "1e2Z..."}
+Each value may be a single value or a list (rows matching any of them);
+`date_from` / `date_to` give an inclusive YYYY-MM-DD range. Different keys
+are combined with AND.
+"""
+
+import json
+import os
+import re
+from typing import Dict, List, Optional
+
+import numpy as np
+
+POSTINGS_FILE = os.getenv("POSTINGS_FILE", "postings.json")
+FIELDS          = ("speaker", "date", "source_id")
+LOCATION_FIELDS = ("source_id", "chunk_index", "speaker", "timestamp", "date")
+
+
+def normalize_speaker(name: str) -> str:
+    return re.sub(r"\s+", " ", name or "").strip().lower()
+
+
+def locations(rec: dict) -> List[dict]:
+    """Source locations a metadata row stands for (its own, plus any collapsed into it by dedupe.py)."""
+    return rec.get("locations") or [{field: rec.get(field) for field in LOCATION_FIELDS}]
+
+
+def build_postings(metadata: List[dict]) -> Dict[str, Dict[str, List[int]]]:
+    """
+    Map each speaker, date and source_id to the sorted row IDs it occurs in.
+    Rows that stand for collapsed near-duplicates (see dedupe.py) are posted
+    under every one of their `locations`.
+    """
+    postings = {field: {} for field in FIELDS}
+    for row, rec in enumerate(metadata):
+        locs = locations(rec)
+        speakers = (rec.get('speakers') or [rec.get('speaker')]) + [loc.get('speaker') for loc in locs[1:]]
+        for name in dict.fromkeys(normalize_speaker(n) for n in speakers if n and n != "Unknown"):
+            postings['speaker'].setdefault(name, []).append(row)
+        for field in ('date', 'source_id'):
+            for value in dict.fromkeys(loc.get(field) for loc in locs):
+                if value:
+                    postings[field].setdefault(value, []).append(row)
+    return postings
+
+
+def save_postings(postings: dict, path: str = POSTINGS_FILE):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(postings, f)
+    os.replace(tmp, path)
+
+
+def load_postings(path: str = POSTINGS_FILE) -> Optional[dict]:
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _as_list(value) -> list:
+    return list(value) if isinstance(value, (list, tuple, set)) else [value]
+
+
+def select_ids(postings: dict, filters: Optional[dict]) -> Optional[np.ndarray]:
+    """
+    Resolve `filters` to the sorted int64 row IDs that satisfy all of them.
+
+    Returns None when no known filter is set (search everything) and an
+    empty array when the filters match nothing.
+    """
+    if not filters:
+        return None
+    selected = None
+
+    def narrow(rows):
+        nonlocal selected
+        rows = np.unique(np.asarray(rows, dtype="int64"))
+        selected = rows if selected is None else np.intersect1d(selected, rows, assume_unique=True)
+
+    if filters.get('speaker'):
+        names = [normalize_speaker(n) for n in _as_list(filters['speaker'])]
+        narrow([row for n in names for row in postings['speaker'].get(n, [])])
+    if filters.get('source_id'):
+        narrow([row for s in _as_list(filters['source_id']) for row in postings['source_id'].get(s, [])])
+    if filters.get('date'):
+        narrow([row for d in _as_list(filters['date']) for row in postings['date'].get(d, [])])
+    if filters.get('date_from') or filters.get('date_to'):
+        lo, hi = filters.get('date_from') or "0000-00-00", filters.get('date_to') or "9999-99-99"
+        narrow([row for d, rows in postings['date'].items() if lo <= d <= hi for row in rows])
+
+    return selected
+
+
+def infer_filters(question: str, postings: dict) -> Optional[dict]:
+    """Return a speaker filter for any known full speaker name in the question."""
+    q = normalize_speaker(question)
+    names = [n for n in postings['speaker'] if re.search(rf"\b{re.escape(n)}\b", q)]
+    return {"speaker": names} if names else None
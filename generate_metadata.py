@@ -3,8 +3,11 @@
 generate_metadata.py
 
 1. Reads latest transcripts_*.jsonl
-2. Extracts speaker, timestamp, and text from each chunk
-3. Saves a consolidated metadata.json with environment overrides and logging
+2. Extracts speaker, timestamp, meeting date, and text from each chunk
+3. Saves a consolidated metadata.raw.json with environment overrides and logging
+
+dedupe.py turns it into the served metadata.json and builds postings.json, the
+memory-mapped chunk store and the keyword token matrix from that.
 """
 
 import os
@@ -12,8 +15,10 @@ import json
 import logging
 from pathlib import Path
 
+from turns import annotate_chunks, extract_meeting_date
+
 # === CONFIGURATION ===
-OUTPUT_FILE = os.getenv('OUTPUT_FILE', 'metadata.json')
+OUTPUT_FILE = os.getenv('RAW_METADATA_FILE', 'metadata.raw.json')
 
 # --- Logging Setup ---
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
@@ -52,10 +57,18 @@ def main():
                 logging.warning(f"⚠️ Line {line_num} has invalid 'chunks' format. Skipping.")
                 continue
 
+            # Transcripts written before tst.py tracked speaker turns: derive them here
+            texts = [chunk.get('text', '') for chunk in chunks]
+            if chunks and 'speaker' not in chunks[0]:
+                chunks = [{**chunk, **turns} for chunk, turns in zip(chunks, annotate_chunks(texts))]
+            meeting_date = entry.get('meeting_date') or extract_meeting_date(texts[0] if texts else '', entry.get('file_name', ''))
+
             for i, chunk in enumerate(chunks):
                 metadata.append({
                     'speaker': chunk.get('speaker', 'Unknown'),
+                    'speakers': chunk.get('speakers', []),
                     'timestamp': chunk.get('timestamp', ''),
+                    'date': meeting_date,
                     'text': chunk.get('text', ''),
                     'source_id': entry.get('file_id', None),  # updated to match fetch_and_chunk.py
                     'chunk_index': i
@@ -4,22 +4,24 @@
 import os
 import sys
 import json
-import pickle
 import logging
 import time
 from pathlib import Path
+
+import numpy as np
 from tqdm import tqdm
 
-from google.cloud import aiplatform
-from vertexai.language_models import TextEmbeddingModel
+from backends import get_embedder
 
 # --- CONFIGURATION ---
-PROJECT_ID       = os.getenv("PROJECT_ID", "global-cloud-runtime")
-REGION           = os.getenv("REGION", "us-central1")
-EMBEDDINGS_FILE  = os.getenv("EMBEDDINGS_FILE", "embeddings.pkl")
-TEXTS_FILE       = os.getenv("TEXTS_FILE", "texts.json")
+# Raw, row-aligned outputs; dedupe.py reads them and writes the files the index is built from.
+# Embeddings are float32 rows written as they arrive (all zeros where embedding failed).
+RAW_EMBEDDINGS_FILE = os.getenv("RAW_EMBEDDINGS_FILE", "embeddings.raw.npy")
+RAW_TEXTS_FILE      = os.getenv("RAW_TEXTS_FILE", "texts.raw.json")
+FLUSH_ROWS          = int(os.getenv("FLUSH_ROWS", "1000"))
 MODEL_NAME       = os.getenv("EMBED_MODEL", "gemini-embedding-001")
 RETRY_COUNT      = int(os.getenv("RETRY_COUNT", "3"))
+OUTPUT_DIM       = int(os.getenv("OUTPUT_DIM", "0"))  # request reduced-width embeddings, 0 = model default
 
 # --- LOGGING SETUP ---
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
@@ -44,30 +46,46 @@ def load_chunks(jsonl_path):
     return chunks
 
 
-def embed_texts(model, texts):
+def embed_text(embedder, text):
+    """Embedding of one text with retries, or None."""
+    for attempt in range(1, RETRY_COUNT + 1):
+        try:
+            return embedder.embed([text], OUTPUT_DIM)[0]
+        except Exception as e:
+            logging.warning(f"Attempt {attempt} failed: {e}")
+            if attempt < RETRY_COUNT:
+                time.sleep(attempt)
+    logging.error(f"Failed after {RETRY_COUNT} attempts: {text[:60]}...")
+    return None
+
+
+def embed_texts(embedder, texts):
     """Get embeddings for a list of texts with retries."""
-    embeddings = []
-    for text in tqdm(texts, desc="Embedding", unit="chunk"):
-        for attempt in range(1, RETRY_COUNT + 1):
-            try:
-                result = model.get_embeddings([text])
-                embeddings.append(result[0].values)
-                break
-            except Exception as e:
-                logging.warning(f"Attempt {attempt} failed: {e}")
-                if attempt == RETRY_COUNT:
-                    logging.error(f"Failed after {RETRY_COUNT} attempts: {text[:60]}...")
-                    embeddings.append(None)
-                else:
-                    time.sleep(attempt)
-    return embeddings
-
-
-def save_pickle(data, path):
-    tmp = path + ".tmp"
-    with open(tmp, "wb") as f:
-        pickle.dump(data, f)
+    return [embed_text(embedder, text) for text in tqdm(texts, desc="Embedding", unit="chunk")]
+
+
+def embed_to_npy(embedder, texts, path) -> int:
+    """
+    Embed `texts` straight into a row-aligned float32 .npy, so memory does not
+    grow with the corpus. Failed rows stay zero. Returns the valid row count.
+    """
+    tmp, out, valid = path + ".tmp.npy", None, 0
+    for row, text in enumerate(tqdm(texts, desc="Embedding", unit="chunk")):
+        vec = embed_text(embedder, text)
+        if vec is None:
+            continue
+        if out is None:  # the width is known once the first embedding arrives
+            out = np.lib.format.open_memmap(tmp, mode="w+", dtype="float32", shape=(len(texts), len(vec)))
+        out[row] = vec
+        valid += 1
+        if valid % FLUSH_ROWS == 0:
+            out.flush()
+    if out is None:
+        return 0
+    out.flush()
+    del out
     os.replace(tmp, path)
+    return valid
 
 
 def save_json(data, path):
@@ -88,25 +106,25 @@ def main():
 
     logging.info(f"📥 Loading from {input_file}")
 
-    # --- Init Vertex AI ---
-    aiplatform.init(project=PROJECT_ID, location=REGION)
-    model = TextEmbeddingModel.from_pretrained(MODEL_NAME)
+    # --- Init embedder (Vertex AI unless OSIRIS_EMBEDDER says otherwise) ---
+    embedder = get_embedder(MODEL_NAME)
 
     # --- Load Chunks ---
     texts = load_chunks(input_file)
     logging.info(f"Loaded {len(texts)} text chunks")
 
     # --- Embed ---
-    embeddings = embed_texts(model, texts)
-    valid_count = sum(1 for e in embeddings if e is not None)
+    valid_count = embed_to_npy(embedder, texts, RAW_EMBEDDINGS_FILE)
+    if not valid_count:
+        logging.error("No text chunk could be embedded. Exiting.")
+        sys.exit(1)
     logging.info(f"Generated {valid_count} valid embeddings")
+    logging.info(f"Saved embeddings to {RAW_EMBEDDINGS_FILE}")
 
     # --- Save Results ---
-    save_pickle(embeddings, EMBEDDINGS_FILE)
-    logging.info(f"Saved embeddings to {EMBEDDINGS_FILE}")
 
-    save_json(texts, TEXTS_FILE)
-    logging.info(f"Saved text chunks to {TEXTS_FILE}")
+    save_json(texts, RAW_TEXTS_FILE)
+    logging.info(f"Saved text chunks to {RAW_TEXTS_FILE}")
 
     logging.info(f"✅ Completed in {time.time() - start:.2f}s")
 
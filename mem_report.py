@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+mem_report.py
+
+Per-worker memory report for the serving artifacts.
+
+For each mode (shared = memory-mapped index, chunk store and token matrix;
+private = regular reads into process memory) and each worker count, spawns
+that many processes that load the artifacts exactly as ask_osiris.py does
+(without Vertex AI), touch every page through searches and a full scan of
+the chunk records, then read /proc/self/smaps_rollup while all workers are
+still alive. Pss splits shared pages between the processes mapping them, so
+the sum over workers is the real footprint: with shared artifacts it should
+stay roughly flat as workers are added, with private copies it grows by a
+full index per worker.
+
+Linux only. Writes a table to stdout and the rows to mem_report.json.
+"""
+
+import json
+import logging
+import multiprocessing as mp
+import os
+import time
+
+import numpy as np
+
+from compression import truncate_and_normalize
+from rerank import TokenMatrix
+from shared_store import load_metadata, read_index
+
+# --- CONFIGURATION ---
+FAISS_INDEX   = os.getenv("FAISS_INDEX_FILE", "faiss_index.index")
+METADATA_FILE = os.getenv("METADATA_FILE", "metadata.json")
+TOKENS_PREFIX = os.getenv("TOKENS_PREFIX", "tokens")
+REPORT_FILE   = os.getenv("REPORT_FILE", "mem_report.json")
+WORKER_COUNTS = [int(n) for n in os.getenv("WORKER_COUNTS", "1,2,4").split(",")]
+MODES         = os.getenv("MODES", "shared,private").split(",")
+NUM_QUERIES   = int(os.getenv("NUM_QUERIES", "32"))
+SEARCH_K      = 100
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+
+def smaps_rollup() -> dict:
+    """Memory counters of the calling process, in kB."""
+    fields = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1])
+    return {
+        "rss_kb": fields.get("Rss", 0),
+        "pss_kb": fields.get("Pss", 0),
+        "shared_kb": fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0),
+        "private_kb": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+    }
+
+
+def worker(mode: str, ready, done, results):
+    shared = mode == "shared"
+    before = smaps_rollup()
+
+    index = read_index(FAISS_INDEX, shared=shared)
+    metadata = load_metadata(METADATA_FILE, shared=shared)
+    if TokenMatrix.exists(TOKENS_PREFIX):
+        tokens = TokenMatrix.load(TOKENS_PREFIX, mmap=shared)
+    else:
+        tokens = TokenMatrix([m["text"] for m in metadata])
+
+    # Touch what serving touches: searches over the index, every record, the whole token matrix
+    rng = np.random.default_rng(os.getpid())
+    queries = truncate_and_normalize(rng.standard_normal((NUM_QUERIES, index.d)).astype("float32"))
+    index.search(queries, min(SEARCH_K, index.ntotal))
+    n_chars = sum(len(rec["text"]) for rec in metadata)
+    tokens.matrix.sum()
+
+    ready.wait()  # every worker loaded: measure while all mappings are live
+    after = smaps_rollup()
+    results.put({
+        "mode": mode,
+        "pid": os.getpid(),
+        "chunks": len(metadata),
+        "chars": n_chars,
+        **after,
+        "private_delta_kb": after["private_kb"] - before["private_kb"],
+    })
+    done.wait()
+
+
+def run(mode: str, workers: int) -> dict:
+    ctx = mp.get_context("spawn")
+    ready, done, results = ctx.Barrier(workers), ctx.Barrier(workers + 1), ctx.Queue()
+    procs = [ctx.Process(target=worker, args=(mode, ready, done, results)) for _ in range(workers)]
+    start = time.perf_counter()
+    for p in procs:
+        p.start()
+    rows = [results.get() for _ in procs]
+    done.wait()
+    for p in procs:
+        p.join()
+    return {
+        "mode": mode,
+        "workers": workers,
+        "load_s": time.perf_counter() - start,
+        "total_pss_mb": sum(r["pss_kb"] for r in rows) / 1024,
+        "per_worker": rows,
+    }
+
+
+def main():
+    report = []
+    for mode in MODES:
+        for workers in WORKER_COUNTS:
+            logging.info(f"Measuring {workers} worker(s) with {mode} artifacts")
+            report.append(run(mode, workers))
+
+    print(f"\n{'mode':>8} {'workers':>7} {'total PSS MB':>12} {'RSS MB/wkr':>10} {'shared MB/wkr':>13} "
+          f"{'private MB/wkr':>14} {'+MB/worker':>10}")
+    prev = {}
+    for r in report:
+        rows = r["per_worker"]
+        mean = lambda key: sum(w[key] for w in rows) / len(rows) / 1024
+        last = prev.get(r["mode"])
+        marginal = (r["total_pss_mb"] - last["total_pss_mb"]) / (r["workers"] - last["workers"]) if last else float("nan")
+        prev[r["mode"]] = r
+        print(f"{r['mode']:>8} {r['workers']:>7} {r['total_pss_mb']:>12.1f} {mean('rss_kb'):>10.1f} "
+              f"{mean('shared_kb'):>13.1f} {mean('private_kb'):>14.1f} {marginal:>10.1f}")
+
+    with open(REPORT_FILE, "w") as f:
+        json.dump(report, f, indent=2)
+    logging.info(f"Saved report to '{REPORT_FILE}'")
+
+
+if __name__ == "__main__":
+    main()
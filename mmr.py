@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+mmr.py
+
+Maximal Marginal Relevance selection over candidate chunk vectors.
+
+Overlapping chunk windows make the top reranked hits near-duplicates of
+each other. MMR picks, one at a time, the candidate maximising
+
+    lambda * relevance(c) - (1 - lambda) * max_{s in selected} cos(c, s)
+
+so lambda=1 reproduces the relevance order and lower values trade
+relevance for diversity. The candidate similarity matrix is computed once;
+each step is a vectorized argmax over a running max-similarity vector.
+"""
+
+from typing import List
+
+import numpy as np
+
+
+def normalize_rows(vecs: np.ndarray) -> np.ndarray:
+    vecs = np.asarray(vecs, dtype="float32")
+    norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+    return vecs / np.maximum(norms, 1e-12)
+
+
+def redundancy(vecs: np.ndarray) -> float:
+    """Mean pairwise cosine similarity between normalized rows (0 for < 2 rows)."""
+    n = len(vecs)
+    if n < 2:
+        return 0.0
+    sim = vecs @ vecs.T
+    return float((sim.sum() - np.trace(sim)) / (n * (n - 1)))
+
+
+def mmr_select(relevance: np.ndarray, vecs: np.ndarray, k: int, lambda_: float) -> List[int]:
+    """
+    Return the positions of `k` candidates in MMR selection order.
+
+    `relevance` are the candidates' scores (higher is better) and `vecs`
+    their normalized vectors, row-aligned.
+    """
+    relevance = np.asarray(relevance, dtype="float32")
+    n = len(relevance)
+    k = min(k, n)
+    if k == 0:
+        return []
+    sim = vecs @ vecs.T
+    # Relevance rescaled to [0, 1] so lambda weighs it against cosine on the same scale
+    spread = relevance.max() - relevance.min()
+    rel = (relevance - relevance.min()) / spread if spread > 0 else np.ones(n, dtype="float32")
+
+    selected = [int(np.argmax(rel))]
+    max_sim = sim[selected[0]].copy()
+    available = np.ones(n, dtype=bool)
+    available[selected[0]] = False
+    for _ in range(k - 1):
+        mmr = lambda_ * rel - (1 - lambda_) * max_sim
+        mmr[~available] = -np.inf
+        pick = int(np.argmax(mmr))
+        selected.append(pick)
+        available[pick] = False
+        np.maximum(max_sim, sim[pick], out=max_sim)
+    return selected
@@ -4,15 +4,37 @@ run_pipeline.py
 
 Orchestrates the full preprocessing & indexing pipeline:
 1. tst.py                   → Fetch + chunk GDocs into JSONL
-2. load.py                  → Embed text chunks into embeddings.pkl and texts.json
-3. generate_metadata.py     → Extract speaker/timestamp/text into metadata.json
-4. validate_alignment.py    → Ensure texts.json and metadata.json line up
-5. save_to_faiss.py         → Build & save FAISS index (faiss_index.index + .meta.json)
+2. load.py                  → Embed text chunks into embeddings.raw.npy and texts.raw.json
+3. generate_metadata.py     → Extract speaker/timestamp/date/text into metadata.raw.json
+4. validate_alignment.py    → Ensure texts.raw.json and metadata.raw.json line up
+5. dedupe.py                → Collapse near-duplicates from the raw files into embeddings.npy,
+                              texts.json, metadata.json + postings.json (dedupe_report.json)
+6. save_to_faiss.py         → Build & save FAISS index (faiss_index.index + .meta.json)
+7. doc_index.py             → Per-document centroid index for coarse-to-fine search
+8. small_to_big.py          → Fine-grained turn/sentence index (only with SMALL_TO_BIG=True)
+
+With PROFILE=True every stage runs under profiler.py and the run writes
+profiles/<run id>/profile.json + profile.html (wall, CPU, peak RSS,
+tracemalloc top allocators; cProfile dumps with PROFILE_CPROFILE=True).
 """
 
+import json
+import os
 import subprocess
 import sys
 import logging
+from datetime import datetime
+
+from profiler import write_report
+
+# --- Profiling mode ---
+PROFILE          = os.getenv("PROFILE", "False").lower() == "true"
+PROFILE_CPROFILE = os.getenv("PROFILE_CPROFILE", "False").lower() == "true"
+PROFILE_DIR      = os.getenv("PROFILE_DIR", "profiles")
+RUN_ID           = os.getenv("RUN_ID") or datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+
+# --- Optional stages ---
+SMALL_TO_BIG     = os.getenv("SMALL_TO_BIG", "False").lower() == "true"
 
 # --- Setup logging ---
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
@@ -23,20 +45,55 @@ PIPELINE_SCRIPTS = [
     ("2. Generating Embeddings",     "load.py"),
     ("3. Generating Metadata",       "generate_metadata.py"),
     ("4. Validating Alignment",      "validate_alignment.py"),
-    ("5. Saving to FAISS Index",     "save_to_faiss.py"),
+    ("5. Collapsing Near-Duplicates", "dedupe.py"),
+    ("6. Saving to FAISS Index",     "save_to_faiss.py"),
+    ("7. Building Document Index",   "doc_index.py"),
 ]
+if SMALL_TO_BIG:
+    PIPELINE_SCRIPTS.append(("8. Building Fine-Grained Index", "small_to_big.py"))
 
-def run_script(description: str, script: str):
+def run_script(description: str, script: str, profile_dir: str = None) -> dict:
     logging.info(f"\n🚀 {description} → {script}")
-    result = subprocess.run([sys.executable, script])
+    stage = None
+    if profile_dir:
+        name = os.path.splitext(script)[0]
+        stage_file = os.path.join(profile_dir, f"{name}.json")
+        cmd = [sys.executable, "profiler.py", "--out", stage_file]
+        if PROFILE_CPROFILE:
+            cmd += ["--cprofile", os.path.join(profile_dir, f"{name}.prof")]
+        result = subprocess.run(cmd + [script])
+        if os.path.exists(stage_file):
+            with open(stage_file, "r", encoding="utf-8") as f:
+                stage = {"stage": description, **json.load(f)}
+    else:
+        result = subprocess.run([sys.executable, script])
     if result.returncode != 0:
         logging.error(f"❌ Failed during: {description}")
-        sys.exit(result.returncode)
+        return {"stage": description, "script": script, "exit_code": result.returncode, **(stage or {})}
     logging.info(f"✅ Completed: {description}")
+    return stage
 
 def main():
+    profile_dir = os.path.join(PROFILE_DIR, RUN_ID) if PROFILE else None
+    if profile_dir:
+        os.makedirs(profile_dir, exist_ok=True)
+    stages = []
     for description, script in PIPELINE_SCRIPTS:
-        run_script(description, script)
+        stage = run_script(description, script, profile_dir)
+        if stage:
+            stages.append(stage)
+        if stage and stage.get("exit_code"):
+            break
+    if profile_dir:
+        json_path, html_path = os.path.join(profile_dir, "profile.json"), os.path.join(profile_dir, "profile.html")
+        report = write_report(RUN_ID, stages, json_path, html_path)
+        for s in stages:
+            logging.info(f"⏱️ {s['stage']}: wall {s.get('wall_s')}s, cpu {s.get('cpu_user_s')}+{s.get('cpu_system_s')}s, "
+                         f"peak RSS {s.get('peak_rss_mb')} MB")
+        logging.info(f"📊 Profile of {report['total_wall_s']}s run written to '{json_path}' and '{html_path}'")
+    failed = next((s for s in stages if s.get("exit_code")), None)
+    if failed:
+        sys.exit(failed["exit_code"])
     logging.info("\n🎉 All preprocessing and indexing steps completed successfully.")
 
 if __name__ == "__main__":
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+osiris_server.py
+
+HTTP query service around the ask_osiris engine, so the FAISS index,
+metadata and model clients are loaded once per server and shared by any
+number of Streamlit (or other) front-ends.
+
+Endpoints (JSON bodies):
+    POST /retrieve        {"question", "filters"?, "limit"?, "packed"?} → {"passages": [...]}
+                          retrieval only, no generation; packed (default) passages
+                          carry the best-matching turn as "snippet", see ask_osiris.lookup
+    POST /answer          {"conversation" | "question", "filters"?, "temperature"?, "retrieve_only"?,
+                           "user"?, "priority"?}
+                          → {"answer"}; retrieve_only=true answers with passages only,
+                          unset leaves it to the ROUTE_LOOKUPS heuristic; user (default:
+                          client address) and priority ("normal" | "low") feed the
+                          generation scheduler
+    POST /answer/stream   same body as /answer; Server-Sent Events, one
+                          `data: {"text": ...}` event per chunk, then `event: done`
+    GET  /healthz
+    GET  /metrics         per-stage latency histograms, Prometheus text format
+
+Engine calls run on a bounded worker pool (SERVER_WORKERS); requests beyond
+that wait for a free worker rather than piling onto the models. With
+GEN_SCHEDULER=True generation is further limited to GEN_MAX_CONCURRENCY and
+queued fairly per user, so SERVER_WORKERS should be larger than that: the
+pool's own queue is first come, first served. A request not answered within
+REQUEST_TIMEOUT gets a 504 (an `event: error` frame on a stream), and a
+stream whose client goes away stops generating at its next chunk.
+
+Usage: python osiris_server.py   (HOST / PORT / SERVER_WORKERS env overrides)
+"""
+
+import json
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from flask import Flask, Response, jsonify, request
+
+import ask_osiris
+from tracing import Trace, render_metrics
+
+# --- CONFIGURATION ---
+HOST            = os.getenv("HOST", "0.0.0.0")
+PORT            = int(os.getenv("PORT", "8080"))
+SERVER_WORKERS  = int(os.getenv("SERVER_WORKERS", "8"))
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", "120"))
+
+app  = Flask(__name__)
+pool = ThreadPoolExecutor(max_workers=SERVER_WORKERS, thread_name_prefix="osiris-worker")
+
+_STREAM_END = object()
+
+
+def _conversation(body: dict):
+    return body.get("conversation") or body.get("question") or None
+
+
+def _scheduling(body: dict) -> dict:
+    return {"user": body.get("user") or request.remote_addr, "priority": body.get("priority") or "normal"}
+
+
+def _bad_request(message: str):
+    return jsonify({"error": message}), 400
+
+
+def _timeout_message() -> str:
+    return f"no response within {REQUEST_TIMEOUT:g}s"
+
+
+def _result(future):
+    """The worker's result, or None after REQUEST_TIMEOUT (a still-queued job is dropped)."""
+    try:
+        return future.result(timeout=REQUEST_TIMEOUT)
+    except FutureTimeout:
+        future.cancel()
+        return None
+
+
+@app.get("/healthz")
+def healthz():
+    return jsonify({"status": "ok", "chunks": ask_osiris.index.ntotal})
+
+
+@app.get("/metrics")
+def metrics():
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
+@app.post("/retrieve")
+def retrieve():
+    body = request.get_json(silent=True) or {}
+    question = body.get("question")
+    if not question:
+        return _bad_request("'question' is required")
+    limit = ask_osiris.LOOKUP_PASSAGES if body.get("limit") is None else body["limit"]
+    if isinstance(limit, bool) or not isinstance(limit, int) or limit < 1:
+        return _bad_request("'limit' must be a positive integer")
+    trace = Trace(question, mode="retrieve")
+    if body.get("packed", True):
+        future = pool.submit(ask_osiris.lookup, question, body.get("filters"), trace, limit)
+    else:
+        future = pool.submit(ask_osiris.retrieve, question, body.get("filters"), trace)
+    result = _result(future)
+    if result is None:
+        trace.finish("timeout")
+        return jsonify({"error": _timeout_message()}), 504
+    if not body.get("packed", True):
+        result = [ask_osiris.passage(score, idx) for score, idx in result]
+    trace.finish()
+    return jsonify({"passages": result})
+
+
+@app.post("/answer")
+def answer():
+    body = request.get_json(silent=True) or {}
+    conversation = _conversation(body)
+    if conversation is None:
+        return _bad_request("'conversation' or 'question' is required")
+    future = pool.submit(
+        ask_osiris.answer_question, conversation,
+        temperature=body.get("temperature"), filters=body.get("filters"), retrieve_only=body.get("retrieve_only"),
+        **_scheduling(body),
+    )
+    answer = _result(future)
+    if answer is None:
+        return jsonify({"error": _timeout_message()}), 504
+    return jsonify({"answer": answer})
+
+
+@app.post("/answer/stream")
+def answer_stream():
+    body = request.get_json(silent=True) or {}
+    conversation = _conversation(body)
+    if conversation is None:
+        return _bad_request("'conversation' or 'question' is required")
+
+    # The generation runs on a pool worker; chunks are handed to the
+    # response generator through a queue so the pool bounds concurrency.
+    # `stop` is set once the response ends for any reason (done, timeout,
+    # client gone), and the worker then abandons the answer at its next chunk.
+    chunks = queue.Queue()
+    stop = threading.Event()
+    scheduling = _scheduling(body)  # request context is gone on the worker
+
+    def produce():
+        answer = ask_osiris.stream_answer(
+            conversation, temperature=body.get("temperature"), filters=body.get("filters"),
+            retrieve_only=body.get("retrieve_only"), **scheduling,
+        )
+        try:
+            for text in answer:
+                if stop.is_set():
+                    break
+                chunks.put(text)
+        except Exception as e:
+            logging.error(f"Streaming answer failed: {e}")
+            chunks.put(e)
+        finally:
+            answer.close()  # traces the answer as cancelled and frees its generation slot
+            chunks.put(_STREAM_END)
+
+    pool.submit(produce)
+
+    def events():
+        try:
+            while True:
+                try:
+                    item = chunks.get(timeout=REQUEST_TIMEOUT)
+                except queue.Empty:
+                    yield f"event: error\ndata: {json.dumps({'error': _timeout_message()})}\n\n"
+                    return
+                if item is _STREAM_END:
+                    yield "event: done\ndata: {}\n\n"
+                    return
+                if isinstance(item, Exception):
+                    yield f"event: error\ndata: {json.dumps({'error': str(item)})}\n\n"
+                    continue
+                yield f"data: {json.dumps({'text': item})}\n\n"
+        finally:
+            stop.set()
+
+    return Response(events(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+if __name__ == "__main__":
+    logging.info(f"🚀 Osiris query service on {HOST}:{PORT} with {SERVER_WORKERS} workers")
+    app.run(host=HOST, port=PORT, threaded=True)
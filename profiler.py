@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+profiler.py
+
+Per-stage profiling for the preprocessing pipeline.
+
+orchestrator.py (with PROFILE=True) runs every stage script through this
+module instead of plain `python script.py`. In the stage's own process it
+records
+  * wall time, user + system CPU time and peak RSS (getrusage);
+  * the top allocation sites near peak traced memory, from tracemalloc
+    snapshots taken by a sampler thread whenever a new peak is seen;
+  * optionally a cProfile dump (.prof, open with snakeviz / pstats) and the
+    top functions by cumulative time;
+and writes them to a stage JSON. write_report() merges the stage files into
+one JSON + HTML report per run, with the same schema every run so reports
+can be diffed or loaded side by side.
+
+tracemalloc slows allocation-heavy stages noticeably; PROFILE_TRACEMALLOC=False
+keeps timings closer to an unprofiled run.
+
+Usage (what orchestrator.py does):
+    python profiler.py --out stage.json [--cprofile stage.prof] script.py
+"""
+
+import argparse
+import cProfile
+import html
+import json
+import os
+import platform
+import pstats
+import resource
+import runpy
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import List
+
+# --- CONFIGURATION ---
+PROFILE_TRACEMALLOC = os.getenv("PROFILE_TRACEMALLOC", "True").lower() == "true"
+TRACEMALLOC_TOP     = int(os.getenv("TRACEMALLOC_TOP", "10"))
+CPROFILE_TOP        = int(os.getenv("CPROFILE_TOP", "15"))
+SAMPLE_INTERVAL_S   = float(os.getenv("PROFILE_SAMPLE_INTERVAL_S", "0.25"))
+
+# Import machinery would otherwise top every stage's allocation list
+IMPORT_FILTERS = [
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+]
+
+
+class PeakSampler(threading.Thread):
+    """Keeps the tracemalloc snapshot taken at the highest traced memory seen."""
+
+    def __init__(self, interval_s: float):
+        super().__init__(name="peak-sampler", daemon=True)
+        self.interval_s = interval_s
+        self.peak = 0
+        self.snapshot = None
+        self._stop_event = threading.Event()
+
+    def sample(self):
+        current, _ = tracemalloc.get_traced_memory()
+        if current > self.peak:
+            self.peak = current
+            self.snapshot = tracemalloc.take_snapshot()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval_s):
+            self.sample()
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        self.sample()
+
+
+def top_allocations(snapshot: tracemalloc.Snapshot, limit: int) -> List[dict]:
+    return [
+        {
+            "location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+            "size_mb": round(stat.size / 1e6, 3),
+            "count": stat.count,
+        }
+        for stat in snapshot.statistics("lineno")[:limit]
+    ]
+
+
+def top_functions(prof: cProfile.Profile, limit: int) -> List[dict]:
+    stats = pstats.Stats(prof)
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:limit]
+    return [
+        {
+            "function": f"{os.path.basename(filename)}:{line}({name})",
+            "calls": ncalls,
+            "tottime_s": round(tottime, 4),
+            "cumtime_s": round(cumtime, 4),
+        }
+        for (filename, line, name), (_, ncalls, tottime, cumtime, _) in rows
+    ]
+
+
+def profile_script(script: str, out: str, cprofile_path: str = None) -> int:
+    """Run `script` as __main__ in this process and write its stage record to `out`."""
+    sys.argv = [script]
+    sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+    sampler = None
+    if PROFILE_TRACEMALLOC:
+        tracemalloc.start()
+        sampler = PeakSampler(SAMPLE_INTERVAL_S)
+        sampler.start()
+    prof = cProfile.Profile() if cprofile_path else None
+    usage_start = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.perf_counter()
+
+    exit_code = 0
+    if prof:
+        prof.enable()
+    try:
+        runpy.run_path(script, run_name="__main__")
+    except SystemExit as e:
+        exit_code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    except Exception as e:
+        exit_code = 1
+        print(f"{script} failed: {e!r}", file=sys.stderr)
+    finally:
+        if prof:
+            prof.disable()
+
+    wall = time.perf_counter() - start
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    record = {
+        "script": script,
+        "exit_code": exit_code,
+        "wall_s": round(wall, 4),
+        "cpu_user_s": round(usage.ru_utime - usage_start.ru_utime, 4),
+        "cpu_system_s": round(usage.ru_stime - usage_start.ru_stime, 4),
+        "peak_rss_mb": round(usage.ru_maxrss / 1024, 1),  # kB on Linux
+    }
+    if sampler:
+        sampler.stop()
+        _, peak = tracemalloc.get_traced_memory()
+        record["tracemalloc_peak_mb"] = round(peak / 1e6, 3)
+        record["sampled_peak_mb"] = round(sampler.peak / 1e6, 3)
+        record["top_allocations"] = top_allocations(sampler.snapshot.filter_traces(IMPORT_FILTERS), TRACEMALLOC_TOP)
+        tracemalloc.stop()
+    if prof:
+        prof.dump_stats(cprofile_path)
+        record["cprofile"] = cprofile_path
+        record["top_functions"] = top_functions(prof, CPROFILE_TOP)
+
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(record, f, indent=2)
+    return exit_code
+
+
+def _html_table(rows: List[dict]) -> str:
+    if not rows:
+        return "<p>none</p>"
+    cols = list(rows[0])
+    head = "".join(f"<th>{html.escape(c)}</th>" for c in cols)
+    body = "".join(
+        "<tr>" + "".join(f"<td>{html.escape(str(r.get(c, '')))}</td>" for c in cols) + "</tr>" for r in rows
+    )
+    return f"<table><tr>{head}</tr>{body}</table>"
+
+
+def write_report(run_id: str, stages: List[dict], json_path: str, html_path: str) -> dict:
+    report = {
+        "run_id": run_id,
+        "created": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "host": platform.node(),
+        "total_wall_s": round(sum(s.get("wall_s", 0) for s in stages), 4),
+        "stages": stages,
+    }
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    summary_cols = ("stage", "script", "exit_code", "wall_s", "cpu_user_s", "cpu_system_s", "peak_rss_mb", "tracemalloc_peak_mb")
+    parts = [
+        "<!doctype html><html><head><meta charset='utf-8'>",
+        f"<title>Pipeline profile {html.escape(run_id)}</title>",
+        "<style>body{font-family:sans-serif;margin:2em}table{border-collapse:collapse;margin-bottom:1.5em}"
+        "td,th{border:1px solid #ccc;padding:4px 8px;text-align:left;font-size:13px}th{background:#f3f3f3}</style>",
+        "</head><body>",
+        f"<h1>Pipeline profile {html.escape(run_id)}</h1>",
+        f"<p>Total wall time {report['total_wall_s']} s · Python {report['python']} · {html.escape(report['host'])}</p>",
+        _html_table([{c: s.get(c, "") for c in summary_cols} for s in stages]),
+    ]
+    for s in stages:
+        parts.append(f"<h2>{html.escape(s['stage'])}</h2>")
+        if s.get("top_allocations"):
+            parts.append("<h3>Top allocations (tracemalloc)</h3>" + _html_table(s["top_allocations"]))
+        if s.get("top_functions"):
+            parts.append("<h3>Top functions by cumulative time (cProfile)</h3>" + _html_table(s["top_functions"]))
+    parts.append("</body></html>")
+    with open(html_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(parts))
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Profile one pipeline stage script")
+    parser.add_argument("--out", required=True, help="stage record JSON to write")
+    parser.add_argument("--cprofile", help="also write a cProfile dump here")
+    parser.add_argument("script")
+    args = parser.parse_args()
+    sys.exit(profile_script(args.script, args.out, args.cprofile))
@@ -1,60 +1,257 @@
 import faiss
 import numpy as np
-import pickle
+import hashlib
 import json
 import os
+import shutil
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
 
+from compression import build_index, index_nbytes, merge_ivf_blocks, new_index, to_ondisk_ivf, truncate_and_normalize
+from shards import SHARD_BY, SHARD_DIR, build_shards
+
 # --- CONFIGURATION ---
-EMBEDDINGS_FILE   = os.getenv("EMBEDDINGS_FILE", "embeddings.pkl")
+EMBEDDINGS_FILE   = os.getenv("EMBEDDINGS_FILE", "embeddings.npy")  # float32, row-aligned with metadata.json
 TEXTS_FILE        = os.getenv("TEXTS_FILE", "texts.json")
+METADATA_FILE     = os.getenv("METADATA_FILE", "metadata.json")  # row-aligned, for shard keys
 FAISS_INDEX_FILE  = os.getenv("FAISS_INDEX_FILE", "faiss_index.index")
+VECTORS_FILE      = os.getenv("VECTORS_FILE", "vectors.npy")   # float16, row-aligned with metadata.json (MMR, coarse-to-fine)
 USE_IVF           = os.getenv("USE_IVF", "False").lower() == "true"
 NUM_CLUSTERS      = int(os.getenv("NUM_CLUSTERS", "100"))
+ONDISK_IVF        = os.getenv("ONDISK_IVF", "True").lower() == "true"  # IVF lists in a mmap-able .ivfdata file
+OUTPUT_DIM        = int(os.getenv("OUTPUT_DIM", "0"))          # Matryoshka truncation, 0 = full width
+QUANTIZATION      = os.getenv("QUANTIZATION", "none").lower()  # none | fp16 | int8 | pq
+PQ_M              = int(os.getenv("PQ_M", "64"))               # PQ sub-vectors (must divide the dim)
+PQ_NBITS          = int(os.getenv("PQ_NBITS", "8"))            # bits per PQ sub-vector code
+
+# Out-of-core build (BUILD_MODE=stream): train IVF on a random sample, then stream
+# EMBEDDINGS_FILE as a memmap in BATCH_SIZE rows, one index block per BLOCK_ROWS,
+# merged into the on-disk .ivfdata. Finished blocks survive a crash and are reused.
+BUILD_MODE        = os.getenv("BUILD_MODE", "memory").lower()  # memory | stream
+TRAIN_SAMPLE      = int(os.getenv("TRAIN_SAMPLE", "100000"))   # vectors used to train the coarse quantizer
+TRAIN_SEED        = int(os.getenv("TRAIN_SEED", "0"))
+BATCH_SIZE        = int(os.getenv("BATCH_SIZE", "10000"))      # rows read + normalized + added at a time
+BLOCK_ROWS        = int(os.getenv("BLOCK_ROWS", "200000"))     # rows per resumable index block
+BUILD_THREADS     = int(os.getenv("BUILD_THREADS", "0"))       # OpenMP threads, 0 = all cores
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 
-# --- Load Data ---
-logging.info(f"Loading embeddings from '{EMBEDDINGS_FILE}' and texts from '{TEXTS_FILE}'")
-with open(EMBEDDINGS_FILE, "rb") as f:
-    embeddings = pickle.load(f)
-with open(TEXTS_FILE, "r") as f:
-    chunks = json.load(f)
-
-valid_data = [(e, t) for e, t in zip(embeddings, chunks) if e is not None]
-if not valid_data:
-    logging.error("No valid embeddings to index. Exiting.")
-    exit(1)
-
-vectors, valid_chunks = zip(*valid_data)
-mat = np.array(vectors, dtype="float32")
-faiss.normalize_L2(mat)
-dim = mat.shape[1]
-
-# --- Build Index ---
-if USE_IVF:
-    logging.info(f"Using IVF index with {NUM_CLUSTERS} clusters")
-    quantizer = faiss.IndexFlatIP(dim)
-    index = faiss.IndexIVFFlat(quantizer, dim, NUM_CLUSTERS, faiss.METRIC_INNER_PRODUCT)
-    if not index.is_trained:
-        logging.info("Training IVF index...")
-        index.train(mat)
-    index.add(mat)
-else:
-    index = faiss.IndexFlatIP(dim)
-    index.add(mat)
-
-logging.info(f"FAISS index built with {index.ntotal} vectors")
-
-# --- Save Index ---
-tmp_index = FAISS_INDEX_FILE + ".tmp"
-faiss.write_index(index, tmp_index)
-os.replace(tmp_index, FAISS_INDEX_FILE)
-logging.info(f"Saved FAISS index to '{FAISS_INDEX_FILE}'")
-
-# --- Save Metadata (optional) ---
-meta_file = FAISS_INDEX_FILE + ".meta.json"
-with open(meta_file, 'w') as f:
-    json.dump({"chunks_file": TEXTS_FILE, "count": index.ntotal}, f, indent=2)
-logging.info(f"Saved index metadata to '{meta_file}'")
+
+def main():
+    if BUILD_MODE == "stream":
+        save_index_streaming()
+        return
+
+    # --- Load Data ---
+    logging.info(f"Loading embeddings from '{EMBEDDINGS_FILE}'")
+    mat = np.load(EMBEDDINGS_FILE)
+    # All-zero rows are failed embeddings: they stay in `mat` (and vectors.npy) so
+    # row numbers keep matching metadata.json, but are never added to the index
+    valid = np.flatnonzero(np.any(mat != 0, axis=1))
+    if not len(valid):
+        logging.error("No valid embeddings to index. Exiting.")
+        exit(1)
+    if len(valid) < len(mat):
+        logging.info(f"Skipping {len(mat) - len(valid)} rows with failed embeddings")
+    source_dim = mat.shape[1]
+    mat = truncate_and_normalize(mat, OUTPUT_DIM)
+    dim = mat.shape[1]
+    if dim != source_dim:
+        logging.info(f"Truncated embeddings from {source_dim} to {dim} dimensions")
+
+    if SHARD_BY != "none":
+        save_shards(mat, valid, dim, source_dim)
+    else:
+        save_index(mat, valid, dim, source_dim)
+
+    # --- Save row-aligned vectors ---
+    tmp_vectors = VECTORS_FILE + ".tmp"
+    with open(tmp_vectors, "wb") as f:
+        np.save(f, mat.astype("float16"))
+    os.replace(tmp_vectors, VECTORS_FILE)
+    logging.info(f"Saved {mat.shape[0]}×{dim} float16 vectors to '{VECTORS_FILE}'")
+
+
+def save_shards(mat, valid, dim, source_dim):
+    with open(METADATA_FILE, "r", encoding="utf-8") as f:
+        metadata = json.load(f)
+    if len(metadata) < len(mat):
+        logging.error(f"'{METADATA_FILE}' has {len(metadata)} rows for {len(mat)} vectors; cannot shard. Exiting.")
+        exit(1)
+
+    def build(vecs, ids):
+        # Small shards cannot train NUM_CLUSTERS centroids
+        return build_index(vecs, QUANTIZATION, USE_IVF, min(NUM_CLUSTERS, len(vecs)), PQ_M, PQ_NBITS, ids=ids)
+
+    def post_build(index, path):
+        if USE_IVF and ONDISK_IVF:
+            to_ondisk_ivf(index, path + ".ivfdata")
+
+    config = {"dim": dim, "source_dim": source_dim, "quantization": QUANTIZATION, "ivf": USE_IVF,
+              "num_clusters": NUM_CLUSTERS, "pq_m": PQ_M, "pq_nbits": PQ_NBITS, "ondisk_ivf": ONDISK_IVF}
+    manifest = build_shards(mat, metadata, SHARD_BY, SHARD_DIR, build, config, post_build, rows=valid)
+    logging.info(f"Saved {len(manifest['shards'])} shards by {SHARD_BY} to '{SHARD_DIR}'")
+
+
+def save_index(mat, valid, dim, source_dim):
+    # --- Build Index ---
+    if USE_IVF:
+        logging.info(f"Using IVF index with {NUM_CLUSTERS} clusters")
+    if QUANTIZATION != "none":
+        logging.info(f"Using {QUANTIZATION} vector quantization")
+    if len(valid) == len(mat):
+        index = build_index(mat, QUANTIZATION, USE_IVF, NUM_CLUSTERS, PQ_M, PQ_NBITS)
+    else:
+        # FAISS IDs must stay metadata.json row numbers across the skipped rows
+        index = build_index(mat[valid], QUANTIZATION, USE_IVF, NUM_CLUSTERS, PQ_M, PQ_NBITS, ids=valid)
+
+    logging.info(f"FAISS index built with {index.ntotal} vectors ({index_nbytes(index) / 1e6:.1f} MB)")
+
+    # --- Save Index ---
+    if USE_IVF and ONDISK_IVF:
+        ivfdata_file = FAISS_INDEX_FILE + ".ivfdata"
+        to_ondisk_ivf(index, ivfdata_file)
+        logging.info(f"Moved inverted lists to '{ivfdata_file}'")
+    tmp_index = FAISS_INDEX_FILE + ".tmp"
+    faiss.write_index(index, tmp_index)
+    os.replace(tmp_index, FAISS_INDEX_FILE)
+    logging.info(f"Saved FAISS index to '{FAISS_INDEX_FILE}'")
+
+    save_index_meta(index.ntotal, dim, source_dim, USE_IVF and ONDISK_IVF)
+
+
+def save_index_meta(count, dim, source_dim, ondisk_ivf, **extra):
+    # --- Save Metadata (optional) ---
+    meta_file = FAISS_INDEX_FILE + ".meta.json"
+    with open(meta_file, 'w') as f:
+        json.dump({
+            "chunks_file": TEXTS_FILE,
+            "count": count,
+            "dim": dim,
+            "source_dim": source_dim,
+            "quantization": QUANTIZATION,
+            "ivf": USE_IVF,
+            "ondisk_ivf": ondisk_ivf,
+            **extra,
+        }, f, indent=2)
+    logging.info(f"Saved index metadata to '{meta_file}'")
+
+
+def save_index_streaming():
+    """
+    Out-of-core IVF build. Peak memory is the training sample plus one block
+    of codes plus a prefetched batch, whatever the corpus size. FAISS IDs are
+    the raw row numbers; rows with an all-zero (failed) embedding are skipped.
+    """
+    if not USE_IVF:
+        logging.error("BUILD_MODE=stream builds IVF indexes only; set USE_IVF=True. Exiting.")
+        exit(1)
+    if SHARD_BY != "none":
+        logging.error("BUILD_MODE=stream does not build shards; set SHARD_BY=none. Exiting.")
+        exit(1)
+    raw = np.load(EMBEDDINGS_FILE, mmap_mode="r")
+    n, source_dim = raw.shape
+    dim = OUTPUT_DIM if OUTPUT_DIM and OUTPUT_DIM < source_dim else source_dim
+    faiss.omp_set_num_threads(BUILD_THREADS or os.cpu_count())
+
+    def read(start, stop):
+        """Normalized rows [start, stop) and their IDs, failed embeddings dropped."""
+        batch = np.asarray(raw[start:stop], dtype="float32")
+        valid = np.flatnonzero(np.any(batch != 0, axis=1))
+        return truncate_and_normalize(batch[valid], dim), (valid + start).astype("int64")
+
+    # --- Build directory: config fingerprint, trained index, finished blocks ---
+    build_dir = FAISS_INDEX_FILE + ".build"
+    config = {"n": n, "source_dim": source_dim, "dim": dim, "quantization": QUANTIZATION,
+              "num_clusters": NUM_CLUSTERS, "pq_m": PQ_M, "pq_nbits": PQ_NBITS, "train_sample": TRAIN_SAMPLE,
+              "train_seed": TRAIN_SEED, "block_rows": BLOCK_ROWS, "raw_mtime": os.path.getmtime(EMBEDDINGS_FILE)}
+    fp = hashlib.sha1(json.dumps(config, sort_keys=True).encode("utf-8")).hexdigest()
+    state_file = os.path.join(build_dir, "state.json")
+    state = {}
+    if os.path.exists(state_file):
+        with open(state_file, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    if state.get("fingerprint") != fp:
+        shutil.rmtree(build_dir, ignore_errors=True)
+        state = {"fingerprint": fp, "config": config, "blocks": []}
+    os.makedirs(build_dir, exist_ok=True)
+
+    def save_state():
+        tmp = state_file + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp, state_file)
+
+    # --- Train the coarse quantizer (and PQ / SQ) on a random sample ---
+    trained_file = os.path.join(build_dir, "trained.index")
+    if os.path.exists(trained_file):
+        logging.info(f"Resuming: reusing trained index, {len(state['blocks'])} blocks already built")
+    else:
+        rng = np.random.default_rng(TRAIN_SEED)
+        sample = np.sort(rng.choice(n, min(TRAIN_SAMPLE, n), replace=False))
+        train = np.asarray(raw[sample], dtype="float32")
+        train = truncate_and_normalize(train[np.any(train != 0, axis=1)], dim)
+        if len(train) < NUM_CLUSTERS:
+            logging.error(f"Only {len(train)} valid training vectors for {NUM_CLUSTERS} clusters. Exiting.")
+            exit(1)
+        index = new_index(dim, QUANTIZATION, True, NUM_CLUSTERS, PQ_M, PQ_NBITS, n_train=len(train))
+        logging.info(f"Training {type(index).__name__} on a sample of {len(train)} of {n} vectors...")
+        index.train(train)
+        del train
+        faiss.write_index(index, trained_file + ".tmp")
+        os.replace(trained_file + ".tmp", trained_file)
+
+    # --- Stream blocks: read the next batch while FAISS adds the current one ---
+    vectors_tmp = os.path.join(build_dir, "vectors.npy")
+    mode = "r+" if os.path.exists(vectors_tmp) else "w+"
+    vectors = np.lib.format.open_memmap(vectors_tmp, mode=mode, dtype="float16", shape=(n, dim))
+    done = set(state["blocks"])
+    block_starts = list(range(0, n, BLOCK_ROWS))
+    progress = tqdm(total=n, initial=sum(min(BLOCK_ROWS, n - b) for b in block_starts if b in done),
+                    desc="Indexing", unit="vec")
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch") as reader:
+        for block_start in block_starts:
+            if block_start in done:
+                continue
+            block_stop = min(block_start + BLOCK_ROWS, n)
+            block = faiss.read_index(trained_file)
+            batches = range(block_start, block_stop, BATCH_SIZE)
+            pending = reader.submit(read, block_start, min(block_start + BATCH_SIZE, block_stop))
+            for start in batches:
+                mat, ids = pending.result()
+                if start + BATCH_SIZE < block_stop:
+                    nxt = start + BATCH_SIZE
+                    pending = reader.submit(read, nxt, min(nxt + BATCH_SIZE, block_stop))
+                block.add_with_ids(mat, ids)
+                vectors[ids] = mat.astype("float16")
+                progress.update(min(BATCH_SIZE, block_stop - start))
+            block_file = os.path.join(build_dir, f"block-{block_start:012d}.index")
+            faiss.write_index(block, block_file + ".tmp")
+            os.replace(block_file + ".tmp", block_file)
+            vectors.flush()
+            state["blocks"].append(block_start)
+            save_state()
+            del block
+    progress.close()
+    vectors.flush()
+    del vectors
+
+    # --- Merge the blocks' lists into the on-disk .ivfdata ---
+    index = faiss.read_index(trained_file)
+    ivfdata_file = FAISS_INDEX_FILE + ".ivfdata"
+    block_files = [os.path.join(build_dir, f"block-{b:012d}.index") for b in sorted(state["blocks"])]
+    merge_ivf_blocks(index, block_files, ivfdata_file)
+    tmp_index = FAISS_INDEX_FILE + ".tmp"
+    faiss.write_index(index, tmp_index)
+    os.replace(tmp_index, FAISS_INDEX_FILE)
+    os.replace(vectors_tmp, VECTORS_FILE)
+    logging.info(f"Merged {len(block_files)} blocks: {index.ntotal} vectors in '{FAISS_INDEX_FILE}' + '{ivfdata_file}'")
+    if not ONDISK_IVF:
+        logging.info("BUILD_MODE=stream always keeps inverted lists on disk (ONDISK_IVF ignored)")
+    save_index_meta(index.ntotal, dim, source_dim, True, build_mode="stream", train_sample=TRAIN_SAMPLE)
+    shutil.rmtree(build_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+scheduler.py
+
+Admission control and fair scheduling for LLM generation.
+
+Without it every request calls the main model the moment it arrives, so a
+burst turns into quota errors that then cascade onto the fallback model.
+GenerationScheduler bounds the generations in flight to `max_concurrency`.
+Requests beyond that wait in per-user FIFO queues served round-robin, so one
+user sending many questions cannot starve the others. Normal-priority
+queues are served before low-priority ones.
+
+Load shedding: when a low-priority request (creative questions count as
+low) arrives while `shed_depth` or more requests are already waiting, or
+when any request has waited longer than `queue_timeout_s`, it is not queued
+(or stops waiting) and is admitted as *shed*. The caller then answers it
+with the cheaper fallback model and a smaller output budget, outside the
+main model's concurrency limit (ask_osiris bounds the fallback model with
+its own FALLBACK_MAX_CONCURRENCY).
+
+Queue time is recorded per request (the `generation_queue` trace stage),
+and queue depth, generations in flight and shed counts are exported as
+metrics.
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator, Optional
+
+from tracing import GEN_INFLIGHT, GEN_QUEUE_DEPTH, GEN_SHED
+
+PRIORITIES = ("normal", "low")
+
+
+class Admission:
+    """Outcome of waiting for a generation slot."""
+
+    def __init__(self, shed: Optional[str], queued_s: float):
+        self.shed = shed          # None, or why the request was shed ("queue_depth" | "queue_timeout")
+        self.queued_s = queued_s
+
+
+class _Ticket:
+    def __init__(self, user: str, priority: str):
+        self.user, self.priority = user, priority
+        self.granted = threading.Event()
+
+
+class GenerationScheduler:
+    def __init__(self, max_concurrency: int, shed_depth: int = 0, queue_timeout_s: float = 0.0):
+        self.max_concurrency = max(1, max_concurrency)
+        self.shed_depth = shed_depth            # 0 = never shed on depth
+        self.queue_timeout_s = queue_timeout_s  # 0 = wait as long as it takes
+        self._lock = threading.Lock()
+        self._inflight = 0
+        # priority → user → waiting tickets; OrderedDict order is the round-robin order
+        self._queues: Dict[str, "OrderedDict[str, Deque[_Ticket]]"] = {p: OrderedDict() for p in PRIORITIES}
+        self._waiting = 0
+
+    def depth(self) -> int:
+        return self._waiting
+
+    def inflight(self) -> int:
+        return self._inflight
+
+    def _publish(self):
+        GEN_QUEUE_DEPTH.set(self._waiting)
+        GEN_INFLIGHT.set(self._inflight)
+
+    def _next_ticket(self) -> Optional[_Ticket]:
+        """Head ticket of the next user in round-robin order, normal priority first."""
+        for priority in PRIORITIES:
+            queues = self._queues[priority]
+            if queues:
+                user, tickets = next(iter(queues.items()))
+                ticket = tickets.popleft()
+                del queues[user]
+                if tickets:
+                    queues[user] = tickets  # back of the ring
+                return ticket
+        return None
+
+    def _remove(self, ticket: _Ticket) -> bool:
+        tickets = self._queues[ticket.priority].get(ticket.user)
+        if tickets is None or ticket not in tickets:
+            return False
+        tickets.remove(ticket)
+        if not tickets:
+            del self._queues[ticket.priority][ticket.user]
+        return True
+
+    def acquire(self, user: str = "anonymous", priority: str = "normal") -> Admission:
+        """Wait for a slot; a shed admission holds no slot and must not be released."""
+        priority = priority if priority in PRIORITIES else "normal"
+        start = time.perf_counter()
+        with self._lock:
+            if self._inflight < self.max_concurrency and not self._waiting:
+                self._inflight += 1
+                self._publish()
+                return Admission(None, 0.0)
+            if priority == "low" and self.shed_depth and self._waiting >= self.shed_depth:
+                GEN_SHED.inc(reason="queue_depth")
+                return Admission("queue_depth", 0.0)
+            ticket = _Ticket(user or "anonymous", priority)
+            self._queues[priority].setdefault(ticket.user, deque()).append(ticket)
+            self._waiting += 1
+            self._publish()
+
+        if ticket.granted.wait(self.queue_timeout_s or None):
+            return Admission(None, time.perf_counter() - start)
+        with self._lock:
+            if not self._remove(ticket):
+                # Granted between the timeout and taking the lock: keep the slot
+                return Admission(None, time.perf_counter() - start)
+            self._waiting -= 1
+            self._publish()
+        GEN_SHED.inc(reason="queue_timeout")
+        return Admission("queue_timeout", time.perf_counter() - start)
+
+    def release(self):
+        with self._lock:
+            ticket = self._next_ticket()
+            if ticket is not None:
+                self._waiting -= 1
+                ticket.granted.set()  # the slot passes straight to the next request
+            else:
+                self._inflight -= 1
+            self._publish()
+
+    @contextmanager
+    def slot(self, user: str = "anonymous", priority: str = "normal") -> Iterator[Admission]:
+        admission = self.acquire(user, priority)
+        try:
+            yield admission
+        finally:
+            if admission.shed is None:
+                self.release()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+shards.py
+
+Index partitioned into shards, searched in parallel and merged.
+
+Rows are grouped by SHARD_BY (`source_id` or `month` of the meeting date) and
+each group becomes its own FAISS index, wrapped in an IndexIDMap2 so it
+returns global row numbers (the metadata.json positions) and accepts the same
+ID filters as the monolithic index. shards/manifest.json records every
+shard's file, row count and a fingerprint of its rows and vectors, so a
+rebuild only rewrites shards whose content changed.
+
+ShardedIndex searches the shards on a thread pool (FAISS releases the GIL)
+and merges the per-shard top-k into a global top-k. With an ID filter, only
+shards holding at least one matching row are searched, with the selector
+narrowed to that shard's rows — so a date filter over month shards touches
+only the months it covers.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+
+from shared_store import read_index
+
+# --- CONFIGURATION ---
+SHARD_BY      = os.getenv("SHARD_BY", "none").lower()  # none | source_id | month
+SHARD_DIR     = os.getenv("SHARD_DIR", "shards")
+SHARD_WORKERS = int(os.getenv("SHARD_WORKERS", "8"))
+SHARD_KEYS    = ("none", "source_id", "month")
+MANIFEST_FILE = "manifest.json"
+
+
+def shard_key(rec: dict, by: str) -> str:
+    if by == "source_id":
+        return rec.get("source_id") or "unknown"
+    if by == "month":
+        return (rec.get("date") or "")[:7] or "undated"
+    raise ValueError(f"Unknown shard key '{by}', expected one of {SHARD_KEYS}")
+
+
+def shard_file(key: str) -> str:
+    """File name for a shard key (source IDs and months are not always path-safe)."""
+    safe = "".join(c if c.isalnum() or c in "-_" else "_" for c in key)
+    return f"shard-{safe}-{hashlib.sha1(key.encode('utf-8')).hexdigest()[:8]}.index"
+
+
+def fingerprint(ids: np.ndarray, vecs: np.ndarray, config: dict) -> str:
+    h = hashlib.sha1(json.dumps(config, sort_keys=True).encode("utf-8"))
+    h.update(np.ascontiguousarray(ids, dtype="int64").tobytes())
+    h.update(np.ascontiguousarray(vecs, dtype="float32").tobytes())
+    return h.hexdigest()
+
+
+def build_shards(
+    mat: np.ndarray,
+    metadata: Sequence[dict],
+    by: str,
+    out_dir: str,
+    build: Callable[[np.ndarray, np.ndarray], faiss.Index],
+    config: dict,
+    post_build: Callable[[faiss.Index, str], None] = None,
+    rows: Optional[Sequence[int]] = None,
+) -> dict:
+    """
+    Write one index per shard key under `out_dir` plus the manifest.
+
+    `build(vecs, ids)` makes a shard index; `config` (quantization, dims...)
+    is part of the fingerprint so changing it rebuilds every shard.
+    `post_build(index, path)` runs before a new shard is written. `mat` is
+    row-aligned with `metadata`; only `rows` (default all) are indexed, so
+    failed embeddings can be left out without renumbering the rest.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_path = os.path.join(out_dir, MANIFEST_FILE)
+    old = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            old = json.load(f).get("shards", {})
+
+    groups: Dict[str, List[int]] = {}
+    for row in (range(len(mat)) if rows is None else map(int, rows)):
+        groups.setdefault(shard_key(metadata[row], by), []).append(row)
+
+    shards, built = {}, 0
+    for key, rows in sorted(groups.items()):
+        ids = np.asarray(rows, dtype="int64")
+        fp = fingerprint(ids, mat[ids], config)
+        entry = {"file": shard_file(key), "count": len(rows), "fingerprint": fp}
+        path = os.path.join(out_dir, entry["file"])
+        if old.get(key, {}).get("fingerprint") == fp and os.path.exists(path):
+            shards[key] = entry
+            continue
+        index = build(mat[ids], ids)
+        if post_build is not None:
+            post_build(index, path)
+        tmp = path + ".tmp"
+        faiss.write_index(index, tmp)
+        os.replace(tmp, path)
+        shards[key] = entry
+        built += 1
+        logging.info(f"Built shard '{key}' with {len(rows)} vectors")
+
+    for key, entry in old.items():
+        if key not in shards:
+            for stale in (entry["file"], entry["file"] + ".ivfdata"):
+                if os.path.exists(os.path.join(out_dir, stale)):
+                    os.remove(os.path.join(out_dir, stale))
+            logging.info(f"Removed stale shard '{key}'")
+
+    manifest = {"by": by, "dim": int(mat.shape[1]), "count": sum(len(r) for r in groups.values()), "shards": shards}
+    tmp = manifest_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, manifest_path)
+    logging.info(f"{built} of {len(shards)} shards rebuilt, {len(shards) - built} unchanged")
+    return manifest
+
+
+def merge_topk(D: np.ndarray, I: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Global top-k (highest score first) of concatenated per-shard results; pads with -inf / -1."""
+    nq, total = D.shape
+    if total < k:
+        D = np.hstack([D, np.full((nq, k - total), -np.inf, dtype="float32")])
+        I = np.hstack([I, np.full((nq, k - total), -1, dtype="int64")])
+    D = np.where(I >= 0, D, -np.inf)
+    top = np.argpartition(-D, k - 1, axis=1)[:, :k] if D.shape[1] > k else np.tile(np.arange(k), (nq, 1))
+    order = np.argsort(-np.take_along_axis(D, top, axis=1), axis=1, kind="stable")
+    top = np.take_along_axis(top, order, axis=1)
+    return np.take_along_axis(D, top, axis=1), np.take_along_axis(I, top, axis=1)
+
+
+class ShardedIndex:
+    """Read-only set of shard indexes with the search surface ask_osiris uses."""
+
+    def __init__(self, shard_dir: str = SHARD_DIR, workers: int = SHARD_WORKERS):
+        with open(os.path.join(shard_dir, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        self.keys = sorted(self.manifest["shards"])
+        self.shards = [read_index(os.path.join(shard_dir, self.manifest["shards"][k]["file"])) for k in self.keys]
+        # Sorted global row IDs per shard, for filter routing and reconstruction
+        self.shard_ids = [np.sort(faiss.vector_to_array(s.id_map)).astype("int64") for s in self.shards]
+        self.d = self.shards[0].d if self.shards else self.manifest["dim"]
+        self.ntotal = sum(s.ntotal for s in self.shards)
+        self.pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="osiris-shard")
+        logging.info(f"Loaded {len(self.shards)} shards ({self.manifest['by']}) with {self.ntotal} vectors")
+
+    def _route(self, ids: Optional[np.ndarray]) -> List[Tuple[int, Optional[np.ndarray]]]:
+        """(shard, selector IDs) pairs worth searching; shards without a matching row are skipped."""
+        if ids is None:
+            return [(s, None) for s in range(len(self.shards))]
+        ids = np.asarray(ids, dtype="int64")
+        routes = []
+        for s, shard_ids in enumerate(self.shard_ids):
+            own = np.intersect1d(ids, shard_ids, assume_unique=True)
+            if len(own):
+                routes.append((s, own))
+        return routes
+
+    def _search_shard(self, s: int, q_mat: np.ndarray, k: int, ids: Optional[np.ndarray]):
+        shard = self.shards[s]
+        k = min(k, shard.ntotal if ids is None else len(ids))
+        if ids is None:
+            return shard.search(q_mat, k)
+        sel = faiss.IDSelectorBatch(ids)
+        ivf = faiss.try_extract_index_ivf(shard)
+        if ivf is not None:
+            params = faiss.SearchParametersIVF(sel=sel, nprobe=ivf.nprobe)
+        else:
+            params = faiss.SearchParameters(sel=sel)
+        return shard.search(q_mat, k, params=params)
+
+    def search(self, q_mat: np.ndarray, k: int, ids: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        routes = self._route(ids)
+        nq = len(q_mat)
+        if not routes:
+            return np.full((nq, k), -np.inf, dtype="float32"), np.full((nq, k), -1, dtype="int64")
+        results = list(self.pool.map(lambda r: self._search_shard(r[0], q_mat, k, r[1]), routes))
+        D = np.hstack([d for d, _ in results]).astype("float32")
+        I = np.hstack([i for _, i in results]).astype("int64")
+        return merge_topk(D, I, k)
+
+    def make_direct_map(self):
+        """Allow reconstruct_batch on IVF shards."""
+        for shard in self.shards:
+            ivf = faiss.try_extract_index_ivf(shard)
+            if ivf is not None:
+                ivf.make_direct_map()
+
+    def reconstruct_batch(self, ids: np.ndarray) -> np.ndarray:
+        ids = np.asarray(ids, dtype="int64")
+        out = np.zeros((len(ids), self.d), dtype="float32")
+        for s, shard_ids in enumerate(self.shard_ids):
+            pos = np.isin(ids, shard_ids)
+            if pos.any():
+                out[pos] = np.vstack([self.shards[s].reconstruct(int(i)) for i in ids[pos]])
+        return out
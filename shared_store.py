@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+shared_store.py
+
+Memory-mapped serving artifacts, shared between worker processes.
+
+Every worker that loads the engine used to hold a private copy of the FAISS
+index and of metadata.json as Python objects, so RSS grew linearly with the
+worker count. Here both are mapped read-only from disk instead:
+  * the index is read with FAISS's IO_FLAG_MMAP_IFC, which maps flat and
+    scalar/product-quantized codes straight from the index file (IVF lists
+    are mapped from the .ivfdata file written by compression.to_ondisk_ivf);
+  * chunk records live in chunks.bin, one JSON record per line, with an
+    int64 offsets array beside it. ChunkStore decodes a record only when it
+    is indexed, so a query touches the pages of the ~20 chunks it returns.
+Mapped pages belong to the page cache, so N workers cost one copy.
+"""
+
+import json
+import logging
+import mmap
+import os
+from typing import Iterable, Iterator, List, Sequence, Union
+
+import faiss
+import numpy as np
+
+# --- CONFIGURATION ---
+CHUNK_STORE_FILE = os.getenv("CHUNK_STORE_FILE", "chunks.bin")
+SHARED_MEMORY    = os.getenv("SHARED_MEMORY", "True").lower() == "true"  # False = private copies per process
+
+
+def offsets_path(path: str) -> str:
+    return path + ".offsets.npy"
+
+
+def read_index(path: str, shared: bool = SHARED_MEMORY) -> faiss.Index:
+    """Read a FAISS index, memory-mapping its codes when `shared`."""
+    if shared:
+        flags = getattr(faiss, "IO_FLAG_MMAP_IFC", 0) | faiss.IO_FLAG_READ_ONLY
+        try:
+            return faiss.read_index(path, flags)
+        except RuntimeError as e:  # index type without mmap support in this FAISS build
+            logging.warning(f"Memory-mapped read of '{path}' failed ({e}); loading a private copy")
+    return faiss.read_index(path)
+
+
+def write_chunk_store(records: Iterable[dict], path: str = CHUNK_STORE_FILE) -> int:
+    """Write `records` as JSON lines plus their byte offsets; returns the record count."""
+    offsets = [0]
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        for rec in records:
+            f.write(json.dumps(rec, ensure_ascii=False).encode("utf-8") + b"\n")
+            offsets.append(f.tell())
+    tmp_offsets = path + ".tmp.offsets.npy"
+    with open(tmp_offsets, "wb") as f:
+        np.save(f, np.asarray(offsets, dtype="int64"))
+    # Offsets first: a reader that sees the new chunks.bin also sees its offsets
+    os.replace(tmp_offsets, offsets_path(path))
+    os.replace(tmp, path)
+    return len(offsets) - 1
+
+
+class ChunkStore(Sequence):
+    """Read-only, lazily decoded list of chunk records backed by chunks.bin."""
+
+    def __init__(self, path: str = CHUNK_STORE_FILE):
+        self.path = path
+        with open(path, "rb") as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(path) else b""
+        self._offsets = np.load(offsets_path(path), mmap_mode="r")
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i: Union[int, slice]) -> Union[dict, List[dict]]:
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        i = int(i)
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(f"chunk {i} out of range for {len(self)} chunks")
+        return json.loads(self._data[int(self._offsets[i]):int(self._offsets[i + 1])])
+
+    def __iter__(self) -> Iterator[dict]:
+        for i in range(len(self)):
+            yield self[i]
+
+
+def load_metadata(metadata_file: str, store_path: str = CHUNK_STORE_FILE, shared: bool = SHARED_MEMORY) -> Sequence[dict]:
+    """ChunkStore when shared and chunks.bin exists, else metadata.json in memory."""
+    if shared and os.path.exists(store_path) and os.path.exists(offsets_path(store_path)):
+        return ChunkStore(store_path)
+    with open(metadata_file, "r", encoding="utf-8") as f:
+        return json.load(f)
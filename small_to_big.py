@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+small_to_big.py
+
+Fine-grained "small-to-big" index over units smaller than a chunk.
+
+512-word chunks mix several topics, so their embeddings match questions
+loosely. This stage splits every metadata row into small units — one per
+speaker turn, with long turns (and rows without turns, such as summary
+sections) packed into sentence windows of at most UNIT_MAX_WORDS — and
+indexes those instead. Each unit records its parent row, and every row
+records the rows holding the previous and next `chunk_index` of the same
+document, so a query can
+  1. search the fine index for the best-matching units,
+  2. score each parent row by its best unit, and
+  3. expand the top parents into deduplicated windows of neighbouring
+     chunks, in document order.
+
+Writes fine_index.index (IndexIDMap2 over unit numbers), fine_map.npz
+(unit → parent row, row → previous / next row) and fine_units.json (unit
+texts, for inspection). Run after dedupe.py so parents are final rows;
+orchestrator.py runs it when SMALL_TO_BIG=True.
+"""
+
+import json
+import logging
+import os
+import re
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+
+from compression import build_index, truncate_and_normalize
+from filters import locations
+from shared_store import read_index
+from turns import extract_turns
+
+# --- CONFIGURATION ---
+METADATA_FILE     = os.getenv("METADATA_FILE", "metadata.json")
+FINE_INDEX_FILE   = os.getenv("FINE_INDEX_FILE", "fine_index.index")
+FINE_MAP_FILE     = os.getenv("FINE_MAP_FILE", "fine_map.npz")
+FINE_UNITS_FILE   = os.getenv("FINE_UNITS_FILE", "fine_units.json")
+EMBED_MODEL       = os.getenv("EMBED_MODEL", "gemini-embedding-001")
+OUTPUT_DIM        = int(os.getenv("OUTPUT_DIM", "0"))            # same truncation as save_to_faiss.py
+FINE_QUANTIZATION = os.getenv("FINE_QUANTIZATION", "none").lower()
+UNIT_MAX_WORDS    = int(os.getenv("UNIT_MAX_WORDS", "60"))       # longer turns are split at sentences
+UNIT_MIN_WORDS    = int(os.getenv("UNIT_MIN_WORDS", "5"))        # shorter units join their predecessor
+
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+")
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+
+# --- Splitting ---
+def _pack_sentences(segment: str, max_words: int) -> List[str]:
+    """Greedy sentence windows of at most `max_words` (a longer sentence stands alone)."""
+    windows, current = [], []
+    for sentence in SENTENCE_SPLIT.split(segment.strip()):
+        words = sentence.split()
+        if current and len(current) + len(words) > max_words:
+            windows.append(" ".join(current))
+            current = []
+        current += words
+    if current:
+        windows.append(" ".join(current))
+    return windows
+
+
+def turn_units(
+    text: str,
+    speakers: Iterable[str] = (),
+    max_words: int = UNIT_MAX_WORDS,
+    min_words: int = UNIT_MIN_WORDS,
+) -> List[Tuple[str, str, str]]:
+    """
+    (unit, speaker, timestamp) for the speaker turns of one chunk, long ones
+    packed into sentence windows. Text before the first turn has speaker '';
+    timestamp is '' for turns without an explicit one.
+    """
+    turns = extract_turns(text, speakers)
+    starts = [(0, "", "")] + [(offset, name, stamp) for offset, name, stamp, _ in turns if offset > 0]
+    if turns and turns[0][0] == 0:
+        starts[0] = (0, turns[0][1], turns[0][2])
+    units: List[Tuple[str, str, str]] = []
+    for (start, name, stamp), (end, _, _) in zip(starts, starts[1:] + [(len(text), "", "")]):
+        for unit in _pack_sentences(text[start:end], max_words):
+            if units and len(unit.split()) < min_words and len(units[-1][0].split()) + len(unit.split()) <= max_words:
+                units[-1] = (units[-1][0] + " " + unit,) + units[-1][1:]  # "Yeah." is not worth its own vector
+            elif unit:
+                units.append((unit, name, stamp))
+    return units
+
+
+def split_units(text: str, speakers: Iterable[str] = ()) -> List[str]:
+    """Speaker turns of one chunk, long ones packed into sentence windows."""
+    return [unit for unit, _, _ in turn_units(text, speakers)]
+
+
+def neighbour_rows(metadata: Sequence[dict]) -> Tuple[np.ndarray, np.ndarray]:
+    """Rows holding each row's previous / next chunk_index in the same document (-1 if none)."""
+    # Collapsed duplicates still answer for every location they stand for
+    by_location = {}
+    for row, rec in enumerate(metadata):
+        for loc in locations(rec):
+            by_location.setdefault((loc.get("source_id"), loc.get("chunk_index")), row)
+    prev_row = np.full(len(metadata), -1, dtype="int64")
+    next_row = np.full(len(metadata), -1, dtype="int64")
+    for row, rec in enumerate(metadata):
+        source, chunk = rec.get("source_id"), rec.get("chunk_index")
+        if chunk is None:
+            continue
+        for out, step in ((prev_row, -1), (next_row, 1)):
+            other = by_location.get((source, chunk + step), -1)
+            out[row] = other if other != row else -1
+    return prev_row, next_row
+
+
+# --- Query side ---
+class FineIndex:
+    """The unit index plus the unit → parent and row → neighbour maps."""
+
+    def __init__(self, index_file: str = FINE_INDEX_FILE, map_file: str = FINE_MAP_FILE):
+        self.index = read_index(index_file)
+        with np.load(map_file) as m:
+            self.unit_parent, self.prev_row, self.next_row = m["unit_parent"], m["prev_row"], m["next_row"]
+        self.d = self.index.d
+        logging.info(f"Loaded fine index with {self.index.ntotal} units over {len(self.prev_row)} chunks")
+
+    def search(self, q_vec: np.ndarray, k: int, ids: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k units, restricted to units whose parent row is in `ids`."""
+        q_vec = truncate_and_normalize(np.asarray(q_vec, dtype="float32"), self.d)
+        if ids is None:
+            return self.index.search(q_vec, k)
+        units = np.flatnonzero(np.isin(self.unit_parent, ids)).astype("int64")
+        if not len(units):
+            return np.empty((1, 0), dtype="float32"), np.empty((1, 0), dtype="int64")
+        params = faiss.SearchParameters(sel=faiss.IDSelectorBatch(units))
+        return self.index.search(q_vec, min(k, len(units)), params=params)
+
+    def search_parents(
+        self, q_vec: np.ndarray, k: int, ids: Optional[np.ndarray] = None
+    ) -> Tuple[List[float], List[int], int]:
+        """Parent rows of the top-k units, each scored by its best unit; also the unit hit count."""
+        D, I = self.search(q_vec, k, ids)
+        best = {}
+        for score, unit in zip(D[0].tolist(), I[0].tolist()):
+            if unit >= 0:
+                parent = int(self.unit_parent[unit])
+                best.setdefault(parent, score)  # hits arrive best first
+        return list(best.values()), list(best), int((I[0] >= 0).sum())
+
+    def expand(
+        self, ranked: List[Tuple[float, int]], width: int, ids: Optional[np.ndarray] = None
+    ) -> List[Tuple[float, int]]:
+        """
+        Replace each ranked parent by its window of `width` chunks either side,
+        in document order and scored as the parent; rows already included by
+        a better parent's window are not repeated.
+        """
+        eligible = None if ids is None else set(np.asarray(ids).tolist())
+        seen, out = set(), []
+        for score, row in ranked:
+            before, after, r = [], [], row
+            for _ in range(width):
+                r = int(self.prev_row[r])
+                if r < 0:
+                    break
+                before.insert(0, r)
+            r = row
+            for _ in range(width):
+                r = int(self.next_row[r])
+                if r < 0:
+                    break
+                after.append(r)
+            for r in before + [row] + after:
+                if r in seen or (eligible is not None and r not in eligible):
+                    continue
+                seen.add(r)
+                out.append((score, r))
+        return out
+
+
+# --- Build ---
+def main():
+    from backends import get_embedder
+    from load import embed_texts
+
+    with open(METADATA_FILE, "r", encoding="utf-8") as f:
+        metadata = json.load(f)
+
+    units, unit_parent = [], []
+    for row, rec in enumerate(metadata):
+        for unit in split_units(rec["text"], rec.get("speakers") or []):
+            units.append({"parent": row, "text": unit})
+            unit_parent.append(row)
+    logging.info(f"Split {len(metadata)} chunks into {len(units)} units "
+                 f"(avg {sum(len(u['text'].split()) for u in units) / max(1, len(units)):.0f} words)")
+
+    embeddings = embed_texts(get_embedder(EMBED_MODEL), [u["text"] for u in units])
+    ids = np.array([i for i, e in enumerate(embeddings) if e is not None], dtype="int64")
+    if not len(ids):
+        logging.error("No valid unit embeddings to index. Exiting.")
+        exit(1)
+    mat = truncate_and_normalize(np.array([embeddings[i] for i in ids], dtype="float32"), OUTPUT_DIM)
+    index = build_index(mat, FINE_QUANTIZATION, ids=ids)
+
+    tmp = FINE_INDEX_FILE + ".tmp"
+    faiss.write_index(index, tmp)
+    os.replace(tmp, FINE_INDEX_FILE)
+
+    prev_row, next_row = neighbour_rows(metadata)
+    tmp = FINE_MAP_FILE + ".tmp.npz"
+    np.savez(tmp, unit_parent=np.array(unit_parent, dtype="int64"), prev_row=prev_row, next_row=next_row)
+    os.replace(tmp, FINE_MAP_FILE)
+
+    tmp = FINE_UNITS_FILE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(units, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, FINE_UNITS_FILE)
+
+    logging.info(f"✅ Saved fine index with {index.ntotal} of {len(units)} units ({mat.shape[1]} dims) "
+                 f"to '{FINE_INDEX_FILE}', maps to '{FINE_MAP_FILE}'")
+
+
+if __name__ == "__main__":
+    main()
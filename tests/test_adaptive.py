@@ -0,0 +1,44 @@
+from adaptive import cut_depth, is_flat
+
+
+def test_steep_drop_cuts_at_the_elbow():
+    scores = [0.82, 0.80, 0.79, 0.78, 0.41, 0.40, 0.39, 0.38]
+    assert cut_depth(scores, min_k=2, rel_threshold=0.3, elbow_ratio=2.0) == 4
+
+
+def test_relative_threshold_cuts_before_the_tail():
+    scores = [0.80, 0.78, 0.76, 0.74, 0.30, 0.29]
+    # 0.30 < 0.5 * 0.80, so the tail is cut even without an elbow check
+    assert cut_depth(scores, min_k=2, rel_threshold=0.5, elbow_ratio=100.0) == 4
+
+
+def test_flat_curve_keeps_everything():
+    scores = [0.70 - 0.01 * i for i in range(20)]
+    assert cut_depth(scores, min_k=3, rel_threshold=0.5, elbow_ratio=2.0) == 20
+    assert cut_depth([0.5] * 10, min_k=3, rel_threshold=0.5, elbow_ratio=2.0) == 10
+
+
+def test_never_cuts_below_the_minimum_depth():
+    scores = [0.90, 0.20, 0.19, 0.18]
+    assert cut_depth(scores, min_k=3, rel_threshold=0.5, elbow_ratio=2.0) == 3
+    # An elbow inside the first min_k is not a cut point
+    scores = [0.9, 0.5, 0.49, 0.48, 0.47]
+    assert cut_depth(scores, min_k=1, rel_threshold=0.1, elbow_ratio=2.0) == 1
+    assert cut_depth(scores, min_k=2, rel_threshold=0.1, elbow_ratio=2.0) == 5
+
+
+def test_fewer_candidates_than_the_minimum_depth():
+    assert cut_depth([0.9, 0.1], min_k=5, rel_threshold=0.5, elbow_ratio=2.0) == 2
+    assert cut_depth([], min_k=5, rel_threshold=0.5, elbow_ratio=2.0) == 0
+
+
+def test_non_positive_top_score_skips_the_relative_threshold():
+    scores = [-0.10, -0.11, -0.12, -0.13]
+    assert cut_depth(scores, min_k=2, rel_threshold=0.5, elbow_ratio=2.0) == 4
+
+
+def test_is_flat():
+    assert is_flat([0.50, 0.49, 0.48, 0.10], top_n=3, spread=0.05)
+    assert not is_flat([0.80, 0.60, 0.50], top_n=3, spread=0.05)
+    assert is_flat([0.8, 0.3], top_n=1, spread=0.05)  # a single score has no spread
+    assert not is_flat([], top_n=3, spread=0.05)
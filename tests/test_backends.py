@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+
+from backends import DocumentSource, Embedder, Generator, HashingEmbedder
+from compression import truncate_and_normalize
+
+
+def test_reduced_width_hashing_matches_truncated_full_width():
+    embedder = HashingEmbedder(dim=768)
+    texts = ["What did Mack say about event tracking intervals?", "retention numbers for June"]
+    full = np.array(embedder.embed(texts), dtype="float32")
+    reduced = np.array(embedder.embed(texts, 256), dtype="float32")
+    assert reduced.shape == (2, 256)
+    np.testing.assert_allclose(reduced, truncate_and_normalize(full, 256), atol=1e-6)
+
+
+def test_hashing_cannot_widen_past_hash_dim():
+    with pytest.raises(ValueError):
+        HashingEmbedder(dim=64).embed(["text"], 128)
+
+
+@pytest.mark.parametrize("base", [Embedder, Generator, DocumentSource])
+def test_incomplete_backends_fail_at_construction(base):
+    incomplete = type("Incomplete", (base,), {})
+    with pytest.raises(TypeError):
+        incomplete()
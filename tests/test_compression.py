@@ -0,0 +1,74 @@
+import faiss
+import numpy as np
+import pytest
+
+from compression import build_index, new_index, to_ondisk_ivf, truncate_and_normalize
+from shared_store import read_index
+
+
+def corpus(n=2000, dim=32, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(20, dim))
+    mat = centers[rng.integers(20, size=n)] + 0.3 * rng.normal(size=(n, dim))
+    return truncate_and_normalize(mat.astype("float32"))
+
+
+def recall_at_10(index, mat, queries):
+    _, exact = faiss.knn(queries, mat, 10, metric=faiss.METRIC_INNER_PRODUCT)
+    _, found = index.search(queries, 10)
+    return np.mean([len(set(e) & set(f)) / 10 for e, f in zip(exact, found)])
+
+
+def test_truncate_and_normalize():
+    mat = np.array([[3.0, 4.0, 12.0]], dtype="float64")
+    assert np.allclose(truncate_and_normalize(mat), [[3 / 13, 4 / 13, 12 / 13]])
+    out = truncate_and_normalize(mat, 2)
+    assert out.dtype == np.float32 and np.allclose(out, [[0.6, 0.8]])
+    assert truncate_and_normalize(mat, 5).shape == (1, 3)  # wider than the source keeps everything
+
+
+@pytest.mark.parametrize("quantization, use_ivf, min_recall", [
+    ("none", False, 1.0),
+    ("fp16", False, 0.99),
+    ("int8", False, 0.9),
+    ("pq", False, 0.55),
+    ("fp16", True, 0.95),
+    ("pq", True, 0.65),
+])
+def test_recall_per_quantization(quantization, use_ivf, min_recall):
+    mat = corpus()
+    queries = mat[:50] + 0.05 * np.random.default_rng(1).normal(size=(50, mat.shape[1])).astype("float32")
+    index = build_index(mat, quantization, use_ivf, num_clusters=16, pq_m=16, pq_nbits=8)
+    if use_ivf:
+        faiss.extract_index_ivf(index).nprobe = 8
+    assert index.ntotal == len(mat)
+    assert recall_at_10(index, mat, truncate_and_normalize(queries)) >= min_recall
+
+
+def test_scalar_quantizers_round_trip():
+    mat = corpus(500)
+    for quantization, tol in (("fp16", 1e-3), ("int8", 2e-2)):
+        index = build_index(mat, quantization)
+        assert np.abs(index.reconstruct_n(0, len(mat)) - mat).max() < tol
+
+
+def test_pq_bits_are_capped_by_the_training_set():
+    index = new_index(32, "pq", pq_m=8, pq_nbits=8, n_train=100)
+    assert index.pq.nbits == 6  # 2**6 <= 100 training vectors
+    with pytest.raises(ValueError):
+        new_index(30, "pq", pq_m=8)
+    with pytest.raises(ValueError):
+        new_index(32, "bf16")
+
+
+def test_external_ids_and_ondisk_lists(tmp_path):
+    mat = corpus(500)
+    ids = np.arange(len(mat), dtype="int64") * 3 + 7
+    index = build_index(mat, "int8", True, num_clusters=8, ids=ids)
+    path = str(tmp_path / "ivf.index")
+    to_ondisk_ivf(index, path + ".ivfdata")
+    faiss.write_index(index, path)
+    loaded = read_index(path)  # as served: codes and lists memory-mapped
+    faiss.extract_index_ivf(loaded).nprobe = 8
+    _, found = loaded.search(mat[:5], 1)
+    assert found.ravel().tolist() == ids[:5].tolist()
@@ -0,0 +1,70 @@
+from dedupe import clusters_from_pairs, collapse, merge_cluster, minhash_pairs, minhash_signatures
+from filters import locations
+
+
+def rec(text, source, chunk, speakers=(), **extra):
+    return {"text": text, "source_id": source, "chunk_index": chunk, "speaker": (list(speakers) or ["Unknown"])[0],
+            "speakers": list(speakers), "timestamp": "", "date": "2025-06-01", **extra}
+
+
+def test_clusters_are_transitive():
+    # 0-3 and 3-5 join 0, 3 and 5 although 0 and 5 were never paired
+    assert clusters_from_pairs(6, [(3, 5), (0, 3), (1, 2)]) == [[0, 3, 5], [1, 2], [4]]
+
+
+def test_clusters_without_pairs_are_singletons():
+    assert clusters_from_pairs(3, []) == [[0], [1], [2]]
+
+
+def test_clusters_ignore_pair_order_and_repeats():
+    pairs = [(4, 1), (1, 4), (2, 0), (4, 2)]
+    assert clusters_from_pairs(5, pairs) == [[0, 1, 2, 4], [3]]
+
+
+def test_clusters_chain_through_many_rows():
+    n = 1000
+    clusters = clusters_from_pairs(n, [(i + 1, i) for i in range(n - 1)])
+    assert clusters == [list(range(n))]
+
+
+def test_locations_of_a_plain_row():
+    assert locations(rec("a", "doc1", 3, ["Ann"])) == [
+        {"source_id": "doc1", "chunk_index": 3, "speaker": "Ann", "timestamp": "", "date": "2025-06-01"}
+    ]
+
+
+def test_collapse_prefers_longest_text_with_an_embedding():
+    metadata = [rec("short", "d", 0), rec("the longest text", "d", 1), rec("longer text", "d", 2)]
+    assert collapse([0, 1, 2], metadata, [True, False, True]) == 2
+    assert collapse([0, 1], metadata, [False, False]) == 1  # no embeddings at all: longest text
+
+
+def test_merge_cluster_lists_representative_location_first():
+    metadata = [rec("a", "doc1", 0, ["Ann"]), rec("b", "doc2", 4, ["Bob", "Ann"]), rec("c", "doc1", 7, ["Cy"])]
+    merged = merge_cluster([0, 1, 2], 1, metadata)
+    assert merged["text"] == "b"
+    assert [(loc["source_id"], loc["chunk_index"]) for loc in merged["locations"]] == [
+        ("doc2", 4), ("doc1", 0), ("doc1", 7)
+    ]
+    assert merged["speakers"] == ["Ann", "Bob", "Cy"]
+    assert "locations" not in metadata[1]  # input records are left alone
+
+
+def test_merge_cluster_keeps_locations_of_already_merged_members():
+    inner = merge_cluster([0, 1], 0, [rec("a", "doc1", 0), rec("a", "doc2", 0)])
+    merged = merge_cluster([0, 1], 1, [rec("z", "doc3", 2), inner])
+    assert [(loc["source_id"], loc["chunk_index"]) for loc in merged["locations"]] == [
+        ("doc1", 0), ("doc2", 0), ("doc3", 2)
+    ]
+
+
+def test_singleton_cluster_is_unchanged():
+    metadata = [rec("a", "doc1", 0, ["Ann"])]
+    assert merge_cluster([0], 0, metadata) == metadata[0]
+
+
+def test_minhash_pairs_find_near_duplicates_only():
+    base = "the quarterly numbers came in above the forecast for event tracking and retention " * 3
+    texts = [base, base + "thanks", "something else entirely about hiring plans and the offsite agenda " * 3]
+    pairs = minhash_pairs(minhash_signatures(texts), bands=32, threshold=0.7)
+    assert [tuple(sorted(p)) for p in pairs] == [(0, 1)]
@@ -0,0 +1,56 @@
+import faiss
+import numpy as np
+
+from doc_index import DocIndex, document_rows
+
+
+def make_doc_index(tmp_path, metadata):
+    source_ids, doc_rows = document_rows(metadata, len(metadata))
+    centroids = np.eye(max(4, len(source_ids)), 4, dtype="float32")[:len(source_ids)]  # doc i along axis i
+    index = faiss.IndexIDMap2(faiss.IndexFlatIP(4))
+    index.add_with_ids(centroids, np.arange(len(source_ids), dtype="int64"))
+    faiss.write_index(index, str(tmp_path / "doc.index"))
+    offsets = np.cumsum([0] + [len(r) for r in doc_rows]).astype("int64")
+    np.savez(tmp_path / "doc.npz", source_ids=np.array(source_ids), offsets=offsets,
+             rows=np.concatenate([np.asarray(r, dtype="int64") for r in doc_rows]))
+    return DocIndex(str(tmp_path / "doc.index"), str(tmp_path / "doc.npz"))
+
+
+METADATA = [
+    {"source_id": "a", "chunk_index": 0},
+    {"source_id": "b", "chunk_index": 0},
+    # Collapsed by dedupe.py: stands for chunks of both a and c
+    {"source_id": "a", "chunk_index": 1,
+     "locations": [{"source_id": "a", "chunk_index": 1}, {"source_id": "c", "chunk_index": 3}]},
+    {"source_id": "c", "chunk_index": 0},
+    {"source_id": "b", "chunk_index": 1},
+]
+
+
+def test_docs_with_maps_rows_to_all_their_documents(tmp_path):
+    docs = make_doc_index(tmp_path, METADATA)
+    assert list(docs.source_ids) == ["a", "b", "c"]
+    assert docs.docs_with(np.array([1])).tolist() == [1]
+    assert docs.docs_with(np.array([2])).tolist() == [0, 2]
+    assert docs.docs_with(np.array([4, 3])).tolist() == [1, 2]
+    assert docs.docs_with(np.array([], dtype="int64")).tolist() == []
+    assert docs.docs_with(np.array([99])).tolist() == []  # rows outside the index are ignored
+
+
+def test_docs_with_matches_a_scan_over_every_row(tmp_path):
+    rng = np.random.default_rng(0)
+    metadata = [{"source_id": f"doc{rng.integers(20)}", "chunk_index": i} for i in range(500)]
+    docs = make_doc_index(tmp_path, metadata)
+    pair_docs = np.repeat(np.arange(len(docs)), np.diff(docs.offsets))
+    for _ in range(20):
+        ids = np.sort(rng.choice(500, rng.integers(1, 40), replace=False))
+        assert np.array_equal(docs.docs_with(ids), np.unique(pair_docs[np.isin(docs.rows, ids)]))
+
+
+def test_search_restricts_documents_and_rows_to_ids(tmp_path):
+    docs = make_doc_index(tmp_path, METADATA)
+    q = np.array([[0.0, 1.0, 0.0, 0.0]], dtype="float32")  # closest to document b
+    _, hits, rows = docs.search(q, 1)
+    assert hits == [1] and rows.tolist() == [1, 4]
+    _, hits, rows = docs.search(q, 1, ids=np.array([2, 3]))  # b is filtered out
+    assert hits[0] in (0, 2) and set(rows.tolist()) <= {2, 3}
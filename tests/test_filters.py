@@ -0,0 +1,63 @@
+from filters import build_postings, infer_filters, locations, select_ids
+
+METADATA = [
+    {"text": "t0", "speaker": "Mack Myers", "speakers": ["Mack Myers"], "date": "2025-06-02", "source_id": "a"},
+    {"text": "t1", "speaker": "Ann Lee", "speakers": ["Ann Lee", "Mack Myers"], "date": "2025-06-02", "source_id": "a"},
+    {"text": "t2", "speaker": "Ann Lee", "speakers": ["Ann Lee"], "date": "2025-06-09", "source_id": "b"},
+    {"text": "t3", "speaker": "Unknown", "speakers": [], "date": "", "source_id": "c"},
+    # Collapsed by dedupe.py: also stands for a chunk of d, said by Bo Chen on 2025-07-01
+    {"text": "t4", "speaker": "Ann Lee", "speakers": ["Ann Lee"], "date": "2025-06-09", "source_id": "b",
+     "locations": [{"source_id": "b", "speaker": "Ann Lee", "date": "2025-06-09"},
+                   {"source_id": "d", "speaker": "Bo Chen", "date": "2025-07-01"}]},
+]
+POSTINGS = build_postings(METADATA)
+
+
+def ids(filters):
+    rows = select_ids(POSTINGS, filters)
+    return None if rows is None else rows.tolist()
+
+
+def test_postings_cover_every_location():
+    assert POSTINGS["speaker"]["mack myers"] == [0, 1]
+    assert POSTINGS["speaker"]["bo chen"] == [4]
+    assert "unknown" not in POSTINGS["speaker"]
+    assert POSTINGS["date"]["2025-07-01"] == [4]
+    assert POSTINGS["source_id"]["b"] == [2, 4] and POSTINGS["source_id"]["d"] == [4]
+
+
+def test_locations_default_to_the_row_itself():
+    assert locations(METADATA[0])[0]["source_id"] == "a"
+    assert [loc["source_id"] for loc in locations(METADATA[4])] == ["b", "d"]
+
+
+def test_no_filters_search_everything():
+    assert ids(None) is None and ids({}) is None
+
+
+def test_speaker_filter_is_case_and_space_insensitive():
+    assert ids({"speaker": "  ann   LEE "}) == [1, 2, 4]
+    assert ids({"speaker": ["Bo Chen", "Mack Myers"]}) == [0, 1, 4]
+
+
+def test_date_filters():
+    assert ids({"date": "2025-06-02"}) == [0, 1]
+    assert ids({"date_from": "2025-06-03", "date_to": "2025-06-30"}) == [2, 4]
+    assert ids({"date_from": "2025-06-09"}) == [2, 4]
+    assert ids({"date_to": "2025-06-02"}) == [0, 1]
+
+
+def test_filters_are_intersected():
+    assert ids({"speaker": "Ann Lee", "date": "2025-06-02"}) == [1]
+    assert ids({"speaker": "Ann Lee", "source_id": ["a", "d"]}) == [1, 4]
+
+
+def test_empty_intersection_matches_nothing():
+    assert ids({"speaker": "Mack Myers", "source_id": "b"}) == []
+    assert ids({"speaker": "Nobody"}) == []
+    assert ids({"date_from": "2026-01-01"}) == []
+
+
+def test_infer_filters_finds_whole_speaker_names():
+    assert infer_filters("What did Ann Lee say about pricing?", POSTINGS) == {"speaker": ["ann lee"]}
+    assert infer_filters("What did Annie say?", POSTINGS) is None
@@ -0,0 +1,34 @@
+import numpy as np
+
+from mmr import mmr_select, normalize_rows, redundancy
+
+# Candidates 0 and 1 are near-duplicates that both score highly
+VECS = normalize_rows([
+    [1.0, 0.0, 0.0],
+    [0.99, 0.05, 0.0],
+    [0.0, 1.0, 0.0],
+    [0.0, 0.0, 1.0],
+])
+RELEVANCE = np.array([0.90, 0.89, 0.70, 0.50])
+
+
+def test_near_duplicates_do_not_share_the_top_two():
+    top = mmr_select(RELEVANCE, VECS, 2, lambda_=0.5)
+    assert top == [0, 2]
+
+
+def test_lambda_one_keeps_relevance_order():
+    assert mmr_select(RELEVANCE, VECS, 4, lambda_=1.0) == [0, 1, 2, 3]
+
+
+def test_selection_is_a_permutation_of_at_most_k():
+    assert sorted(mmr_select(RELEVANCE, VECS, 10, lambda_=0.3)) == [0, 1, 2, 3]
+    assert mmr_select(RELEVANCE, VECS, 0, lambda_=0.5) == []
+    assert mmr_select(np.full(4, 0.8), VECS, 1, lambda_=0.5) == [0]  # equal scores: first wins
+
+
+def test_redundancy():
+    assert redundancy(VECS[:1]) == 0.0
+    assert redundancy(VECS[[2, 3]]) == 0.0
+    assert redundancy(VECS[[0, 1]]) > 0.99
+    assert np.allclose(np.linalg.norm(normalize_rows([[3.0, 4.0], [0.0, 0.0]]), axis=1), [1.0, 0.0])
@@ -0,0 +1,64 @@
+import re
+
+import numpy as np
+import pytest
+
+from rerank import TokenMatrix, hybrid_rerank_batch
+
+CHUNKS = [
+    "The budget for Q3 is final.",
+    "Ann will send the hiring plan.",
+    "We discussed the budget and the hiring freeze.",
+    "Lunch options for the offsite.",
+    "The offsite budget was approved by finance.",
+    "Nothing about money here, only the roadmap.",
+    "Hiring: two engineers, one designer.",
+    "Finance wants the Q3 numbers by Friday.",
+]
+QUERIES = ["What is the Q3 budget?", "who is hiring engineers", "offsite lunch", "zebra"]
+
+
+def reference_rerank(query, dense_scores, dense_indices, top_k):
+    """The original per-candidate Python loop."""
+    q_tokens = set(re.findall(r"\w+", query.lower()))
+    hybrid = []
+    for score, idx in zip(dense_scores, dense_indices):
+        words = re.findall(r"\w+", CHUNKS[idx].lower())
+        overlap = len(q_tokens.intersection(words)) / (len(q_tokens) + 1)
+        hybrid.append((0.8 * score + 0.2 * overlap, idx))
+    hybrid.sort(key=lambda x: x[0], reverse=True)
+    return hybrid[:top_k]
+
+
+@pytest.mark.parametrize("top_k", [1, 3, 6, 10])
+def test_batch_matches_a_per_query_loop(top_k):
+    rng = np.random.default_rng(top_k)
+    tokens = TokenMatrix(CHUNKS)
+    I = np.array([rng.permutation(len(CHUNKS))[:6] for _ in QUERIES], dtype="int64")
+    D = rng.uniform(0.2, 0.9, size=I.shape).astype("float32")
+
+    batch = hybrid_rerank_batch(QUERIES, D, I, tokens, top_k)
+    for q, (query, got) in enumerate(zip(QUERIES, batch)):
+        single = hybrid_rerank_batch([query], D[q:q + 1], I[q:q + 1], tokens, top_k)[0]
+        expected = reference_rerank(query, D[q].tolist(), I[q].tolist(), top_k)
+        assert got == single
+        assert [i for _, i in got] == [i for _, i in expected]
+        assert [s for s, _ in got] == pytest.approx([s for s, _ in expected], abs=1e-6)
+
+
+def test_padding_is_dropped():
+    tokens = TokenMatrix(CHUNKS)
+    D = np.array([[0.9, 0.5, -1e9]], dtype="float32")
+    I = np.array([[2, 0, -1]], dtype="int64")
+    out = hybrid_rerank_batch(["budget"], D, I, tokens, 5)[0]
+    assert [i for _, i in out] == [2, 0]
+
+
+def test_saved_matrix_loads_memory_mapped(tmp_path):
+    tokens = TokenMatrix(CHUNKS)
+    prefix = str(tmp_path / "tokens")
+    tokens.save(prefix)
+    assert TokenMatrix.exists(prefix)
+    loaded = TokenMatrix.load(prefix)
+    assert loaded.vocab == tokens.vocab
+    assert (loaded.matrix != tokens.matrix).nnz == 0
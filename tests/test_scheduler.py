@@ -0,0 +1,141 @@
+import threading
+import time
+
+import pytest
+
+from scheduler import GenerationScheduler
+
+
+def wait_for(condition, timeout_s=2.0):
+    deadline = time.monotonic() + timeout_s
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not reached")
+        time.sleep(0.001)
+
+
+def queue_requests(scheduler, requests, order):
+    """Start one thread per (user, priority), each queued before the next starts."""
+    threads = []
+    for user, priority in requests:
+        def run(user=user, priority=priority):
+            admission = scheduler.acquire(user, priority)
+            order.append((user, admission.shed))
+            if admission.shed is None:
+                scheduler.release()
+        depth = scheduler.depth()
+        t = threading.Thread(target=run)
+        t.start()
+        wait_for(lambda: scheduler.depth() == depth + 1)
+        threads.append(t)
+    return threads
+
+
+def test_free_slot_is_granted_without_queueing():
+    s = GenerationScheduler(2)
+    first, second = s.acquire("a"), s.acquire("b")
+    assert (first.shed, first.queued_s, second.shed) == (None, 0.0, None)
+    assert s.inflight() == 2 and s.depth() == 0
+    s.release()
+    s.release()
+    assert s.inflight() == 0
+
+
+def test_users_are_served_round_robin():
+    s = GenerationScheduler(1)
+    s.acquire("holder")
+    order = []
+    threads = queue_requests(s, [("hog", "normal")] * 4 + [("alice", "normal")], order)
+    s.release()
+    for t in threads:
+        t.join(2)
+    # alice waits behind one of hog's requests, not all four
+    assert [user for user, _ in order] == ["hog", "alice", "hog", "hog", "hog"]
+    assert s.inflight() == 0 and s.depth() == 0
+
+
+def test_normal_priority_is_served_before_low():
+    s = GenerationScheduler(1)
+    s.acquire("holder")
+    order = []
+    threads = queue_requests(s, [("batch", "low"), ("batch", "low"), ("ann", "normal")], order)
+    s.release()
+    for t in threads:
+        t.join(2)
+    assert [user for user, _ in order] == ["ann", "batch", "batch"]
+
+
+def test_release_hands_the_slot_to_the_next_request():
+    s = GenerationScheduler(1)
+    s.acquire("holder")
+    granted = threading.Event()
+    t = threading.Thread(target=lambda: (s.acquire("next"), granted.set()))
+    t.start()
+    wait_for(lambda: s.depth() == 1)
+    s.release()
+    assert granted.wait(2)
+    # The slot passed straight on: still one in flight, nobody waiting, and a
+    # newcomer has to queue rather than slip in between
+    assert s.inflight() == 1 and s.depth() == 0
+    s.release()
+    t.join(2)
+    assert s.inflight() == 0
+
+
+def test_low_priority_is_shed_when_the_queue_is_deep():
+    s = GenerationScheduler(1, shed_depth=2)
+    s.acquire("holder")
+    order = []
+    threads = queue_requests(s, [("a", "normal"), ("b", "normal")], order)
+    shed = s.acquire("c", "low")
+    assert shed.shed == "queue_depth" and shed.queued_s == 0.0
+    assert s.depth() == 2 and s.inflight() == 1  # a shed request holds no slot
+    # Normal priority still queues at the same depth
+    threads += queue_requests(s, [("d", "normal")], order)
+    s.release()
+    for t in threads:
+        t.join(2)
+    assert [shed for _, shed in order] == [None, None, None]
+    assert s.inflight() == 0 and s.depth() == 0
+
+
+def test_request_queued_past_the_timeout_is_shed():
+    s = GenerationScheduler(1, queue_timeout_s=0.05)
+    s.acquire("holder")
+    admission = s.acquire("late")
+    assert admission.shed == "queue_timeout"
+    assert admission.queued_s >= 0.05
+    assert s.depth() == 0 and s.inflight() == 1
+    s.release()
+    assert s.inflight() == 0
+
+
+@pytest.mark.parametrize("round_", range(20))
+def test_timeout_racing_a_release_never_leaks_a_slot(round_):
+    s = GenerationScheduler(1, queue_timeout_s=0.01)
+    s.acquire("holder")
+    result = []
+    t = threading.Thread(target=lambda: result.append(s.acquire("racer")))
+    t.start()
+    time.sleep(0.009 + round_ * 0.0002)  # release lands around the timeout
+    s.release()
+    t.join(2)
+    if result[0].shed is None:
+        s.release()
+    assert s.inflight() == 0 and s.depth() == 0
+
+
+def test_slot_releases_only_granted_admissions():
+    s = GenerationScheduler(1, shed_depth=1)
+    s.acquire("holder")
+    order = []
+    threads = queue_requests(s, [("a", "normal")], order)
+    with s.slot("b", "low") as admission:
+        assert admission.shed == "queue_depth"
+    assert s.inflight() == 1  # leaving a shed slot released nothing
+    s.release()
+    for t in threads:
+        t.join(2)
+    with s.slot("c") as admission:
+        assert admission.shed is None and s.inflight() == 1
+    assert s.inflight() == 0
@@ -0,0 +1,82 @@
+import numpy as np
+
+from compression import build_index, truncate_and_normalize
+from shards import ShardedIndex, build_shards, merge_topk
+
+METADATA = [{"source_id": s, "date": d} for s, d in [
+    ("a", "2025-05-02"), ("a", "2025-05-02"), ("b", "2025-06-06"), ("b", "2025-06-06"),
+    ("c", "2025-06-20"), ("c", "2025-06-20"), ("d", "2025-07-01"), ("d", "2025-07-01"),
+]]
+CONFIG = {"quantization": "none"}
+
+
+def build(vecs, ids):
+    return build_index(vecs, "none", ids=ids)
+
+
+def corpus():
+    return truncate_and_normalize(np.random.default_rng(0).normal(size=(len(METADATA), 8)).astype("float32"))
+
+
+def test_merge_topk_pads_when_shards_return_fewer_than_k():
+    D = np.array([[0.9, 0.2, -np.inf, 0.5]], dtype="float32")
+    I = np.array([[4, 7, -1, 1]], dtype="int64")
+    D_top, I_top = merge_topk(D, I, 6)
+    assert I_top.tolist() == [[4, 1, 7, -1, -1, -1]]
+    assert D_top[0, :3].tolist() == np.float32([0.9, 0.5, 0.2]).tolist()
+    assert np.isneginf(D_top[0, 3:]).all()
+
+
+def test_merge_topk_keeps_the_global_best():
+    D = np.array([[0.1, 0.8, 0.3, 0.7], [0.6, 0.5, 0.4, 0.9]], dtype="float32")
+    I = np.array([[10, 11, 20, 21], [10, 11, 20, -1]], dtype="int64")
+    _, I_top = merge_topk(D, I, 2)
+    assert I_top.tolist() == [[11, 21], [10, 11]]  # padding never wins, whatever its score
+
+
+def test_sharded_search_matches_a_flat_search(tmp_path):
+    mat = corpus()
+    build_shards(mat, METADATA, "source_id", str(tmp_path), build, CONFIG)
+    index = ShardedIndex(str(tmp_path), workers=2)
+    assert len(index.shards) == 4 and index.ntotal == len(mat)
+    D, I = index.search(mat[:3], 4)
+    assert I[:, 0].tolist() == [0, 1, 2]  # each vector finds its own row, by global row number
+    expected = np.argsort(-(mat[:3] @ mat.T), axis=1, kind="stable")[:, :4]
+    assert I.tolist() == expected.tolist()
+
+
+def test_filtered_query_only_touches_intersecting_shards(tmp_path):
+    mat = corpus()
+    build_shards(mat, METADATA, "month", str(tmp_path), build, CONFIG)
+    index = ShardedIndex(str(tmp_path), workers=2)
+    assert index.keys == ["2025-05", "2025-06", "2025-07"]
+
+    routes = index._route(np.array([2, 4, 5]))  # June rows only
+    assert [index.keys[s] for s, _ in routes] == ["2025-06"]
+    assert routes[0][1].tolist() == [2, 4, 5]
+    routes = index._route(np.array([1, 6]))
+    assert [(index.keys[s], ids.tolist()) for s, ids in routes] == [("2025-05", [1]), ("2025-07", [6])]
+    assert index._route(np.array([], dtype="int64")) == []
+    assert len(index._route(None)) == 3
+
+    searched = []
+    search_shard = index._search_shard
+    index._search_shard = lambda s, *args: searched.append(index.keys[s]) or search_shard(s, *args)
+    _, I = index.search(mat[:1], 5, np.array([1, 6]))
+    assert sorted(searched) == ["2025-05", "2025-07"]
+    assert sorted(i for i in I[0].tolist() if i >= 0) == [1, 6]
+
+
+def test_rebuild_only_rewrites_changed_shards_and_skips_unindexed_rows(tmp_path):
+    mat = corpus()
+    build_shards(mat, METADATA, "source_id", str(tmp_path), build, CONFIG)
+    before = {p.name: p.stat().st_mtime_ns for p in tmp_path.glob("*.index")}
+    # Row 3 (shard b) is now a failed embedding and is left out
+    rows = [r for r in range(len(mat)) if r != 3]
+    manifest = build_shards(mat, METADATA, "source_id", str(tmp_path), build, CONFIG, rows=rows)
+    after = {p.name: p.stat().st_mtime_ns for p in tmp_path.glob("*.index")}
+    changed = [name for name in before if before[name] != after[name]]
+    assert changed == [manifest["shards"]["b"]["file"]]
+    assert manifest["shards"]["b"]["count"] == 1 and manifest["count"] == len(mat) - 1
+    index = ShardedIndex(str(tmp_path))
+    assert 3 not in np.concatenate(index.shard_ids).tolist()
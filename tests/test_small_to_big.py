@@ -0,0 +1,89 @@
+import faiss
+import numpy as np
+
+from small_to_big import FineIndex, neighbour_rows, split_units
+
+METADATA = [
+    {"source_id": "a", "chunk_index": 0},
+    {"source_id": "a", "chunk_index": 1},
+    {"source_id": "a", "chunk_index": 2},
+    {"source_id": "a", "chunk_index": 3},
+    {"source_id": "b", "chunk_index": 0},
+    # Collapsed by dedupe.py: also stands for chunk 1 of b
+    {"source_id": "c", "chunk_index": 0,
+     "locations": [{"source_id": "c", "chunk_index": 0}, {"source_id": "b", "chunk_index": 1}]},
+]
+UNIT_PARENT = np.array([0, 0, 1, 1, 2, 2, 3, 3, 4, 4, 5, 5], dtype="int64")
+
+
+def unit_vectors():
+    """Unit i along axis i, except the ones a query along axis 0 should hit."""
+    vecs = np.eye(12, dtype="float32")
+    hits = {3: 1.0, 2: 0.9, 8: 0.8, 10: 0.7}  # unit: cosine with the query
+    for unit, cos in hits.items():
+        vecs[unit] = 0.0
+        vecs[unit, 0], vecs[unit, unit] = cos, np.sqrt(1 - cos ** 2)
+    vecs[0] = np.eye(12, dtype="float32")[11]  # row 0 shares nothing with the query
+    return vecs
+
+
+def make_fine_index(tmp_path):
+    vecs = unit_vectors()
+    indexed = np.array([u for u in range(12) if u != 5], dtype="int64")  # unit 5 failed to embed
+    index = faiss.IndexIDMap2(faiss.IndexFlatIP(12))
+    index.add_with_ids(vecs[indexed], indexed)
+    faiss.write_index(index, str(tmp_path / "fine.index"))
+    prev_row, next_row = neighbour_rows(METADATA)
+    np.savez(tmp_path / "fine.npz", unit_parent=UNIT_PARENT, prev_row=prev_row, next_row=next_row)
+    return FineIndex(str(tmp_path / "fine.index"), str(tmp_path / "fine.npz"))
+
+
+QUERY = np.eye(1, 12, dtype="float32")
+
+
+def test_neighbour_rows_follow_chunk_index_and_collapsed_locations():
+    prev_row, next_row = neighbour_rows(METADATA)
+    assert prev_row.tolist() == [-1, 0, 1, 2, -1, -1]
+    assert next_row.tolist() == [1, 2, 3, -1, 5, -1]  # b:0 → b:1, held by row 5
+
+
+def test_search_parents_scores_each_parent_once_by_its_best_unit(tmp_path):
+    fine = make_fine_index(tmp_path)
+    scores, parents, hits = fine.search_parents(QUERY, 4)
+    assert parents == [1, 4, 5]  # units 3 and 2 both belong to row 1
+    assert scores == np.float32([1.0, 0.8, 0.7]).tolist()
+    assert hits == 4
+
+
+def test_search_parents_restricted_to_ids(tmp_path):
+    fine = make_fine_index(tmp_path)
+    _, parents, hits = fine.search_parents(QUERY, 4, ids=np.array([4, 5]))
+    assert parents == [4, 5] and hits == 4  # units 8-11, the only eligible ones
+    scores, parents, hits = fine.search_parents(QUERY, 4, ids=np.array([2]))
+    assert parents == [2] and hits == 1  # unit 5 was never indexed
+    assert fine.search_parents(QUERY, 4, ids=np.array([], dtype="int64")) == ([], [], 0)
+
+
+def test_expand_windows_stop_at_document_edges_and_do_not_repeat(tmp_path):
+    fine = make_fine_index(tmp_path)
+    assert fine.expand([(0.9, 0)], 2) == [(0.9, 0), (0.9, 1), (0.9, 2)]
+    assert fine.expand([(0.9, 3)], 1) == [(0.9, 2), (0.9, 3)]
+    assert fine.expand([(0.9, 4)], 3) == [(0.9, 4), (0.9, 5)]
+    # Row 2 is already in row 1's window, so row 3's window adds only row 3
+    assert fine.expand([(0.9, 1), (0.5, 3)], 1) == [(0.9, 0), (0.9, 1), (0.9, 2), (0.5, 3)]
+
+
+def test_expand_keeps_only_eligible_rows(tmp_path):
+    fine = make_fine_index(tmp_path)
+    assert fine.expand([(0.9, 1)], 1, ids=np.array([1, 2])) == [(0.9, 1), (0.9, 2)]
+
+
+def test_split_units_packs_long_turns_and_merges_short_ones():
+    text = "Ann Lee: One two three four five. Six seven eight nine ten. Mack Myers: Yeah. Mack Myers: Okay then we go."
+    # "Mack Myers: Yeah." is under UNIT_MIN_WORDS and joins the turn before it
+    assert split_units(text, ["Ann Lee", "Mack Myers"]) == [
+        "Ann Lee: One two three four five. Six seven eight nine ten. Mack Myers: Yeah.",
+        "Mack Myers: Okay then we go.",
+    ]
+    # Without turns, sentences are packed into windows of at most UNIT_MAX_WORDS
+    assert [len(u.split()) for u in split_units("One sentence. " * 40)] == [60, 20]
@@ -0,0 +1,48 @@
+from turns import annotate_chunks, extract_meeting_date, extract_turns, find_speakers
+
+TRANSCRIPT = (
+    "00:00:05 Mack Myers: Morning all. Note: the agenda changed. "
+    "Ann Lee: Thanks Mack. Ann Lee: One more thing. "
+    "00:01:10 Ann Lee: The budget is final. Mack Myers: Great. "
+    "Mack Myers: Moving on. Um Mack Myers: Sorry, one last point."
+)
+
+
+def test_find_speakers_from_timestamps_and_recurring_names():
+    # "Note:" is an ordinary colon and "Um Mack Myers" a filler glued to a name
+    assert find_speakers(TRANSCRIPT) == ["Ann Lee", "Mack Myers"]
+
+
+def test_extract_turns_keeps_explicit_timestamps_and_signs_turns():
+    turns = extract_turns(TRANSCRIPT, ["Ann Lee", "Mack Myers"])
+    assert [(speaker, ts) for _, speaker, ts, _ in turns][:4] == [
+        ("Mack Myers", "00:00:05"), ("Ann Lee", ""), ("Ann Lee", ""), ("Ann Lee", "00:01:10"),
+    ]
+    assert turns[0][0] == 0
+    assert turns[1][3] == "Ann Lee:Thanks Mack. Ann Lee: One more thing. 00:01:10"  # SIGNATURE_WORDS words
+    assert extract_turns(TRANSCRIPT, []) == []
+
+
+def test_extract_meeting_date_prefers_the_file_name():
+    assert extract_meeting_date("Notes Jun 2, 2025", "Meeting 2025/06/06") == "2025-06-06"
+    assert extract_meeting_date("Notes Jun 2, 2025") == "2025-06-02"
+    assert extract_meeting_date("Notes Sept 14, 2025") == "2025-09-14"
+    assert extract_meeting_date("no date here") == ""
+
+
+def test_annotate_chunks_carries_the_speaker_across_chunks():
+    chunks = [
+        "00:00:05 Mack Myers: Morning all, here is the plan for",
+        "the plan for the quarter. 00:02:00 Ann Lee: Sounds good.",
+        "Ann Lee: Sounds good. Mack Myers: Then we are done.",
+        "done and dusted.",
+    ]
+    notes = annotate_chunks(chunks, ["Ann Lee", "Mack Myers"])
+    assert [n["speaker"] for n in notes] == ["Mack Myers", "Mack Myers", "Ann Lee", "Mack Myers"]
+    assert [n["timestamp"] for n in notes] == ["00:00:05", "00:00:05", "00:02:00", "00:02:00"]
+    assert notes[1]["speakers"] == ["Mack Myers", "Ann Lee"]
+
+
+def test_annotate_chunks_without_turns_is_unknown():
+    notes = annotate_chunks(["just a summary", "with no speakers"])
+    assert [(n["speaker"], n["speakers"], n["timestamp"]) for n in notes] == [("Unknown", [], "")] * 2
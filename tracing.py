@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+tracing.py
+
+Per-request stage timings, structured query logging and latency histograms.
+
+A Trace collects stage timings (embed, search, rerank, prompt_build,
+generation_queue, ttft, generation, total) and request facts (token counts,
+cache hits, model, shed reason) for one query. Finished traces are:
+  * appended to query_logs.jsonl as one JSON line, through a logging
+    QueueHandler so the request thread never blocks on disk, with size-based
+    rotation by a RotatingFileHandler on the listener thread;
+  * observed into in-process histograms, rendered in Prometheus text format
+    by render_metrics() (served at /metrics by osiris_server.py), next to
+    the generation scheduler's queue-depth / in-flight gauges.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+# --- CONFIGURATION ---
+QUERY_LOG_FILE       = os.getenv("QUERY_LOG_FILE", "query_logs.jsonl")
+QUERY_LOG_ENABLED    = os.getenv("QUERY_LOG_ENABLED", "True").lower() == "true"
+QUERY_LOG_MAX_BYTES  = int(os.getenv("QUERY_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+QUERY_LOG_BACKUPS    = int(os.getenv("QUERY_LOG_BACKUPS", "5"))
+RESULT_PREVIEW_CHARS = 200
+
+# Histogram bucket upper bounds, seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+# --- Latency histograms ---
+class LatencyHistogram:
+    """Cumulative-bucket histogram keyed by a label value, Prometheus style."""
+
+    def __init__(self, name: str, help_text: str, label: str, buckets=LATENCY_BUCKETS):
+        self.name, self.help_text, self.label, self.buckets = name, help_text, label, buckets
+        self._lock = threading.Lock()
+        self._series: Dict[str, List[float]] = {}  # label → bucket counts + [sum, count]
+
+    def observe(self, label_value: str, seconds: float):
+        with self._lock:
+            series = self._series.setdefault(label_value, [0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series[i] += 1
+            series[-2] += seconds
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for value, series in sorted(self._series.items()):
+                lbl = f'{self.label}="{value}"'
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f'{self.name}_bucket{{{lbl},le="{bound}"}} {count}')
+                lines.append(f'{self.name}_bucket{{{lbl},le="+Inf"}} {series[-1]}')
+                lines.append(f"{self.name}_sum{{{lbl}}} {series[-2]:.6f}")
+                lines.append(f"{self.name}_count{{{lbl}}} {series[-1]}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name, self.help_text = name, help_text
+        self._lock = threading.Lock()
+        self._values: Dict[str, float] = {}  # rendered label set → value
+
+    def inc(self, amount: float = 1, **labels):
+        key = ",".join(f'{k}="{v}"' for k, v in sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{{{key}}} {value}" if key else f"{self.name} {value}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name: str, help_text: str):
+        self.name, self.help_text = name, help_text
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge", f"{self.name} {self.value}"]
+
+
+STAGE_LATENCY = LatencyHistogram(
+    "osiris_stage_latency_seconds", "Latency of each answer_question stage.", "stage"
+)
+REQUESTS = Counter("osiris_requests_total", "Finished requests by mode, model and status.")
+TOKENS   = Counter("osiris_tokens_total", "Prompt and output tokens by model.")
+RECALL_CHECKS = Counter(
+    "osiris_hierarchical_recall_checks_total", "Document-first searches compared against a flat search."
+)
+RECALL_SUM    = Counter(
+    "osiris_hierarchical_recall_sum", "Sum of sampled recall of document-first search against flat search."
+)
+GEN_QUEUE_DEPTH = Gauge("osiris_generation_queue_depth", "Requests waiting for a generation slot.")
+GEN_INFLIGHT    = Gauge("osiris_generation_inflight", "Generations holding a scheduler slot.")
+GEN_SHED        = Counter("osiris_generation_shed_total", "Requests shed to the fallback model, by reason.")
+METRICS  = [STAGE_LATENCY, REQUESTS, TOKENS, RECALL_CHECKS, RECALL_SUM, GEN_QUEUE_DEPTH, GEN_INFLIGHT, GEN_SHED]
+
+
+def render_metrics() -> str:
+    return "\n".join(line for metric in METRICS for line in metric.render()) + "\n"
+
+
+# --- Non-blocking, rotating query log ---
+_query_logger = logging.getLogger("osiris.query_log")
+_query_logger.propagate = False
+_listener: Optional[logging.handlers.QueueListener] = None
+_listener_lock = threading.Lock()
+
+
+def _start_query_log():
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            return
+        records = queue.Queue()
+        file_handler = logging.handlers.RotatingFileHandler(
+            QUERY_LOG_FILE, maxBytes=QUERY_LOG_MAX_BYTES, backupCount=QUERY_LOG_BACKUPS, encoding="utf-8"
+        )
+        file_handler.setFormatter(logging.Formatter("%(message)s"))
+        _query_logger.addHandler(logging.handlers.QueueHandler(records))
+        _query_logger.setLevel(logging.INFO)
+        _listener = logging.handlers.QueueListener(records, file_handler)
+        _listener.start()
+        atexit.register(_listener.stop)  # drain the queue on interpreter exit
+
+
+def write_query_log(record: dict):
+    if not QUERY_LOG_ENABLED:
+        return
+    _start_query_log()
+    _query_logger.info(json.dumps(record, ensure_ascii=False))
+
+
+# --- Per-request trace ---
+class Trace:
+    """Timings and facts for one request; finish() logs and observes it."""
+
+    def __init__(self, query: str, mode: str = "answer", **fields):
+        self._start = time.perf_counter()
+        self._finished = False
+        self.timings: Dict[str, float] = {}
+        self.record = {
+            "timestamp": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+            "query": query,
+            "mode": mode,
+            **fields,
+        }
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_timing(name, time.perf_counter() - start)
+
+    def add_timing(self, name: str, seconds: float):
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._start
+
+    def set(self, **fields):
+        self.record.update(fields)
+
+    def set_results(self, reranked, metadata):
+        self.record["results"] = [
+            {"score": score, "index": idx, "text": metadata[idx]["text"][:RESULT_PREVIEW_CHARS] + "..."}
+            for score, idx in reranked
+        ]
+
+    def finish(self, status: str = "ok", error: str = None) -> dict:
+        if self._finished:
+            return self.record
+        self._finished = True
+        self.timings["total"] = self.elapsed()
+        self.record["status"] = status
+        if error:
+            self.record["error"] = error
+        self.record["timings_ms"] = {k: round(v * 1000, 2) for k, v in self.timings.items()}
+
+        for name, seconds in self.timings.items():
+            STAGE_LATENCY.observe(name, seconds)
+        model = self.record.get("model", "none")
+        REQUESTS.inc(mode=self.record["mode"], model=model, status=status)
+        tokens = self.record.get("tokens") or {}
+        for kind in ("prompt", "output"):
+            if tokens.get(kind):
+                TOKENS.inc(tokens[kind], model=model, kind=kind)
+
+        write_query_log(self.record)
+        return self.record
@@ -3,54 +3,27 @@
 """
 fetch_and_chunk.py
 
-Fetch Google Docs → Normalize & Chunk → Save to timestamped JSONL
+Fetch Google Docs (or another document source) → Normalize & Chunk → Save to timestamped JSONL
 """
 
 import os
 import re
 import json
 from datetime import datetime
-from io import BytesIO
 from pathlib import Path
 from typing import List
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload
+
+from backends import get_source
+from turns import annotate_chunks, extract_meeting_date, find_speakers
 
 # === CONFIG ===
-KEY_FILE         = os.getenv("KEY_FILE", "sa-credentials.json")
-SCOPES           = ['https://www.googleapis.com/auth/drive.readonly', 'https://www.googleapis.com/auth/documents.readonly']
-INPUT_QUERY      = os.getenv("INPUT_QUERY", "mimeType='application/vnd.google-apps.document' and name contains 'Notes'")
 MAX_TOKENS       = int(os.getenv("MAX_TOKENS", "512"))
 OVERLAP_RATIO    = float(os.getenv("OVERLAP_RATIO", "0.2"))
 RUN_ID           = os.getenv("RUN_ID") or datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
 VERSION_TAG      = f"v1-{RUN_ID}"
 OUTPUT_JSONL     = f"transcripts_{RUN_ID}.jsonl"
 
-# === AUTH ===
-def get_drive_service():
-    creds = service_account.Credentials.from_service_account_file(KEY_FILE, scopes=SCOPES)
-    return build('drive', 'v3', credentials=creds)
-
 # === FUNCTIONS ===
-def find_doc_files(service, query: str) -> List[dict]:
-    results, token = [], None
-    while True:
-        resp = service.files().list(q=query, fields="nextPageToken, files(id, name)", pageSize=100, pageToken=token).execute()
-        results += resp.get('files', [])
-        token = resp.get('nextPageToken')
-        if not token:
-            break
-    return results
-
-def export_as_text(service, file_id: str) -> str:
-    req = service.files().export_media(fileId=file_id, mimeType='text/plain')
-    buf = BytesIO()
-    downloader = MediaIoBaseDownload(buf, req)
-    while not downloader.next_chunk()[1]:
-        continue
-    return buf.getvalue().decode('utf-8')
-
 def recursive_chunk(text: str, max_words: int, overlap: float) -> List[str]:
     words = text.split()
     step = int(max_words * (1 - overlap))
@@ -85,22 +58,24 @@ def main():
     Path(OUTPUT_JSONL).unlink(missing_ok=True)
     Path(OUTPUT_JSONL).touch()
 
-    drive = get_drive_service()
-    files = find_doc_files(drive, INPUT_QUERY)
+    source = get_source()  # Google Drive unless OSIRIS_SOURCE says otherwise
+    files = source.list_documents()
     print(f"📂 Found {len(files)} files")
 
     for f in files:
         print(f"→ Processing: {f['name']} ({f['id']})")
-        text = export_as_text(drive, f['id'])
+        text = source.read_text(f)
         chunks = normalize_and_chunk(text, MAX_TOKENS, OVERLAP_RATIO)
+        turns = annotate_chunks(chunks, find_speakers(text))
 
         record = {
             'version': VERSION_TAG,
             'timestamp': datetime.utcnow().isoformat(),
             'file_name': f['name'],
             'file_id': f['id'],
+            'meeting_date': extract_meeting_date(text, f['name']),
             'num_chunks': len(chunks),
-            'chunks': [{'id': i + 1, 'text': c} for i, c in enumerate(chunks)]
+            'chunks': [{'id': i + 1, 'text': c, **t} for i, (c, t) in enumerate(zip(chunks, turns))]
         }
         write_jsonl(OUTPUT_JSONL, record)
 
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+turns.py
+
+Speaker-turn and meeting-date extraction for Google Meet "Notes" exports.
+
+Transcript sections look like `00:17:49 Mack Myers: So it'll be ...` with
+an explicit timestamp every few turns and bare `Name:` prefixes in between.
+The speaker set is learned per document from the timestamped lines and
+from name-like prefixes that recur often enough, then used to find the bare
+turns, so ordinary colons in the text are not mistaken for turns.
+"""
+
+import re
+from collections import Counter
+from datetime import datetime
+from typing import Iterable, List, Optional, Tuple
+
+# `00:17:49 Mack Myers:` — up to four capitalised name parts
+TIMESTAMPED_TURN = re.compile(r"(\d{1,2}:\d{2}:\d{2})\s+([A-Z][\w.'-]*(?:\s+[A-Z][\w.'-]*){0,3}):")
+# `Mack Myers:` without a timestamp — two to four parts, no sentence punctuation
+BARE_TURN        = re.compile(r"(?<![\w'.-])([A-Z][\w'-]*(?:\s+[A-Z][\w'-]*){1,3}):")
+# `Notes Jun 2, 2025` header, or `2025/06/02` in a file name
+NOTES_DATE       = re.compile(r"Notes\s+([A-Z][a-z]{2,8})\.?\s+(\d{1,2}),\s+(\d{4})")
+FILE_NAME_DATE   = re.compile(r"(\d{4})[/-](\d{2})[/-](\d{2})")
+
+UNKNOWN_SPEAKER  = "Unknown"
+MIN_BARE_TURNS   = 3  # occurrences before an untimestamped name counts as a speaker
+SIGNATURE_WORDS  = 8  # words after a turn used to recognise it in overlapping chunks
+
+
+def find_speakers(text: str) -> List[str]:
+    """Return the speaker names of one document's transcript."""
+    speakers = {name for _, name in TIMESTAMPED_TURN.findall(text)}
+    counts = Counter(BARE_TURN.findall(text))
+    bare = {name for name, n in counts.items() if n >= MIN_BARE_TURNS}
+    # "Um Tsavo Knott:" is a filler word glued to a real name, not a new speaker
+    bare = {name for name in bare if not any(name.endswith(" " + other) for other in bare | speakers)}
+    return sorted(speakers | bare)
+
+
+def extract_meeting_date(text: str, file_name: str = "") -> str:
+    """Return the meeting date as YYYY-MM-DD, or '' if none can be found."""
+    m = FILE_NAME_DATE.search(file_name or "")
+    if m:
+        return f"{m.group(1)}-{m.group(2)}-{m.group(3)}"
+    m = NOTES_DATE.search(text or "")
+    if m:
+        month, day, year = m.groups()
+        try:
+            return datetime.strptime(f"{month[:3]} {day} {year}", "%b %d %Y").strftime("%Y-%m-%d")
+        except ValueError:
+            pass
+    return ""
+
+
+def _turn_pattern(speakers: Iterable[str]) -> Optional[re.Pattern]:
+    names = sorted(set(speakers), key=len, reverse=True)  # longest first: "Sam Jones" before "Sam"
+    if not names:
+        return None
+    alternation = "|".join(re.escape(n) for n in names)
+    return re.compile(rf"(?:(\d{{1,2}}:\d{{2}}:\d{{2}})\s+)?\b({alternation}):")
+
+
+def extract_turns(text: str, speakers: Iterable[str]) -> List[Tuple[int, str, str, str]]:
+    """
+    Find speaker turns in `text`.
+
+    Returns (offset, speaker, timestamp, signature) tuples in order; timestamp
+    is '' for turns without an explicit one, and signature is the first few
+    words of the turn, used to match the same turn across overlapping chunks.
+    """
+    pattern = _turn_pattern(speakers)
+    if pattern is None:
+        return []
+    turns = []
+    for m in pattern.finditer(text):
+        words = text[m.end():].split(None, SIGNATURE_WORDS)[:SIGNATURE_WORDS]
+        signature = m.group(2) + ":" + " ".join(words)
+        turns.append((m.start(), m.group(2), m.group(1) or "", signature))
+    return turns
+
+
+def annotate_chunks(chunks: List[str], speakers: Iterable[str] = None) -> List[dict]:
+    """
+    Attribute each chunk of one document to speakers and a timestamp.
+
+    Chunks are expected in document order. The speaker of a chunk is whoever
+    is talking at its first word, which may be a turn that started in an
+    earlier chunk; turns repeated by the chunk overlap are recognised by their
+    signature so the carried-over speaker is not taken from inside the overlap.
+    Returns one dict per chunk with `speaker`, `speakers` and `timestamp`.
+    """
+    if speakers is None:
+        speakers = find_speakers(" ".join(chunks))
+    speakers = list(speakers)
+
+    annotations = []
+    # (speaker, timestamp) at the start of the previous chunk, and its turns
+    prev_lead, prev_turns = (UNKNOWN_SPEAKER, ""), []
+    last_ts = ""
+    for chunk in chunks:
+        turns = extract_turns(chunk, speakers)
+
+        # Who is speaking when this chunk begins?
+        lead = prev_turns[-1][1:3] if prev_turns else prev_lead
+        if turns:
+            signatures = [t[3] for t in prev_turns]
+            if turns[0][3] in signatures:
+                pos = signatures.index(turns[0][3])
+                lead = prev_turns[pos - 1][1:3] if pos > 0 else prev_lead
+        if turns and (turns[0][0] == 0 or lead[0] == UNKNOWN_SPEAKER):
+            lead = turns[0][1:3]
+
+        # Turns without an explicit timestamp inherit the latest one seen
+        resolved = []
+        ts = lead[1] or last_ts
+        for offset, name, stamp, signature in turns:
+            ts = stamp or ts
+            resolved.append((offset, name, ts, signature))
+        if resolved:
+            last_ts = resolved[-1][2]
+
+        lead = (lead[0], lead[1] or (resolved[0][2] if resolved else last_ts))
+        names = [] if lead[0] == UNKNOWN_SPEAKER else [lead[0]]
+        for t in resolved:
+            if t[1] not in names:
+                names.append(t[1])
+        annotations.append({
+            'speaker': lead[0],
+            'speakers': names,
+            'timestamp': lead[1],
+        })
+        prev_lead, prev_turns = lead, resolved
+    return annotations
@@ -2,14 +2,15 @@
 """
 validate_alignment.py
 
-Checks that the number of text chunks matches metadata entries.
+Checks that the number of raw text chunks (load.py) matches the raw metadata
+entries (generate_metadata.py) before dedupe.py collapses them.
 """
 
 import json
 import sys
 
-TEXTS_FILE = "texts.json"
-METADATA_FILE = "metadata.json"
+TEXTS_FILE = "texts.raw.json"
+METADATA_FILE = "metadata.raw.json"
 
 def main():
     with open(TEXTS_FILE, "r", encoding="utf-8") as f1:
@@ -22,7 +23,7 @@ def main():
         print(f"❌ Mismatch: {len(texts)} texts vs {len(metadata)} metadata entries")
         sys.exit(1)
 
-    print(f"✅ texts.json and metadata.json are aligned ({len(texts)} entries)")
+    print(f"✅ {TEXTS_FILE} and {METADATA_FILE} are aligned ({len(texts)} entries)")
 
 if __name__ == "__main__":
     main()